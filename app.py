@@ -1,26 +1,159 @@
-from flask import Flask, render_template, request, jsonify, Response, send_file, make_response
-import pandas as pd
+from flask import Flask, render_template, request, jsonify, Response, send_file, url_for
 import threading
-import queue
 import logging
 import logging.handlers
 import json
 import time
 import os
-from comparador_completo import run_scraper, OUTPUT_FILE
+import sys
+from datetime import date
+# Sólo la configuración: pandas, selenium y el scraper (comparador_completo) se
+# cargan con el primer escaneo o consulta, así el arranque no espera por ellos
+from configuracion import (
+    configurar_logging, OUTPUT_FILE, DATA_DIR, EXPORT_DIR, HISTORIAL_DIR, PROGRAMACION_FILE, HILOS_ENLACES,
+    PERFILES_DIR
+)
+from capacidad import hilos_http
+from ingesta import inspeccionar_planilla, abrir_planilla, cargar_planilla, PlanillaInvalida
+from exportaciones import obtener_exportacion, exportar_en_segundo_plano, ExportacionNoDisponible, FORMATOS
+from historial import HistorialPrecios
+from programador import Programador, calcular_pendientes, SITIOS
+from consulta import ConsultaPrecios
+from lotes import GestorLotes, EntradaInvalida, leer_filas
+from cancelacion import TokenCancelacion, matar_grupos
+from perfilado import ruta_perfil, ARCHIVOS as ARCHIVOS_PERFIL
+from difusion import (
+    Difusor, serializar_log, serializar_producto, HEARTBEAT_LOG, HEARTBEAT_PRODUCTOS,
+    RESYNC_LOG, RESYNC_PRODUCTOS
+)
+
+configurar_logging()
+INICIO = time.time()
 
 app = Flask(__name__)
 
-# Queue for inter-thread communication (logs)
-log_queue = queue.Queue()
+# Límite de tamaño para archivos subidos (Flask responde 413 si se excede)
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "50"))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
+UPLOAD_DIR = os.path.join(DATA_DIR, "uploads")
+
+historial = HistorialPrecios(HISTORIAL_DIR)
+
+# Consulta rápida por EAN (ver consulta.py): se crea con la primera consulta
+consulta = None
+consulta_lock = threading.Lock()
+# Plazo de /api/price por defecto y máximo, en segundos
+PLAZO_CONSULTA = 3
+PLAZO_CONSULTA_MAXIMO = 30
+
+def obtener_consulta():
+    global consulta
+    with consulta_lock:
+        if consulta is None:
+            from comparador_completo import crear_resolvedores
+            consulta = ConsultaPrecios(crear_resolvedores(), historial, hilos=HILOS_ENLACES or hilos_http())
+        return consulta
 
-# Queue for product updates (real-time monitoring)
-product_queue = queue.Queue()
+# Lotes de EANs por API (ver lotes.py): NINI tiene un solo navegador, los VTEX van por HTTP
+lotes = GestorLotes(
+    os.path.join(DATA_DIR, "lotes"),
+    resolver=lambda site, ean, max_edad=3600: obtener_consulta().resolver(site, ean, max_edad),
+    hilos_sitio=lambda site: 1 if site == 'nini' else HILOS_ENLACES or hilos_http()
+)
+
+# Logs y actualizaciones de productos para los monitores conectados (ver difusion.py).
+# Se publican como en una cola; con el servidor ASGI (asgi.py) los streams no ocupan threads
+log_queue = Difusor(serializar_log, max_historial=2000, resincronizar=RESYNC_LOG)
+product_queue = Difusor(serializar_producto, max_historial=20000, resincronizar=RESYNC_PRODUCTOS)
 
 # Thread handling
 scraper_thread = None
 pause_event = threading.Event()
 pause_event.set() # Inicialmente en estado "Ejecutando"
+# Token del escaneo en curso (ver cancelacion.py)
+cancelacion = TokenCancelacion()
+# Segundos que /cancel y /reset esperan a que el escaneo termine
+ESPERA_CANCELACION = 10
+
+def iniciar_scraper(selection, input_df, ignore_cache, usar_cache_negativo, **kwargs):
+    """
+    Limpia las colas, engancha los logs a la consola web y lanza run_scraper en un thread.
+    Los kwargs extra se pasan tal cual a run_scraper.
+    """
+    global scraper_thread, cancelacion
+    from comparador_completo import run_scraper
+    
+    # Clear queues
+    log_queue.reiniciar()
+    product_queue.reiniciar()
+    
+    # Configurar logger para capturar logs en la cola de forma limpia
+    root_logger = logging.getLogger()
+    
+    # Eliminar handlers antiguos de tipo QueueHandler para evitar duplicados
+    for h in root_logger.handlers[:]:
+        if isinstance(h, logging.handlers.QueueHandler):
+            root_logger.removeHandler(h)
+            
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    root_logger.addHandler(queue_handler)
+    root_logger.setLevel(logging.INFO)
+    
+    # Reset pause event
+    pause_event.set()
+    cancelacion = TokenCancelacion()
+    
+    # Start scraper in a separate thread
+    scraper_thread = threading.Thread(
+        target=run_scraper,
+        args=(selection, log_queue, input_df, ignore_cache, pause_event, product_queue, usar_cache_negativo),
+        kwargs={**kwargs, 'cancelacion': cancelacion},
+        name="Escaneo"
+    )
+    # Marcar tiempo de inicio para detectar threads zombies
+    scraper_thread.start_time = time.time()
+    scraper_thread.start()
+
+def lanzar_programado(trabajo):
+    """
+    Callback del programador: lanza un escaneo sólo con los EANs desactualizados
+    del catálogo. Devuelve False si hay otro escaneo en curso.
+    """
+    if scraper_thread and scraper_thread.is_alive():
+        return False
+    
+    df = cargar_planilla(abrir_planilla(trabajo['catalogo']))
+    pendientes = calcular_pendientes(df['SKU'], trabajo['sitios'], historial, trabajo['max_edad_horas'])
+    a_buscar = set().union(*pendientes.values())
+    logging.info(f"⏰ '{trabajo['id']}': {len(a_buscar)} de {len(df)} EANs a actualizar "
+                 f"({', '.join(f'{s}: {len(v)}' for s, v in pendientes.items())})")
+    if not a_buscar:
+        return True
+    
+    selection = {site: site in trabajo['sitios'] for site in SITIOS}
+    input_df = df[df['SKU'].astype(str).str.strip().isin(a_buscar)].reset_index(drop=True)
+    presupuesto = trabajo.get('presupuesto_minutos')
+    iniciar_scraper(selection, input_df, True, True,
+                    pendientes=pendientes,
+                    output_file=os.path.join(DATA_DIR, "programados", f"{trabajo['id']}.xlsx"),
+                    priorizar=trabajo.get('priorizar', True),
+                    presupuesto_segundos=presupuesto * 60 if presupuesto else None)
+    return True
+
+programador = Programador(PROGRAMACION_FILE, os.path.join(DATA_DIR, "programacion_estado.json"), lanzar_programado)
+if os.environ.get("PROGRAMADOR_ACTIVO", "1") == "1":
+    programador.iniciar()
+
+@app.route('/healthz')
+def healthz():
+    """Chequeo de vida barato: responde sin cargar el scraper ni tocar el disco."""
+    return jsonify({
+        'status': 'ok',
+        'uptime_segundos': round(time.time() - INICIO, 1),
+        'scraper_cargado': 'comparador_completo' in sys.modules,
+        'escaneo_activo': bool(scraper_thread and scraper_thread.is_alive()),
+        'monitores': log_queue.conectados + product_queue.conectados,
+    })
 
 @app.route('/')
 def index():
@@ -55,8 +188,14 @@ def start_scraper():
             logging.warning(f"DEBUG: Thread missing start_time attribute! Setting age to 0")
         
         if thread_age > 600:  # 10 minutos
-            logging.warning(f"Thread zombie detectado (edad: {thread_age:.0f}s). Permitiendo override.")
-            # Marcar como None para permitir nuevo thread
+            logging.warning(f"Thread zombie detectado (edad: {thread_age:.0f}s). Cancelándolo antes del override.")
+            # Hasta que termine su finally (resultados, historial, STOP_SIGNAL) no puede arrancar otro:
+            # escribiría los mismos archivos y cerraría los monitores del escaneo nuevo
+            if not cancelar_escaneo("reemplazado por un escaneo nuevo"):
+                return jsonify({
+                    'status': 'error',
+                    'message': 'El escaneo anterior se está cancelando y guardando sus resultados. Reintentá en unos segundos.'
+                }), 409
             scraper_thread = None
         else:
             error_msg = f'El proceso ya está en ejecución. Tiempo transcurrido: {int(thread_age)}s. Si el proceso está colgado, espera unos minutos o reinicia el servidor.'
@@ -75,74 +214,27 @@ def start_scraper():
         'disco': data.get('disco') == 'on'
     }
     ignore_cache = data.get('ignore_cache') == 'on'
+    perfilar = data.get('perfilar') == 'on'
     
     # Handle Individual EAN
     individual_ean = data.get('individual_ean', '').strip()
     
-    # Handle File Upload
+    # Handle File Upload: sólo se valida el encabezado, el parseo lo hace el thread del scraper
     file = request.files.get('file')
     input_df = None
+    planilla = None
     
     if file and file.filename != '':
         try:
-            filename = file.filename.lower()
-            df = None
-            
-            if filename.endswith('.xlsx') or filename.endswith('.xls'):
-                df = pd.read_excel(file, dtype=str)
-            elif filename.endswith('.csv'):
-                # Intentar leer con detección automática, si falla probar comúnes
-                try:
-                    file.seek(0)
-                    df = pd.read_csv(file, sep=None, engine='python', dtype=str)
-                except:
-                    file.seek(0)
-                    try:
-                        df = pd.read_csv(file, sep=';', dtype=str)
-                    except:
-                        file.seek(0)
-                        df = pd.read_csv(file, sep=',', dtype=str)
-            else:
-                return jsonify({'status': 'error', 'message': 'Formato de archivo no soportado. Use CSV o Excel.'}), 400
-
-            if df is None:
-                 return jsonify({'status': 'error', 'message': 'No se pudo leer el archivo.'}), 400
-
-            # Normalize columns helper
-            import unicodedata
-            def normalize(text):
-                if not isinstance(text, str): return str(text)
-                return "".join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c)).lower().strip()
-
-            # Create a map of normalized -> original
-            valid_cols_map = {normalize(c): c for c in df.columns}
-            
-            required_cols = ['codigo', 'ean', 'descripcion']
-            missing = [req for req in required_cols if req not in valid_cols_map]
-
-            if missing:
-                 found_cols = ", ".join(df.columns.tolist())
-                 return jsonify({'status': 'error', 'message': f'Faltan columnas: {", ".join(missing)}. Columnas encontradas: {found_cols}'}), 400
-            
-            # Get the original column names for all required columns
-            col_codigo = valid_cols_map['codigo']
-            col_ean = valid_cols_map['ean']
-            col_descripcion = valid_cols_map['descripcion']
-            
-            # Create a clean DataFrame with standardized column names
-            # This ensures consistency with individual EAN search behavior
-            input_df = pd.DataFrame({
-                'codigo': df[col_codigo],
-                'ean': df[col_ean],
-                'descripcion': df[col_descripcion],
-                'SKU': df[col_ean]  # SKU is set from EAN
-            })
-            
+            planilla = inspeccionar_planilla(file, UPLOAD_DIR)
+        except PlanillaInvalida as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
         except Exception as e:
             return jsonify({'status': 'error', 'message': f'Error al leer el archivo: {str(e)}'}), 400
     
     # Priority to individual EAN
     if individual_ean:
+        import pandas as pd
         input_df = pd.DataFrame([{
             'codigo': '9999',
             'ean': individual_ean,
@@ -151,113 +243,215 @@ def start_scraper():
         }])
         ignore_cache = True
         logging.info(f"Procesando búsqueda individual para EAN: {individual_ean}")
-
-    # Clear queues
-    with log_queue.mutex:
-        log_queue.queue.clear()
-    with product_queue.mutex:
-        product_queue.queue.clear()
+        if planilla is not None:
+            planilla.eliminar()
+            planilla = None
 
     # If a file is uploaded, implicitly we should probably ignore cache 
     # unless logic dictates otherwise, but to be safe and avoid "stale data" confusion:
-    if input_df is not None:
+    if input_df is not None or planilla is not None:
          ignore_cache = True
     
-    # Configurar logger para capturar logs en la cola de forma limpia
-    root_logger = logging.getLogger()
-    
-    # Eliminar handlers antiguos de tipo QueueHandler para evitar duplicados
-    for h in root_logger.handlers[:]:
-        if isinstance(h, logging.handlers.QueueHandler):
-            root_logger.removeHandler(h)
-            
-    queue_handler = logging.handlers.QueueHandler(log_queue)
-    root_logger.addHandler(queue_handler)
-    root_logger.setLevel(logging.INFO)
-    
-    # Reset pause event
-    pause_event.set()
+    # La búsqueda individual siempre consulta los sitios, aunque el EAN figure en el caché negativo
+    usar_cache_negativo = not individual_ean
     
-    # Start scraper in a separate thread
-    scraper_thread = threading.Thread(
-        target=run_scraper,
-        args=(selection, log_queue, input_df, ignore_cache, pause_event, product_queue)
-    )
-    # Marcar tiempo de inicio para detectar threads zombies
-    import time as time_module
-    scraper_thread.start_time = time_module.time()
-    scraper_thread.start()
+    iniciar_scraper(selection, input_df, ignore_cache, usar_cache_negativo, planilla=planilla, perfilar=perfilar)
 
     return jsonify({'status': 'success', 'message': 'Escaneo iniciado'})
 
+@app.errorhandler(413)
+def archivo_demasiado_grande(e):
+    return jsonify({'status': 'error', 'message': f'El archivo supera el máximo permitido de {MAX_UPLOAD_MB} MB.'}), 413
+
+def ultimo_evento_recibido():
+    """Id del último evento que tiene el monitor (?desde=, o Last-Event-ID al reconectar)."""
+    valor = request.args.get('desde') or request.headers.get('Last-Event-ID') or "0"
+    return int(valor) if valor.isdigit() else 0
+
+# Con el servidor ASGI (asgi.py) estas dos rutas se atienden en el event loop
+# sin pasar por Flask; éstas son las del servidor de desarrollo (python app.py)
 @app.route('/stream_logs')
 def stream_logs():
-    def generate():
-        while True:
-            try:
-                # Wait for log message, timeout allows checking connection status
-                record = log_queue.get(timeout=1)
-                
-                if record == "STOP_SIGNAL":
-                     # Enviar señal de fin limpia
-                     yield f"data: {json.dumps({'message': 'STOP_SIGNAL', 'level': 'INFO'})}\n\n"
-                     break
-
-                # Format log record
-                if isinstance(record, logging.LogRecord):
-                    msg = record.getMessage()
-                    level = record.levelname
-                else:
-                    msg = str(record)
-                    level = "INFO"
-                
-                yield f"data: {json.dumps({'message': msg, 'level': level})}\n\n"
-            
-            except queue.Empty:
-                # Send heartbeat
-                yield f"data: {json.dumps({'heartbeat': True})}\n\n"
-                continue
-            except Exception as e:
-                # In case of broken pipe or other errors
-                break
-    
-    return Response(generate(), mimetype='text/event-stream')
+    return Response(log_queue.transmitir(ultimo_evento_recibido(), HEARTBEAT_LOG),
+                    mimetype='text/event-stream')
 
 @app.route('/stream_products')
 def stream_products():
     """Stream product updates in real-time for monitoring tab"""
-    def generate():
-        while True:
-            try:
-                # Wait for product update
-                product_data = product_queue.get(timeout=1)
-                
-                if product_data == "STOP_SIGNAL":
-                    yield f"data: {json.dumps({'type': 'stop'})}\n\n"
-                    break
-                
-                # Send product update
-                yield f"data: {json.dumps(product_data)}\n\n"
-            
-            except queue.Empty:
-                # Send heartbeat
-                yield f"data: {json.dumps({'type': 'heartbeat'})}\n\n"
-                continue
-            except Exception as e:
-                break
-    
-    return Response(generate(), mimetype='text/event-stream')
+    return Response(product_queue.transmitir(ultimo_evento_recibido(), HEARTBEAT_PRODUCTOS),
+                    mimetype='text/event-stream')
 
 @app.route('/download')
 def download_file():
-    if os.path.exists(OUTPUT_FILE):
-        # Usar send_file pero asegurar que no se cachee
-        response = make_response(send_file(OUTPUT_FILE, as_attachment=True))
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
+    """
+    Descarga del último resultado en xlsx (por defecto), csv o parquet.
+    Los archivos se sirven con ETag = hash del contenido y soporte de Range,
+    así una descarga repetida de un resultado sin cambios responde 304.
+    """
+    formato = request.args.get('formato', 'xlsx').lower()
+    try:
+        exportacion = obtener_exportacion(EXPORT_DIR, formato)
+    except ExportacionNoDisponible as e:
+        return str(e), 404
+    if exportacion is None:
+        if not os.path.exists(OUTPUT_FILE):
+            return "Archivo no encontrado", 404
+        # Resultado sin exportaciones publicadas (p.ej. anterior al deploy): se generan
+        # una vez en segundo plano, nunca en el request
+        exportar_en_segundo_plano(EXPORT_DIR, OUTPUT_FILE)
+        if formato == 'xlsx':
+            response = send_file(OUTPUT_FILE, mimetype=FORMATOS['xlsx'], as_attachment=True,
+                                 download_name="precios_resultados.xlsx", max_age=0)
+            response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+            return response
+        response = Response("Generando la exportación del último resultado. Reintentá en unos segundos.", 202)
+        response.headers["Retry-After"] = "5"
         return response
-    return "Archivo no encontrado", 404
+
+    ruta, contenido_hash = exportacion
+    response = send_file(
+        ruta,
+        mimetype=FORMATOS[formato],
+        as_attachment=True,
+        download_name=f"precios_resultados.{formato}",
+        etag=f"{contenido_hash}-{formato}",
+        conditional=True,
+        max_age=0
+    )
+    # Revalidar siempre contra el ETag en lugar de no cachear
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route('/perfil/<tipo>')
+def descargar_perfil(tipo):
+    """
+    Perfil de un escaneo lanzado con "Perfilar escaneo": flamegraph (SVG),
+    folded (para speedscope o flamegraph.pl) o traza (chrome://tracing, Perfetto).
+    Por defecto el del último escaneo perfilado; ?trabajo=<id> para otro.
+    """
+    if tipo not in ARCHIVOS_PERFIL:
+        return f"Tipo de perfil desconocido: {tipo}", 400
+    trabajo_id = request.args.get('trabajo')
+    ruta = ruta_perfil(PERFILES_DIR, tipo, trabajo_id)
+    if ruta is None:
+        return "No hay perfil para ese escaneo", 404
+    nombre, mimetype = ARCHIVOS_PERFIL[tipo]
+    trabajo_id = trabajo_id or os.path.basename(os.path.dirname(ruta))
+    return send_file(ruta, mimetype=mimetype, as_attachment=True,
+                     download_name=f"{trabajo_id}-{nombre}", max_age=0)
+
+@app.route('/historial/cambios')
+def historial_cambios():
+    """Cambios de precio/oferta desde ?desde=YYYY-MM-DD (opcional: ?sitio=vea&sitio=disco)"""
+    try:
+        desde = date.fromisoformat(request.args.get('desde', ''))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Parámetro desde inválido. Use YYYY-MM-DD.'}), 400
+    sitios = request.args.getlist('sitio') or None
+    cambios = historial.cambios_desde(desde, sitios=sitios)
+    return jsonify({'status': 'success', 'desde': desde.isoformat(), 'cambios': cambios})
+
+@app.route('/historial/<ean>')
+def historial_ean(ean):
+    """Historial de un EAN en todos los sitios (opcional: ?sitio=vea)"""
+    sitios = request.args.getlist('sitio') or None
+    observaciones = historial.historial_ean(ean, sitios=sitios)
+    return jsonify({'status': 'success', 'ean': ean, 'observaciones': observaciones})
+
+@app.route('/api/price/<ean>')
+def api_precio(ean):
+    """
+    Precio de un EAN en todos los sitios (opcional: ?sitio=vea&sitio=nini), sin tocar
+    el archivo de resultados.
+    ?plazo=segundos de espera (por defecto 3); ?max_edad=minutos de validez de un
+    valor cacheado (por defecto 60, 0 = siempre en vivo). Los sitios que no
+    respondieron en el plazo vuelven en 'pendientes' y su resultado queda en
+    caché para la próxima consulta.
+    """
+    ean = ean.strip()
+    if not ean.isdigit() or len(ean) > 19:
+        return jsonify({'status': 'error', 'message': 'EAN inválido'}), 400
+    try:
+        plazo = min(max(float(request.args.get('plazo', PLAZO_CONSULTA)), 0.1), PLAZO_CONSULTA_MAXIMO)
+        max_edad = max(float(request.args.get('max_edad', 60)), 0) * 60
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'plazo y max_edad deben ser números'}), 400
+    sitios = request.args.getlist('sitio') or None
+    if sitios and any(s not in SITIOS for s in sitios):
+        return jsonify({'status': 'error', 'message': f'Sitios válidos: {", ".join(SITIOS)}'}), 400
+    
+    respuesta = obtener_consulta().consultar(ean, sitios, plazo, max_edad)
+    return jsonify({'status': 'success', 'completo': not respuesta['pendientes'], **respuesta})
+
+@app.route('/api/jobs', methods=['POST'])
+def api_crear_lote():
+    """
+    Lote de EANs en el cuerpo: NDJSON (una línea por EAN, {"ean": ..., "codigo": ...,
+    "descripcion": ...} o el EAN solo) o CSV con encabezado (Content-Type: text/csv).
+    Las búsquedas empiezan mientras se lee el cuerpo; los resultados se leen de
+    GET /api/jobs/<id>/results. Opcional: ?sitio=vea&sitio=nini, ?id=<id propio>
+    para abrir el stream de resultados antes de terminar la subida.
+    """
+    sitios = request.args.getlist('sitio') or list(SITIOS)
+    if any(s not in SITIOS for s in sitios):
+        return jsonify({'status': 'error', 'message': f'Sitios válidos: {", ".join(SITIOS)}'}), 400
+    lote_id = request.args.get('id') or None
+    if lote_id is not None and (not lote_id.replace('-', '').isalnum() or len(lote_id) > 64):
+        return jsonify({'status': 'error', 'message': 'id inválido (letras, números y guiones)'}), 400
+    formato = 'csv' if request.mimetype in ('text/csv', 'application/csv') else 'ndjson'
+    
+    try:
+        lote = lotes.crear(sitios, lote_id)
+    except EntradaInvalida as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 409
+    logging.info(f"📦 Lote {lote.id} recibiendo ({formato}) para {sitios}")
+    try:
+        for fila in leer_filas(request.stream, formato):
+            lote.agregar(fila)
+    except EntradaInvalida as e:
+        return jsonify({'status': 'error', 'message': str(e), **lote.info()}), 400
+    finally:
+        lote.cerrar_entrada()
+    return jsonify({
+        'status': 'success',
+        **lote.info(),
+        'url_resultados': url_for('api_resultados_lote', lote_id=lote.id)
+    }), 202
+
+@app.route('/api/jobs/<lote_id>')
+def api_estado_lote(lote_id):
+    lote = lotes.obtener(lote_id)
+    if lote is None:
+        return jsonify({'status': 'error', 'message': 'Lote inexistente'}), 404
+    return jsonify({'status': 'success', **lote.info()})
+
+@app.route('/api/jobs/<lote_id>/results')
+def api_resultados_lote(lote_id):
+    """
+    Resultados del lote en NDJSON, en orden de llegada, desde ?desde=<offset> (por
+    defecto 0). Transmite hasta que el lote termina y cierra con {"tipo": "fin"};
+    mientras no hay novedades envía {"tipo": "latido"}.
+    """
+    lote = lotes.obtener(lote_id)
+    if lote is None:
+        return jsonify({'status': 'error', 'message': 'Lote inexistente'}), 404
+    try:
+        desde = int(request.args.get('desde', 0))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'desde debe ser un número'}), 400
+    response = Response(lote.leer(desde), mimetype='application/x-ndjson')
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/programacion')
+def programacion():
+    """Trabajos programados y el estado de su última ejecución"""
+    estado = programador.estado()
+    trabajos = [
+        {**{k: v for k, v in t.items() if not k.startswith('_')}, 'estado': estado.get(t['id'], {})}
+        for t in programador.trabajos()
+    ]
+    return jsonify({'status': 'success', 'trabajos': trabajos})
 
 @app.route('/pause', methods=['POST'])
 def pause_scraper():
@@ -269,30 +463,64 @@ def continue_scraper():
     pause_event.set()
     return jsonify({'status': 'success', 'message': 'Scraper reanudado'})
 
+def cancelar_escaneo(motivo):
+    """Cancela el escaneo en curso y espera a que termine. Devuelve True si terminó."""
+    cancelacion.cancelar(motivo)
+    # Despertar a los threads pausados para que vean la cancelación
+    pause_event.set()
+    hilo = scraper_thread
+    if hilo is None:
+        return True
+    hilo.join(ESPERA_CANCELACION)
+    return not hilo.is_alive()
+
+@app.route('/cancel', methods=['POST'])
+def cancel_scraper():
+    """Cancela el escaneo: cierra los navegadores y guarda lo encontrado hasta ahora."""
+    if not (scraper_thread and scraper_thread.is_alive()):
+        return jsonify({'status': 'error', 'message': 'No hay un escaneo en curso'}), 409
+    inicio = time.time()
+    terminado = cancelar_escaneo("cancelado por el usuario")
+    if not terminado:
+        return jsonify({'status': 'success', 'message': 'Cancelación en curso: guardando resultados parciales'}), 202
+    return jsonify({'status': 'success', 'message': f'Escaneo cancelado en {time.time() - inicio:.1f}s'})
+
 @app.route('/reset', methods=['POST'])
 def reset_scraper():
     """Endpoint para forzar reset del scraper en caso de thread zombie"""
     global scraper_thread
     
     try:
-        # Intentar limpiar procesos chrome
-        import subprocess
-        try:
-            subprocess.run(['taskkill', '/F', '/IM', 'chrome.exe', '/T'], 
-                          capture_output=True, timeout=5)
-            subprocess.run(['taskkill', '/F', '/IM', 'chromedriver.exe', '/T'], 
-                          capture_output=True, timeout=5)
-        except:
-            pass
+        terminado = cancelar_escaneo("reseteado")
+        # Los navegadores que hayan quedado (p.ej. Chrome huérfanos de un chromedriver muerto)
+        if os.name == 'nt':
+            import subprocess
+            try:
+                subprocess.run(['taskkill', '/F', '/IM', 'chrome.exe', '/T'], 
+                              capture_output=True, timeout=5)
+                subprocess.run(['taskkill', '/F', '/IM', 'chromedriver.exe', '/T'], 
+                              capture_output=True, timeout=5)
+            except:
+                pass
+        else:
+            muertos = matar_grupos()
+            if muertos:
+                logging.info(f"🔄 {muertos} navegadores colgados terminados")
+        
+        if not terminado and scraper_thread is not None and scraper_thread.is_alive():
+            # Sigue en su finally: soltarlo dejaría que /start lance otro escaneo en paralelo
+            logging.warning("🔄 Reset pedido pero el escaneo anterior todavía se está cerrando")
+            return jsonify({
+                'status': 'success',
+                'message': 'El escaneo anterior se está cancelando y guardando sus resultados. Reintentá en unos segundos.'
+            }), 202
         
         # Resetear el thread
         scraper_thread = None
         
         # Limpiar colas
-        with log_queue.mutex:
-            log_queue.queue.clear()
-        with product_queue.mutex:
-            product_queue.queue.clear()
+        log_queue.reiniciar()
+        product_queue.reiniciar()
         
         logging.info("🔄 Sistema reseteado manualmente")
         return jsonify({'status': 'success', 'message': 'Sistema reseteado. Puedes iniciar un nuevo escaneo.'})
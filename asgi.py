@@ -0,0 +1,163 @@
+"""
+Servidor ASGI de la app web.
+
+/stream_logs y /stream_products se atienden en el event loop: cada monitor
+conectado es una suscripción al Difusor (ver difusion.py) y no ocupa ningún
+thread mientras espera eventos, así un contenedor aguanta cientos de pestañas
+abiertas. Lo mismo el stream de resultados de un lote, /api/jobs/<id>/results
+(ver Lote.leer_async en lotes.py). El resto de las rutas las atiende Flask
+(app.py) en un pool de HILOS_WSGI threads, que ya no se agota con los streams.
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT --timeout-graceful-shutdown 10
+"""
+import re
+import json
+import asyncio
+import logging
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+
+from configuracion import HILOS_WSGI
+from difusion import evento_sse, INTERVALO_HEARTBEAT, HEARTBEAT_LOG, HEARTBEAT_PRODUCTOS
+import app as web
+
+flask_asgi = WSGIMiddleware(web.app, workers=HILOS_WSGI)
+
+STREAMS = {
+    '/stream_logs': (web.log_queue, HEARTBEAT_LOG),
+    '/stream_products': (web.product_queue, HEARTBEAT_PRODUCTOS),
+}
+
+RUTA_RESULTADOS_LOTE = re.compile(r"^/api/jobs/([^/]+)/results$")
+
+ENCABEZADOS_SSE = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    # Que el proxy de la plataforma no junte los eventos en su buffer
+    (b'x-accel-buffering', b'no'),
+]
+
+
+ENCABEZADOS_NDJSON = [
+    (b'content-type', b'application/x-ndjson'),
+    (b'x-accel-buffering', b'no'),
+]
+
+
+def _parametro(scope, nombre):
+    return parse_qs(scope.get('query_string', b'').decode('latin-1')).get(nombre, [''])[0]
+
+
+def _ultimo_evento(scope):
+    """Id del último evento que tiene el monitor (?desde=, o Last-Event-ID al reconectar)."""
+    desde = _parametro(scope, 'desde')
+    if not desde:
+        desde = dict(scope.get('headers', [])).get(b'last-event-id', b'').decode('latin-1')
+    return int(desde) if desde.isdigit() else 0
+
+
+async def _esperar_desconexion(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def transmitir(difusor, heartbeat, scope, receive, send):
+    """Envía los eventos del difusor como text/event-stream hasta el fin del escaneo o la desconexión."""
+    suscripcion = difusor.suscribir(_ultimo_evento(scope), asyncio.get_running_loop())
+    desconexion = asyncio.ensure_future(_esperar_desconexion(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': ENCABEZADOS_SSE})
+        while not suscripcion.desconectado:
+            siguiente = asyncio.ensure_future(suscripcion.cola.get())
+            listos, _ = await asyncio.wait({siguiente, desconexion}, timeout=INTERVALO_HEARTBEAT,
+                                           return_when=asyncio.FIRST_COMPLETED)
+            if siguiente not in listos:
+                siguiente.cancel()
+                if desconexion in listos:
+                    return
+                texto, final = evento_sse(None, heartbeat), False
+            else:
+                id_evento, datos, final = siguiente.result()
+                texto = evento_sse(id_evento, datos)
+            await send({'type': 'http.response.body', 'body': texto.encode('utf-8'), 'more_body': not final})
+            if final:
+                return
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    except OSError:
+        # El cliente se fue mientras se enviaba
+        pass
+    finally:
+        desconexion.cancel()
+        difusor.desuscribir(suscripcion)
+
+
+async def _responder_json(send, status, datos):
+    cuerpo = json.dumps(datos).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': cuerpo})
+
+
+async def resultados_lote(lote_id, scope, receive, send):
+    """GET /api/jobs/<id>/results (ver api_resultados_lote en app.py) sin ocupar un thread de Flask."""
+    # Un lote terminado de un proceso anterior se lee del disco: fuera del event loop
+    lote = await asyncio.to_thread(web.lotes.obtener, lote_id)
+    if lote is None:
+        await _responder_json(send, 404, {'status': 'error', 'message': 'Lote inexistente'})
+        return
+    desde = _parametro(scope, 'desde') or "0"
+    try:
+        desde = int(desde)
+    except ValueError:
+        await _responder_json(send, 400, {'status': 'error', 'message': 'desde debe ser un número'})
+        return
+
+    desconexion = asyncio.ensure_future(_esperar_desconexion(receive))
+    lineas = lote.leer_async(desde)
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': ENCABEZADOS_NDJSON})
+        async for bloque in lineas:
+            if desconexion.done():
+                return
+            await send({'type': 'http.response.body', 'body': bloque, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    except OSError:
+        # El cliente se fue mientras se enviaba
+        pass
+    finally:
+        desconexion.cancel()
+        await lineas.aclose()
+
+
+async def _ciclo_de_vida(receive, send):
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensaje['type'] == 'lifespan.shutdown':
+            # Que el escaneo en curso no deje navegadores huérfanos
+            if web.scraper_thread is not None and web.scraper_thread.is_alive():
+                web.cancelacion.cancelar("detenido por el cierre del servidor")
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _ciclo_de_vida(receive, send)
+    elif scope['type'] == 'http' and scope['path'] in STREAMS and scope['method'] == 'GET':
+        difusor, heartbeat = STREAMS[scope['path']]
+        await transmitir(difusor, heartbeat, scope, receive, send)
+    elif scope['type'] == 'http' and scope['method'] == 'GET' and RUTA_RESULTADOS_LOTE.match(scope['path']):
+        lote_id = RUTA_RESULTADOS_LOTE.match(scope['path']).group(1)
+        await resultados_lote(lote_id, scope, receive, send)
+    else:
+        await flask_asgi(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import os
+    import uvicorn
+    logging.info("🚀 Iniciando servidor ASGI")
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get("PORT", "5000")), timeout_graceful_shutdown=10)
@@ -0,0 +1,407 @@
+"""
+Cola de tareas (sitio, EAN) entre el coordinador y los workers de scraping.
+
+Con BROKER_URL configurado, run_scraper deja de abrir navegadores: publica las
+búsquedas pendientes de cada sitio y espera los resultados, que escriben los
+procesos de trabajador.py (en el mismo contenedor o en otros). Para escalar
+se agregan workers; el front-end de Flask no cambia.
+
+Cada tarea se entrega con un "lease": el worker la tiene reservada durante
+`visibilidad` segundos y debe renovarla con latidos mientras busca. Si el
+worker muere, el lease vence y la tarea vuelve a la cola. Una tarea que agota
+MAX_INTENTOS entregas se da por terminada con resultado "Error".
+
+Backends:
+    sqlite:////app/data/broker.db   (por defecto; workers en el mismo host o volumen)
+    redis://host:6379/0             (requiere el paquete redis; workers en otros nodos)
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+VISIBILIDAD = 120
+MAX_INTENTOS = 3
+
+RESULTADO_AGOTADO = {'precio': 'Error', 'oferta': '', 'dinamica': ''}
+
+
+def crear_broker(url):
+    """Broker según la URL: 'sqlite:///ruta', 'redis://...' o una ruta a un archivo SQLite."""
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        return BrokerRedis(url)
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    return BrokerSQLite(url)
+
+
+class Latido:
+    """
+    Renueva el lease de una tarea en un thread mientras dura el bloque with.
+
+        with Latido(broker, tarea['id'], nombre):
+            resultado = buscar(...)
+    """
+
+    def __init__(self, broker, tarea_id, trabajador, visibilidad=VISIBILIDAD):
+        self.broker = broker
+        self.tarea_id = tarea_id
+        self.trabajador = trabajador
+        self.visibilidad = visibilidad
+        self.vigente = True
+        self._fin = threading.Event()
+        self._thread = None
+
+    def _loop(self):
+        while not self._fin.wait(self.visibilidad / 3):
+            try:
+                if not self.broker.latido(self.tarea_id, self.trabajador, self.visibilidad):
+                    logging.warning(f"📮 Lease de la tarea {self.tarea_id} perdido")
+                    self.vigente = False
+                    return
+            except Exception as e:
+                logging.warning(f"📮 Error renovando lease de la tarea {self.tarea_id}: {e}")
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._loop, name=f"Latido-{self.tarea_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._fin.set()
+        self._thread.join()
+        return False
+
+
+# =====================================================
+# SQLITE
+# =====================================================
+
+class BrokerSQLite:
+    """
+    Broker sobre un archivo SQLite en modo WAL. Las reservas se hacen dentro de
+    transacciones BEGIN IMMEDIATE, así que varios procesos pueden tomar tareas
+    del mismo archivo sin entregarse la misma dos veces.
+    """
+
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS tareas (
+            id INTEGER PRIMARY KEY,
+            trabajo TEXT NOT NULL,
+            site TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            sku TEXT NOT NULL,
+            trabajador TEXT,
+            vence REAL,
+            intentos INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS tareas_trabajo ON tareas (trabajo, site);
+        CREATE TABLE IF NOT EXISTS resultados (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            trabajo TEXT NOT NULL,
+            site TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            sku TEXT NOT NULL,
+            resultado TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS resultados_trabajo ON resultados (trabajo, site, seq);
+        CREATE TABLE IF NOT EXISTS trabajos (trabajo TEXT PRIMARY KEY, pausado INTEGER NOT NULL DEFAULT 0);
+        CREATE TABLE IF NOT EXISTS trabajadores (nombre TEXT PRIMARY KEY, visto REAL NOT NULL);
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        directorio = os.path.dirname(os.path.abspath(ruta))
+        os.makedirs(directorio, exist_ok=True)
+        self._local = threading.local()
+        self._conexion().executescript(self.ESQUEMA)
+
+    def _conexion(self):
+        # sqlite3 no comparte conexiones entre threads: una por thread
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    class _Transaccion:
+        def __init__(self, db):
+            self.db = db
+
+        def __enter__(self):
+            self.db.execute("BEGIN IMMEDIATE")
+            return self.db
+
+        def __exit__(self, tipo, *exc):
+            self.db.execute("ROLLBACK" if tipo else "COMMIT")
+            return False
+
+    def _transaccion(self):
+        return self._Transaccion(self._conexion())
+
+    def publicar(self, trabajo, site, tareas):
+        """Encola [(idx, sku), ...] en orden de prioridad. Devuelve la cantidad encolada."""
+        filas = [(trabajo, site, int(idx), str(sku)) for idx, sku in tareas]
+        with self._transaccion() as db:
+            db.execute("INSERT OR IGNORE INTO trabajos (trabajo) VALUES (?)", (trabajo,))
+            db.executemany("INSERT INTO tareas (trabajo, site, idx, sku) VALUES (?, ?, ?, ?)", filas)
+        return len(filas)
+
+    def _agotar_vencidas(self, db, ahora):
+        vencidas = db.execute(
+            "DELETE FROM tareas WHERE vence < ? AND intentos >= ? RETURNING trabajo, site, idx, sku",
+            (ahora, MAX_INTENTOS)
+        ).fetchall()
+        for trabajo, site, idx, sku in vencidas:
+            logging.warning(f"📮 [{site.upper()}] {sku} agotó {MAX_INTENTOS} entregas: se marca como Error")
+            db.execute("INSERT INTO resultados (trabajo, site, idx, sku, resultado) VALUES (?, ?, ?, ?, ?)",
+                       (trabajo, site, idx, sku, json.dumps(RESULTADO_AGOTADO)))
+
+    def tomar(self, trabajador, sitios=None, visibilidad=VISIBILIDAD):
+        """
+        Reserva la próxima tarea disponible (nueva o con lease vencido).
+
+        Returns:
+            Dict {'id', 'trabajo', 'site', 'idx', 'sku', 'intentos'} o None si no hay.
+        """
+        ahora = time.time()
+        filtro_sitios = ""
+        parametros = [ahora]
+        if sitios:
+            filtro_sitios = f"AND t.site IN ({','.join('?' * len(sitios))})"
+            parametros.extend(sitios)
+        with self._transaccion() as db:
+            self._agotar_vencidas(db, ahora)
+            fila = db.execute(f"""
+                UPDATE tareas SET trabajador = ?, vence = ?, intentos = intentos + 1
+                WHERE id = (
+                    SELECT t.id FROM tareas t JOIN trabajos j ON j.trabajo = t.trabajo
+                    WHERE (t.vence IS NULL OR t.vence < ?) AND j.pausado = 0 {filtro_sitios}
+                    ORDER BY t.id LIMIT 1
+                )
+                RETURNING id, trabajo, site, idx, sku, intentos
+            """, [trabajador, ahora + visibilidad] + parametros).fetchone()
+        if fila is None:
+            return None
+        return dict(zip(('id', 'trabajo', 'site', 'idx', 'sku', 'intentos'), fila))
+
+    def latido(self, tarea_id, trabajador, visibilidad=VISIBILIDAD):
+        """Extiende el lease. Devuelve False si la tarea ya no es de este worker."""
+        with self._transaccion() as db:
+            cursor = db.execute("UPDATE tareas SET vence = ? WHERE id = ? AND trabajador = ?",
+                                (time.time() + visibilidad, tarea_id, trabajador))
+        return cursor.rowcount == 1
+
+    def liberar(self, tarea_id, trabajador):
+        """Devuelve la tarea a la cola sin contarla como intento (p.ej. no se pudo abrir el navegador)."""
+        with self._transaccion() as db:
+            db.execute("UPDATE tareas SET trabajador = NULL, vence = NULL, intentos = intentos - 1 "
+                       "WHERE id = ? AND trabajador = ?", (tarea_id, trabajador))
+
+    def completar(self, tarea_id, trabajador, resultado):
+        """Registra el resultado. Devuelve False si el lease se había perdido."""
+        with self._transaccion() as db:
+            fila = db.execute("DELETE FROM tareas WHERE id = ? AND trabajador = ? RETURNING trabajo, site, idx, sku",
+                              (tarea_id, trabajador)).fetchone()
+            if fila is None:
+                return False
+            db.execute("INSERT INTO resultados (trabajo, site, idx, sku, resultado) VALUES (?, ?, ?, ?, ?)",
+                       fila + (json.dumps(resultado),))
+        return True
+
+    def resultados(self, trabajo, site, desde=0):
+        """Resultados nuevos de un sitio: ([(idx, sku, resultado), ...], cursor para la próxima llamada)."""
+        filas = self._conexion().execute(
+            "SELECT seq, idx, sku, resultado FROM resultados WHERE trabajo = ? AND site = ? AND seq > ? ORDER BY seq",
+            (trabajo, site, desde)
+        ).fetchall()
+        if not filas:
+            return [], desde
+        return [(idx, sku, json.loads(r)) for _, idx, sku, r in filas], filas[-1][0]
+
+    def pendientes(self, trabajo, site):
+        return self._conexion().execute("SELECT COUNT(*) FROM tareas WHERE trabajo = ? AND site = ?",
+                                        (trabajo, site)).fetchone()[0]
+
+    def pausar(self, trabajo, pausado=True):
+        with self._transaccion() as db:
+            db.execute("UPDATE trabajos SET pausado = ? WHERE trabajo = ?", (int(pausado), trabajo))
+
+    def cancelar(self, trabajo, site):
+        """Descarta las tareas de un sitio que nadie tomó todavía."""
+        with self._transaccion() as db:
+            db.execute("DELETE FROM tareas WHERE trabajo = ? AND site = ?", (trabajo, site))
+
+    def finalizar(self, trabajo):
+        """Borra todo lo del trabajo (tareas sobrantes y resultados ya consolidados)."""
+        with self._transaccion() as db:
+            for tabla in ("tareas", "resultados", "trabajos"):
+                db.execute(f"DELETE FROM {tabla} WHERE trabajo = ?", (trabajo,))
+
+    def latido_trabajador(self, nombre):
+        with self._transaccion() as db:
+            db.execute("INSERT OR REPLACE INTO trabajadores (nombre, visto) VALUES (?, ?)", (nombre, time.time()))
+
+    def trabajadores_activos(self, ventana=60):
+        filas = self._conexion().execute("SELECT nombre FROM trabajadores WHERE visto > ?",
+                                         (time.time() - ventana,)).fetchall()
+        return [f[0] for f in filas]
+
+
+# =====================================================
+# REDIS
+# =====================================================
+
+class BrokerRedis:
+    """
+    Broker sobre Redis (o un servidor compatible). Una lista por sitio con los ids
+    en orden, un hash por tarea y un sorted set con los leases por vencimiento.
+    """
+
+    PREFIJO = "comparador:"
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("BROKER_URL redis:// requiere el paquete redis instalado")
+        self.r = redis.Redis.from_url(url, decode_responses=True)
+
+    def _k(self, *partes):
+        return self.PREFIJO + ":".join(partes)
+
+    def publicar(self, trabajo, site, tareas):
+        tareas = list(tareas)
+        if not tareas:
+            return 0
+        ultimo = self.r.incrby(self._k("seq"), len(tareas))
+        pipe = self.r.pipeline()
+        pipe.set(self._k("trabajo", trabajo), 1)
+        for n, (idx, sku) in enumerate(tareas):
+            tarea_id = str(ultimo - len(tareas) + n + 1)
+            pipe.hset(self._k("tarea", tarea_id), mapping={
+                'trabajo': trabajo, 'site': site, 'idx': int(idx), 'sku': str(sku), 'intentos': 0
+            })
+            pipe.rpush(self._k("cola", site), tarea_id)
+        pipe.incrby(self._k("pendientes", trabajo, site), len(tareas))
+        pipe.execute()
+        return len(tareas)
+
+    def _terminar(self, tarea_id, tarea, resultado=None):
+        """Saca la tarea del sistema; con resultado, lo publica para el coordinador."""
+        pipe = self.r.pipeline()
+        if resultado is not None:
+            pipe.rpush(self._k("resultados", tarea['trabajo'], tarea['site']),
+                       json.dumps([int(tarea['idx']), tarea['sku'], resultado]))
+        pipe.decr(self._k("pendientes", tarea['trabajo'], tarea['site']))
+        pipe.delete(self._k("tarea", tarea_id))
+        pipe.execute()
+
+    def _recuperar_vencidas(self, ahora):
+        for tarea_id in self.r.zrangebyscore(self._k("leases"), "-inf", ahora):
+            # Sólo quien logra sacarla del sorted set la devuelve a la cola
+            if not self.r.zrem(self._k("leases"), tarea_id):
+                continue
+            tarea = self.r.hgetall(self._k("tarea", tarea_id))
+            if not tarea:
+                continue
+            if int(tarea['intentos']) >= MAX_INTENTOS:
+                logging.warning(f"📮 [{tarea['site'].upper()}] {tarea['sku']} agotó {MAX_INTENTOS} entregas: se marca como Error")
+                self._terminar(tarea_id, tarea, RESULTADO_AGOTADO)
+            else:
+                self.r.lpush(self._k("cola", tarea['site']), tarea_id)
+
+    def tomar(self, trabajador, sitios=None, visibilidad=VISIBILIDAD):
+        ahora = time.time()
+        self._recuperar_vencidas(ahora)
+        for site in sitios or self._sitios_con_cola():
+            devueltas = []
+            try:
+                while True:
+                    tarea_id = self.r.lpop(self._k("cola", site))
+                    if tarea_id is None:
+                        break
+                    tarea = self.r.hgetall(self._k("tarea", tarea_id))
+                    if not tarea:
+                        continue
+                    trabajo = tarea['trabajo']
+                    if not self.r.exists(self._k("trabajo", trabajo)) or \
+                            self.r.exists(self._k("cancelado", trabajo, site)):
+                        self._terminar(tarea_id, tarea)
+                        continue
+                    if self.r.exists(self._k("pausado", trabajo)):
+                        devueltas.append(tarea_id)
+                        continue
+                    pipe = self.r.pipeline()
+                    pipe.hset(self._k("tarea", tarea_id), 'trabajador', trabajador)
+                    pipe.hincrby(self._k("tarea", tarea_id), 'intentos', 1)
+                    pipe.zadd(self._k("leases"), {tarea_id: ahora + visibilidad})
+                    intentos = pipe.execute()[1]
+                    return {'id': tarea_id, 'trabajo': trabajo, 'site': site, 'idx': int(tarea['idx']),
+                            'sku': tarea['sku'], 'intentos': intentos}
+            finally:
+                # Las tareas de trabajos pausados vuelven al frente, en el mismo orden
+                for tarea_id in reversed(devueltas):
+                    self.r.lpush(self._k("cola", site), tarea_id)
+        return None
+
+    def _sitios_con_cola(self):
+        prefijo = self._k("cola", "")
+        return [k[len(prefijo):] for k in self.r.scan_iter(prefijo + "*")]
+
+    def _es_duenio(self, tarea_id, trabajador):
+        return self.r.hget(self._k("tarea", tarea_id), 'trabajador') == trabajador
+
+    def latido(self, tarea_id, trabajador, visibilidad=VISIBILIDAD):
+        if not self._es_duenio(tarea_id, trabajador):
+            return False
+        return self.r.zadd(self._k("leases"), {tarea_id: time.time() + visibilidad}, xx=True, ch=True) == 1
+
+    def liberar(self, tarea_id, trabajador):
+        if self._es_duenio(tarea_id, trabajador) and self.r.zrem(self._k("leases"), tarea_id):
+            tarea = self.r.hgetall(self._k("tarea", tarea_id))
+            self.r.hincrby(self._k("tarea", tarea_id), 'intentos', -1)
+            self.r.lpush(self._k("cola", tarea['site']), tarea_id)
+
+    def completar(self, tarea_id, trabajador, resultado):
+        if not self._es_duenio(tarea_id, trabajador) or not self.r.zrem(self._k("leases"), tarea_id):
+            return False
+        tarea = self.r.hgetall(self._k("tarea", tarea_id))
+        if not tarea:
+            return False
+        self._terminar(tarea_id, tarea, resultado)
+        return True
+
+    def resultados(self, trabajo, site, desde=0):
+        filas = self.r.lrange(self._k("resultados", trabajo, site), desde, -1)
+        return [tuple(json.loads(f)) for f in filas], desde + len(filas)
+
+    def pendientes(self, trabajo, site):
+        return max(0, int(self.r.get(self._k("pendientes", trabajo, site)) or 0))
+
+    def pausar(self, trabajo, pausado=True):
+        if pausado:
+            self.r.set(self._k("pausado", trabajo), 1)
+        else:
+            self.r.delete(self._k("pausado", trabajo))
+
+    def cancelar(self, trabajo, site):
+        # Las tareas se descartan a medida que los workers las sacan de la cola
+        self.r.set(self._k("cancelado", trabajo, site), 1, ex=86400)
+        self.r.set(self._k("pendientes", trabajo, site), 0)
+
+    def finalizar(self, trabajo):
+        claves = [self._k("trabajo", trabajo), self._k("pausado", trabajo)]
+        claves += list(self.r.scan_iter(self._k("resultados", trabajo, "*")))
+        claves += list(self.r.scan_iter(self._k("pendientes", trabajo, "*")))
+        self.r.delete(*claves)
+
+    def latido_trabajador(self, nombre):
+        self.r.zadd(self._k("trabajadores"), {nombre: time.time()})
+
+    def trabajadores_activos(self, ventana=60):
+        return self.r.zrangebyscore(self._k("trabajadores"), time.time() - ventana, "+inf")
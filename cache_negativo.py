@@ -0,0 +1,170 @@
+"""
+Caché negativo por sitio: EANs que un supermercado no tiene.
+
+Cada EAN confirmado como "No encontrado" se guarda junto con el momento de la
+última verificación. Mientras no pase el intervalo de re-verificación, el
+worker lo saltea sin cargar la página.
+
+Los EAN se guardan como enteros en un arreglo ordenado (array 'Q') con sus
+timestamps en un arreglo paralelo (array 'I'): ~12 bytes por EAN, así que
+cientos de miles de EANs ocupan unos pocos MB en memoria y en disco. La clave
+lleva también la cantidad de dígitos, para que "0123" y "123" no se confundan.
+"""
+import os
+import time
+import bisect
+import logging
+import threading
+from array import array
+
+MAGIC = b"NEG2"
+# Formato anterior: la clave era int(ean), sin los ceros a la izquierda
+MAGIC_V1 = b"NEG1"
+
+# Bits de la clave para la cantidad de dígitos; quedan 59 para el número
+BITS_LARGO = 5
+MAX_DIGITOS = 17
+
+
+def clave_ean(ean):
+    """Convierte un EAN en entero (número y cantidad de dígitos). Devuelve None si no es numérico."""
+    texto = str(ean).strip()
+    if not texto.isdigit() or len(texto) > MAX_DIGITOS:
+        return None
+    return (int(texto) << BITS_LARGO) | len(texto)
+
+
+class CacheNegativo:
+    """
+    Conjunto persistente de EANs inexistentes para un sitio.
+
+    Args:
+        site_name: Nombre del sitio ('nini', 'carrefour', ...)
+        directorio: Carpeta donde se guarda el archivo negativos_<sitio>.bin
+        dias_reverificacion: Días tras los cuales un EAN se vuelve a buscar
+    """
+
+    def __init__(self, site_name, directorio, dias_reverificacion=7):
+        self.site_name = site_name
+        self.ruta = os.path.join(directorio, f"negativos_{site_name}.bin")
+        self.ttl = int(dias_reverificacion * 86400)
+        self.omitidos = 0
+
+        self._eans = array('Q')
+        self._ts = array('I')
+        self._nuevos = {}      # ean -> timestamp, pendientes de fusionar
+        self._borrados = set()  # eans encontrados en este escaneo
+        self._lock = threading.Lock()
+        self._cargar()
+
+    def __len__(self):
+        return len(self._eans) + len(self._nuevos)
+
+    def _cargar(self):
+        if not os.path.exists(self.ruta):
+            return
+        try:
+            with open(self.ruta, 'rb') as f:
+                magic = f.read(4)
+                if magic not in (MAGIC, MAGIC_V1):
+                    logging.warning(f"[{self.site_name.upper()}] Caché negativo con formato desconocido, se ignora")
+                    return
+                n = int.from_bytes(f.read(4), 'little')
+                self._eans.fromfile(f, n)
+                self._ts.fromfile(f, n)
+            if magic == MAGIC_V1:
+                self._migrar_v1()
+            logging.info(f"[{self.site_name.upper()}] Caché negativo cargado: {n} EANs conocidos como inexistentes")
+        except Exception as e:
+            logging.warning(f"[{self.site_name.upper()}] No se pudo leer el caché negativo: {e}")
+            self._eans = array('Q')
+            self._ts = array('I')
+
+    def _migrar_v1(self):
+        """Claves del formato anterior: se asume el EAN sin ceros a la izquierda (el orden se mantiene)."""
+        eans, ts = array('Q'), array('I')
+        for numero, t in zip(self._eans, self._ts):
+            clave = clave_ean(numero)
+            if clave is not None:
+                eans.append(clave)
+                ts.append(t)
+        self._eans, self._ts = eans, ts
+
+    def _vigente(self, ts, ahora):
+        return ahora - ts < self.ttl
+
+    def contiene(self, ean):
+        """True si el EAN se sabe inexistente y todavía no toca re-verificarlo."""
+        clave = clave_ean(ean)
+        if clave is None:
+            return False
+        ahora = int(time.time())
+        with self._lock:
+            if clave in self._borrados:
+                return False
+            ts = self._nuevos.get(clave)
+            if ts is None:
+                pos = bisect.bisect_left(self._eans, clave)
+                if pos == len(self._eans) or self._eans[pos] != clave:
+                    return False
+                ts = self._ts[pos]
+            if self._vigente(ts, ahora):
+                self.omitidos += 1
+                return True
+            return False
+
+    def registrar(self, ean):
+        """Marca el EAN como no encontrado (ahora)."""
+        clave = clave_ean(ean)
+        if clave is None:
+            return
+        with self._lock:
+            self._borrados.discard(clave)
+            self._nuevos[clave] = int(time.time())
+
+    def descartar(self, ean):
+        """El EAN apareció en el sitio: se quita del caché."""
+        clave = clave_ean(ean)
+        if clave is None:
+            return
+        with self._lock:
+            self._nuevos.pop(clave, None)
+            self._borrados.add(clave)
+
+    def guardar(self):
+        """Fusiona los cambios pendientes y escribe el archivo (descarta entradas vencidas)."""
+        ahora = int(time.time())
+        with self._lock:
+            if not self._nuevos and not self._borrados and not len(self._eans):
+                return
+            pendientes = sorted(self._nuevos.items())
+            eans, ts = array('Q'), array('I')
+            i = j = 0
+            while i < len(self._eans) or j < len(pendientes):
+                if j == len(pendientes) or (i < len(self._eans) and self._eans[i] < pendientes[j][0]):
+                    clave, t = self._eans[i], self._ts[i]
+                    i += 1
+                else:
+                    clave, t = pendientes[j]
+                    j += 1
+                    # Si ya estaba en el arreglo, la entrada nueva reemplaza a la vieja
+                    if i < len(self._eans) and self._eans[i] == clave:
+                        i += 1
+                if clave in self._borrados or not self._vigente(t, ahora):
+                    continue
+                eans.append(clave)
+                ts.append(t)
+
+            self._eans, self._ts = eans, ts
+            self._nuevos.clear()
+            self._borrados.clear()
+
+            os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+            tmp = self.ruta + ".tmp"
+            with open(tmp, 'wb') as f:
+                f.write(MAGIC)
+                f.write(len(eans).to_bytes(4, 'little'))
+                eans.tofile(f)
+                ts.tofile(f)
+            os.replace(tmp, self.ruta)
+        logging.info(f"[{self.site_name.upper()}] Caché negativo guardado: {len(self._eans)} EANs")
@@ -0,0 +1,157 @@
+"""
+Cancelación de escaneos.
+
+Un TokenCancelacion viaja por run_scraper, worker_site y los supervisores de
+driver. Cancelar:
+
+- despierta todas las esperas que usan token.esperar() en lugar de time.sleep()
+  (pausa, circuito abierto, cupo de navegadores, broker, el sondeo de NINI);
+- ejecuta los callbacks registrados con al_cancelar(): cada supervisor cierra su
+  driver, así las búsquedas en curso fallan enseguida en lugar de agotar sus
+  WebDriverWait;
+- mata los grupos de procesos de los Chrome lanzados (ver registrar_grupo),
+  incluidos los que quedaron huérfanos de un chromedriver muerto.
+
+Las búsquedas corren en threads propios del supervisor: el token de la búsqueda
+en curso se publica por thread (ver en_contexto), así buscar_precio_* puede
+esperar con esperar() sin cambiar su firma.
+"""
+import os
+import signal
+import logging
+import threading
+
+
+class Cancelado(Exception):
+    """El escaneo se canceló."""
+
+
+class TokenCancelacion:
+    """
+    Señal de cancelación compartida por todos los threads de un escaneo.
+    """
+
+    def __init__(self):
+        self._evento = threading.Event()
+        self._callbacks = {}
+        self._siguiente = 0
+        self._lock = threading.Lock()
+        self.motivo = None
+
+    @property
+    def cancelado(self):
+        return self._evento.is_set()
+
+    def cancelar(self, motivo="cancelado por el usuario"):
+        with self._lock:
+            if self._evento.is_set():
+                return
+            self.motivo = motivo
+            self._evento.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        logging.warning(f"🛑 Escaneo {motivo}")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logging.debug(f"Error en callback de cancelación: {e}")
+
+    def esperar(self, segundos):
+        """Duerme hasta `segundos`; devuelve True si se canceló mientras tanto."""
+        return self._evento.wait(segundos)
+
+    def verificar(self):
+        """Lanza Cancelado si el escaneo se canceló."""
+        if self._evento.is_set():
+            raise Cancelado(self.motivo)
+
+    def al_cancelar(self, callback):
+        """
+        Registra callback() para cuando se cancele (si ya se canceló, lo llama ahora).
+        Devuelve una clave para quitar().
+        """
+        with self._lock:
+            if not self._evento.is_set():
+                clave = self._siguiente
+                self._siguiente += 1
+                self._callbacks[clave] = callback
+                return clave
+        callback()
+        return None
+
+    def quitar(self, clave):
+        if clave is None:
+            return
+        with self._lock:
+            self._callbacks.pop(clave, None)
+
+
+# =====================================================
+# TOKEN DEL THREAD ACTUAL
+# =====================================================
+
+_local = threading.local()
+
+
+def en_contexto(token, funcion, *args):
+    """Ejecuta funcion(*args) con `token` como token del thread actual."""
+    anterior = getattr(_local, 'token', None)
+    _local.token = token
+    try:
+        return funcion(*args)
+    finally:
+        _local.token = anterior
+
+
+def token_actual():
+    return getattr(_local, 'token', None)
+
+
+def esperar(segundos):
+    """time.sleep() interrumpible por el token del thread. Devuelve True si se canceló."""
+    token = token_actual()
+    if token is None:
+        threading.Event().wait(segundos)
+        return False
+    return token.esperar(segundos)
+
+
+def cancelado():
+    token = token_actual()
+    return token is not None and token.cancelado
+
+
+# =====================================================
+# GRUPOS DE PROCESOS
+# =====================================================
+
+# Cada chromedriver arranca en su propia sesión (start_new_session): su grupo de
+# procesos incluye los Chrome que lanza, aunque el chromedriver muera antes
+_grupos = set()
+_grupos_lock = threading.Lock()
+
+
+def registrar_grupo(pgid):
+    with _grupos_lock:
+        _grupos.add(pgid)
+
+
+def matar_grupo(pgid):
+    """SIGKILL a todo el grupo de procesos. Devuelve False si ya no existía."""
+    with _grupos_lock:
+        _grupos.discard(pgid)
+    if not hasattr(os, "killpg"):
+        return False
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+
+def matar_grupos():
+    """Mata los grupos de todos los navegadores lanzados. Devuelve cuántos seguían vivos."""
+    with _grupos_lock:
+        grupos = list(_grupos)
+    return sum(1 for pgid in grupos if matar_grupo(pgid))
@@ -0,0 +1,257 @@
+"""
+Planificador de capacidad: cuántos navegadores y pedidos HTTP entran en el contenedor.
+
+La misma imagen corre en contenedores de 1 GB y en máquinas de 32 GB. En lugar
+de un navegador fijo por sitio, el planificador lee los límites del cgroup
+(memoria y cuota de CPU, v2 o v1; sin cgroup, los de la máquina), mide la
+memoria real de los navegadores abiertos (RSS de los procesos hijos de este
+proceso) y reparte entre los sitios activos los navegadores que entran:
+
+    navegadores = abiertos + (límite - uso - reserva) / MB por navegador
+
+acotado por la CPU (NAVEGADORES_POR_CPU) y por el máximo de cada sitio.
+El cupo se recalcula cada INTERVALO_MEDICION segundos: con presión de memoria
+los hilos de búsqueda que quedan fuera del cupo cierran su navegador y
+esperan; cuando se libera memoria vuelven a abrir uno.
+
+Sólo usa /proc y /sys: se puede importar desde la app web sin costo.
+"""
+import os
+import time
+import logging
+import threading
+
+# Segundos entre mediciones de memoria
+INTERVALO_MEDICION = 5
+# Peso de la medición nueva en el promedio de MB por navegador
+PESO_MEDICION = 0.3
+# Por debajo de este límite de memoria Chrome corre en un único proceso
+UMBRAL_PROCESO_UNICO_MB = 2048
+# Con /dev/shm más chico que esto Chrome usa /tmp para la memoria compartida
+MINIMO_SHM_MB = 512
+
+_SIN_LIMITE = 1 << 60
+_MB = 1024 * 1024
+
+
+def _leer(ruta):
+    try:
+        with open(ruta) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _memoria_stat(ruta, clave):
+    texto = _leer(ruta) or ""
+    for linea in texto.splitlines():
+        nombre, _, valor = linea.partition(" ")
+        if nombre == clave:
+            return int(valor)
+    return 0
+
+
+def _memoria_maquina():
+    """(total, disponible) en bytes según /proc/meminfo."""
+    valores = {}
+    for linea in (_leer("/proc/meminfo") or "").splitlines():
+        nombre, _, resto = linea.partition(":")
+        partes = resto.split()
+        if partes:
+            valores[nombre] = int(partes[0]) * 1024
+    total = valores.get("MemTotal", 0)
+    return total, valores.get("MemAvailable", total)
+
+
+def limites(raiz="/sys/fs/cgroup"):
+    """
+    Memoria y CPU disponibles para este proceso.
+
+    Returns:
+        Dict con 'memoria_limite_mb', 'memoria_uso_mb' (sin caché de archivos
+        inactiva, como el working set que mira el OOM killer), 'cpus' y 'cgroup'
+        ('v2', 'v1' o None)
+    """
+    total, disponible = _memoria_maquina()
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    limite, uso, version = total, total - disponible, None
+
+    if _leer(os.path.join(raiz, "cgroup.controllers")) is not None:
+        version = "v2"
+        maximo = _leer(os.path.join(raiz, "memory.max"))
+        actual = _leer(os.path.join(raiz, "memory.current"))
+        if maximo and maximo != "max":
+            limite = min(limite, int(maximo))
+        if actual:
+            uso = int(actual) - _memoria_stat(os.path.join(raiz, "memory.stat"), "inactive_file")
+        cuota = (_leer(os.path.join(raiz, "cpu.max")) or "max").split()
+        if cuota[0] != "max" and len(cuota) == 2:
+            cpus = min(cpus, int(cuota[0]) / int(cuota[1]))
+    elif _leer(os.path.join(raiz, "memory", "memory.limit_in_bytes")) is not None:
+        version = "v1"
+        maximo = int(_leer(os.path.join(raiz, "memory", "memory.limit_in_bytes")))
+        actual = _leer(os.path.join(raiz, "memory", "memory.usage_in_bytes"))
+        if maximo < _SIN_LIMITE:
+            limite = min(limite, maximo)
+        if actual and maximo < _SIN_LIMITE:
+            uso = int(actual) - _memoria_stat(os.path.join(raiz, "memory", "memory.stat"), "total_inactive_file")
+        cuota = _leer(os.path.join(raiz, "cpu", "cpu.cfs_quota_us"))
+        periodo = _leer(os.path.join(raiz, "cpu", "cpu.cfs_period_us"))
+        if cuota and periodo and int(cuota) > 0:
+            cpus = min(cpus, int(cuota) / int(periodo))
+
+    return {
+        'memoria_limite_mb': limite / _MB,
+        'memoria_uso_mb': max(0, uso) / _MB,
+        'cpus': max(cpus, 0.1),
+        'cgroup': version,
+    }
+
+
+def rss_descendientes_mb(pid=None):
+    """RSS total de los procesos hijos (y nietos) de pid: los navegadores y sus drivers."""
+    pid = pid or os.getpid()
+    hijos = {}
+    for nombre in os.listdir("/proc"):
+        if not nombre.isdigit():
+            continue
+        stat = _leer(f"/proc/{nombre}/stat")
+        if not stat:
+            continue
+        # El nombre del proceso va entre paréntesis y puede tener espacios
+        campos = stat[stat.rfind(")") + 2:].split()
+        hijos.setdefault(int(campos[1]), []).append(int(nombre))
+
+    pagina = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    pendientes = list(hijos.get(pid, []))
+    while pendientes:
+        actual = pendientes.pop()
+        pendientes.extend(hijos.get(actual, []))
+        statm = _leer(f"/proc/{actual}/statm")
+        if statm:
+            total += int(statm.split()[1]) * pagina
+    return total / _MB
+
+
+def tamano_shm_mb():
+    try:
+        st = os.statvfs("/dev/shm")
+    except OSError:
+        return 0
+    return st.f_blocks * st.f_frsize / _MB
+
+
+def flags_chrome(memoria_limite_mb=None):
+    """
+    Flags de Chrome que dependen de la capacidad del contenedor: un único
+    proceso sólo con poca memoria y /tmp en lugar de /dev/shm sólo si es chico.
+    """
+    if memoria_limite_mb is None:
+        memoria_limite_mb = limites()['memoria_limite_mb']
+    flags = []
+    if memoria_limite_mb < UMBRAL_PROCESO_UNICO_MB:
+        flags.append("--single-process")
+    if tamano_shm_mb() < MINIMO_SHM_MB:
+        flags.append("--disable-dev-shm-usage")
+    return flags
+
+
+def hilos_http(cpus=None, minimo=4, maximo=32):
+    """Pedidos HTTP simultáneos (enlaces, API de los VTEX): esperan red, no CPU."""
+    if cpus is None:
+        cpus = limites()['cpus']
+    return int(min(maximo, max(minimo, cpus * 4)))
+
+
+class Planificador:
+    """
+    Cupo de navegadores por sitio, recalculado según la memoria disponible.
+
+    Args:
+        mb_por_navegador: Estimación inicial de MB por navegador (se corrige midiendo)
+        reserva_mb: Memoria que se deja libre para la app, pandas y picos
+        navegadores_por_cpu: Navegadores simultáneos por CPU disponible
+        medir: Callable medir() -> (limites, rss_navegadores_mb); por defecto lee /proc y /sys
+    """
+
+    def __init__(self, mb_por_navegador, reserva_mb=512, navegadores_por_cpu=2, medir=None):
+        self.mb_por_navegador = float(mb_por_navegador)
+        self.reserva_mb = reserva_mb
+        self.navegadores_por_cpu = navegadores_por_cpu
+        self.medir = medir or (lambda: (limites(), rss_descendientes_mb()))
+        self._sitios = {}      # sitio -> máximo de navegadores
+        self._abiertos = {}    # sitio -> navegadores abiertos ahora
+        self._cupos = {}
+        self._medido = 0
+        self._ultima = None
+        self._lock = threading.Lock()
+
+    def registrar(self, site_name, maximo):
+        """Un sitio empieza a buscar con hasta `maximo` navegadores."""
+        with self._lock:
+            self._sitios[site_name] = max(1, maximo)
+            self._abiertos.setdefault(site_name, 0)
+            self._medido = 0
+
+    def retirar(self, site_name):
+        with self._lock:
+            self._sitios.pop(site_name, None)
+            self._abiertos.pop(site_name, None)
+            self._cupos.pop(site_name, None)
+            self._medido = 0
+
+    def abierto(self, site_name):
+        with self._lock:
+            self._abiertos[site_name] = self._abiertos.get(site_name, 0) + 1
+
+    def cerrado(self, site_name):
+        with self._lock:
+            self._abiertos[site_name] = max(0, self._abiertos.get(site_name, 0) - 1)
+
+    def cupo(self, site_name):
+        """Navegadores que el sitio puede tener abiertos ahora (al menos 1)."""
+        with self._lock:
+            if time.time() - self._medido > INTERVALO_MEDICION:
+                self._recalcular()
+            return self._cupos.get(site_name, 1)
+
+    def _recalcular(self):
+        self._medido = time.time()
+        try:
+            lim, rss = self.medir()
+        except Exception as e:
+            logging.debug(f"🧮 No se pudo medir la memoria: {e}")
+            return
+        abiertos = sum(self._abiertos.values())
+        if abiertos and rss > 0:
+            self.mb_por_navegador += PESO_MEDICION * (rss / abiertos - self.mb_por_navegador)
+
+        libre = lim['memoria_limite_mb'] - lim['memoria_uso_mb'] - self.reserva_mb
+        por_memoria = abiertos + int(libre // self.mb_por_navegador)
+        por_cpu = int(lim['cpus'] * self.navegadores_por_cpu)
+        total = max(len(self._sitios), min(por_memoria, por_cpu))
+
+        # Uno por sitio y el resto de a uno, mientras haya sitios por debajo de su máximo
+        cupos = {site: 1 for site in self._sitios}
+        restantes = total - len(cupos)
+        while restantes > 0:
+            crecen = [s for s in sorted(cupos) if cupos[s] < self._sitios[s]]
+            if not crecen:
+                break
+            for site in crecen[:restantes]:
+                cupos[site] += 1
+            restantes -= min(restantes, len(crecen))
+
+        self._ultima = {**lim, 'rss_navegadores_mb': rss, 'abiertos': abiertos,
+                        'mb_por_navegador': self.mb_por_navegador, 'cupos': cupos}
+        if cupos != self._cupos:
+            logging.info(f"🧮 Cupo de navegadores: {', '.join(f'{s.upper()} {n}' for s, n in cupos.items())} "
+                         f"(memoria {lim['memoria_uso_mb']:.0f}/{lim['memoria_limite_mb']:.0f} MB, "
+                         f"{self.mb_por_navegador:.0f} MB por navegador, {lim['cpus']:.1f} CPU)")
+        self._cupos = cupos
+
+    def estado(self):
+        """Última medición y cupos, para logs y diagnóstico."""
+        with self._lock:
+            return dict(self._ultima) if self._ultima else None
@@ -0,0 +1,310 @@
+"""
+Sincronización del catálogo completo de los sitios VTEX (Carrefour, Vea, Disco).
+
+Buscar EAN por EAN cuesta una página (y un navegador) por producto. La API
+pública de catálogo de VTEX devuelve 50 productos por pedido con EAN, precio,
+precio de lista y promociones, así que bajar el catálogo entero cuesta del
+orden de (productos del sitio / 50) pedidos HTTP, sin navegador, pidamos
+10 EANs o 10.000.
+
+El recorrido va por el árbol de categorías: cada departamento se pagina con
+fq=C:/id/; como VTEX no deja paginar más allá de ~2500 resultados, una
+categoría más grande se divide en sus subcategorías y, si es una hoja, en
+rangos de precio (fq=P:[a TO b]).
+
+El índice EAN -> (producto, sku, precio, precio de lista, promo, link, nombre) se
+guarda comprimido por sitio y por día:
+
+    catalogo/vea/2026-10-19.json.gz
+
+Otra planilla el mismo día se cruza contra el índice en memoria, sin red.
+"""
+import os
+import json
+import gzip
+import time
+import logging
+import threading
+from datetime import date
+from urllib.parse import urlencode, quote, urlparse
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError, URLError
+from concurrent.futures import ThreadPoolExecutor
+
+TAMANO_PAGINA = 50
+# VTEX rechaza _from mayores a 2500
+LIMITE_PAGINACION = 2550
+PROFUNDIDAD_ARBOL = 3
+TIMEOUT_HTTP = 30
+REINTENTOS_HTTP = 3
+# Índices diarios que se conservan por sitio
+MAX_INDICES = 3
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+
+# Posiciones de cada dato en las entradas del índice (los índices anteriores a
+# NOMBRE no lo tienen: usar nombre_entrada())
+PRODUCTO, SKU, PRECIO, PRECIO_LISTA, PROMO, DISPONIBLE, LINK, NOMBRE = range(8)
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def clave_ean(ean):
+    """EAN normalizado para cruzar planilla e índice (sin espacios ni ceros a la izquierda)."""
+    return str(ean).strip().lstrip("0")
+
+
+def formatear_precio(valor):
+    """1234.5 -> "$ 1.234,50", el formato que muestran los sitios (y que entiende precios.py)."""
+    entero, decimales = f"{float(valor):,.2f}".split(".")
+    return f"$ {entero.replace(',', '.')},{decimales}"
+
+
+def _promo(oferta):
+    nombres = []
+    for grupo in ("Teasers", "PromotionTeasers", "DiscountHighLight"):
+        for teaser in oferta.get(grupo) or []:
+            nombre = teaser.get("<Name>") or teaser.get("Name")
+            if nombre and nombre not in nombres:
+                nombres.append(nombre)
+    return " | ".join(nombres)
+
+
+def entradas_producto(producto):
+    """Convierte un producto de la API de búsqueda en pares (ean, entrada del índice)."""
+    for item in producto.get("items") or []:
+        ean = clave_ean(item.get("ean") or "")
+        if not ean:
+            continue
+        vendedores = item.get("sellers") or []
+        vendedor = next((v for v in vendedores if v.get("commertialOffer", {}).get("AvailableQuantity")),
+                        vendedores[0] if vendedores else None)
+        oferta = (vendedor or {}).get("commertialOffer") or {}
+        precio = oferta.get("Price") or 0
+        lista = oferta.get("ListPrice") or oferta.get("PriceWithoutDiscount") or precio
+        disponible = bool(oferta.get("AvailableQuantity")) and precio > 0
+        nombre = item.get("nameComplete") or producto.get("productName") or item.get("name") or ""
+        yield ean, [str(producto.get("productId", "")), str(item.get("itemId", "")), precio, lista,
+                    _promo(oferta), disponible, producto.get("link", ""), nombre]
+
+
+def nombre_entrada(entrada):
+    return entrada[NOMBRE] if len(entrada) > NOMBRE else ""
+
+
+def formatear_resultado(site_name, entrada):
+    """(precio, oferta, dinamica) de una entrada del índice, con el formato de buscar_precio_* del sitio."""
+    if not entrada[DISPONIBLE]:
+        return "No encontrado", "", ""
+    precio, lista, promo = entrada[PRECIO], entrada[PRECIO_LISTA], entrada[PROMO]
+    rebajado = lista and precio < lista
+    if site_name == "carrefour":
+        # Carrefour muestra el precio de venta y la promo del tooltip
+        return formatear_precio(precio), promo or ("Oferta" if rebajado else ""), ""
+    # Vea/Disco: precio regular, precio de oferta y dinámica
+    return formatear_precio(lista or precio), formatear_precio(precio) if rebajado else "", promo
+
+
+class CatalogoVTEX:
+    """
+    Índice EAN -> precio del catálogo completo de una tienda VTEX.
+
+    Args:
+        site_name: Nombre del sitio ('carrefour', 'vea', 'disco')
+        url_base: URL de la tienda (https://www.vea.com.ar)
+        directorio: Carpeta donde se guardan los índices diarios
+        hilos: Pedidos HTTP simultáneos durante la sincronización
+    """
+
+    def __init__(self, site_name, url_base, directorio, hilos=4):
+        self.site_name = site_name
+        self.url_base = url_base.rstrip("/")
+        self.directorio = os.path.join(directorio, site_name)
+        self.hilos = hilos
+        self.indice = {}
+        self.pedidos = 0
+        os.makedirs(self.directorio, exist_ok=True)
+        with _locks_lock:
+            self._lock = _locks.setdefault(site_name, threading.Lock())
+
+    def _ruta(self, fecha):
+        return os.path.join(self.directorio, f"{fecha.isoformat()}.json.gz")
+
+    # ---------------------------------------------------------------
+    # HTTP
+    # ---------------------------------------------------------------
+
+    def _pedir(self, ruta, params=None):
+        """GET a la API con reintentos. Devuelve (json, total) con el total del header resources."""
+        url = f"{self.url_base}{ruta}"
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        pedido = Request(url, headers={"User-Agent": USER_AGENT, "Accept": "application/json"})
+        for intento in range(REINTENTOS_HTTP):
+            try:
+                with urlopen(pedido, timeout=TIMEOUT_HTTP) as respuesta:
+                    self.pedidos += 1
+                    recursos = respuesta.headers.get("resources", "")
+                    total = int(recursos.rsplit("/", 1)[1]) if "/" in recursos else None
+                    return json.loads(respuesta.read().decode("utf-8")), total
+            except HTTPError as e:
+                if e.code not in (429, 500, 502, 503, 504) or intento == REINTENTOS_HTTP - 1:
+                    raise
+            except URLError:
+                if intento == REINTENTOS_HTTP - 1:
+                    raise
+            time.sleep(2 ** intento)
+
+    def _buscar(self, fq, desde=0, hasta=TAMANO_PAGINA - 1, orden=None):
+        params = [("fq", f) for f in fq] + [("_from", desde), ("_to", hasta)]
+        if orden:
+            params.append(("O", orden))
+        productos, total = self._pedir("/api/catalog_system/pub/products/search", params)
+        return productos or [], total if total is not None else len(productos or [])
+
+    # ---------------------------------------------------------------
+    # RECORRIDO
+    # ---------------------------------------------------------------
+
+    def _particiones(self, categoria, ruta):
+        """
+        Filtros fq que cubren la categoría con menos de LIMITE_PAGINACION productos cada uno.
+        Devuelve una lista de (fq, total).
+        """
+        fq = [f"C:{ruta}"]
+        _, total = self._buscar(fq, 0, 0)
+        if total <= LIMITE_PAGINACION:
+            return [(fq, total)] if total else []
+        hijos = categoria.get("children") or []
+        if hijos:
+            particiones = []
+            for hijo in hijos:
+                particiones.extend(self._particiones(hijo, f"{ruta}{hijo['id']}/"))
+            return particiones
+        # Hoja demasiado grande: rangos de precio
+        mas_caro, _ = self._buscar(fq, 0, 0, orden="OrderByPriceDESC")
+        maximo = max((e[1][PRECIO] for p in mas_caro for e in entradas_producto(p)), default=0)
+        return self._rangos_precio(ruta, 0, max(1, int(maximo) + 1))
+
+    def _rangos_precio(self, ruta, minimo, maximo):
+        fq = [f"C:{ruta}", f"P:[{minimo} TO {maximo}]"]
+        _, total = self._buscar(fq, 0, 0)
+        if total <= LIMITE_PAGINACION or maximo - minimo <= 1:
+            return [(fq, total)] if total else []
+        medio = (minimo + maximo) // 2
+        return self._rangos_precio(ruta, minimo, medio) + self._rangos_precio(ruta, medio, maximo)
+
+    def _bajar_particion(self, fq, total):
+        indice = {}
+        for desde in range(0, min(total, LIMITE_PAGINACION), TAMANO_PAGINA):
+            productos, _ = self._buscar(fq, desde, desde + TAMANO_PAGINA - 1)
+            for producto in productos:
+                for ean, entrada in entradas_producto(producto):
+                    indice[ean] = entrada
+        return indice
+
+    def sincronizar(self):
+        """Baja el catálogo completo y guarda el índice del día. Devuelve el índice."""
+        inicio = time.time()
+        etiqueta = self.site_name.upper()
+        arbol, _ = self._pedir(f"/api/catalog_system/pub/category/tree/{PROFUNDIDAD_ARBOL}")
+        with ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix=f"Catalogo-{etiqueta}") as ejecutor:
+            particiones = [p for lista in ejecutor.map(lambda d: self._particiones(d, f"/{d['id']}/"), arbol)
+                           for p in lista]
+            logging.info(f"[{etiqueta}] 📚 Catálogo: {len(particiones)} particiones, "
+                         f"~{sum(t for _, t in particiones)} productos")
+            indice = {}
+            for parcial in ejecutor.map(lambda p: self._bajar_particion(*p), particiones):
+                indice.update(parcial)
+
+        self.indice = indice
+        self._guardar(date.today())
+        logging.info(f"[{etiqueta}] 📚 Catálogo sincronizado: {len(indice)} EANs en "
+                     f"{time.time() - inicio:.0f}s ({self.pedidos} pedidos)")
+        return indice
+
+    # ---------------------------------------------------------------
+    # ÍNDICE
+    # ---------------------------------------------------------------
+
+    def _guardar(self, fecha):
+        ruta = self._ruta(fecha)
+        tmp = f"{ruta}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(self.indice, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, ruta)
+        viejos = sorted(n for n in os.listdir(self.directorio) if n.endswith(".json.gz"))[:-MAX_INDICES]
+        for nombre in viejos:
+            try:
+                os.remove(os.path.join(self.directorio, nombre))
+            except OSError:
+                pass
+
+    def cargar(self, forzar=False):
+        """
+        Índice del día: lo lee del disco si ya se sincronizó hoy, si no sincroniza.
+
+        Args:
+            forzar: Si es True, sincroniza aunque exista el índice de hoy
+        """
+        with self._lock:
+            ruta = self._ruta(date.today())
+            if not forzar and os.path.exists(ruta):
+                with gzip.open(ruta, "rt", encoding="utf-8") as f:
+                    self.indice = json.load(f)
+                logging.info(f"[{self.site_name.upper()}] 📚 Catálogo de hoy en disco: {len(self.indice)} EANs")
+                return self.indice
+            return self.sincronizar()
+
+    def resultado(self, ean):
+        """
+        (precio, oferta, dinamica) con el mismo formato que buscar_precio_* del sitio,
+        o None si el EAN no está en el catálogo.
+        """
+        entrada = self.indice.get(clave_ean(ean))
+        if entrada is None:
+            return None
+        return formatear_resultado(self.site_name, entrada)
+
+    def resultado_por_ean(self, ean):
+        """
+        Busca un EAN en la API de búsqueda del sitio (fq=alternateIds_Ean), sin navegador.
+
+        Returns:
+            (resultado, ruta): el resultado y el enlace (/slug/p) del producto,
+            o (None, None) si el sitio no lo tiene. Los errores de red se propagan.
+        """
+        productos, _ = self._buscar([f"alternateIds_Ean:{str(ean).strip()}"], 0, 9)
+        clave = clave_ean(ean)
+        for producto in productos:
+            for ean_item, entrada in entradas_producto(producto):
+                if ean_item == clave:
+                    return formatear_resultado(self.site_name, entrada), urlparse(entrada[LINK]).path or None
+        return None, None
+
+    def resultado_por_enlace(self, ruta, ean):
+        """
+        (precio, oferta, dinamica) de un EAN leyendo directamente su producto
+        (ruta /slug/p, ver enlaces.py), sin pasar por la búsqueda.
+
+        Returns:
+            El resultado, o None si el enlace ya no existe o no lleva a ese EAN.
+            Los errores de red se propagan.
+        """
+        slug = ruta.strip("/")
+        if slug.endswith("/p"):
+            slug = slug[:-2]
+        try:
+            productos, _ = self._pedir(f"/api/catalog_system/pub/products/search/{quote(slug)}/p")
+        except HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+        clave = clave_ean(ean)
+        for producto in productos or []:
+            for ean_item, entrada in entradas_producto(producto):
+                if ean_item == clave:
+                    return formatear_resultado(self.site_name, entrada)
+        return None
@@ -0,0 +1,155 @@
+"""
+Circuit breaker por sitio.
+
+Cuando un supermercado está caído o nos bloquea, cada EAN restante pagaría el
+timeout completo de driver.get y de los WebDriverWait. El circuito cuenta las
+fallas consecutivas del sitio (resultados "Error", sesión que no inicia,
+páginas de bloqueo) y al llegar al umbral se abre: las búsquedas del sitio
+quedan estacionadas y cada `espera` segundos se deja pasar una sola búsqueda
+de prueba (semiabierto). Si la prueba funciona el circuito se cierra y se
+sigue normalmente; si falla, la espera se duplica. Tras `max_sondeos` pruebas
+fallidas el sitio se da por caído en este escaneo y lo que queda se marca
+"Error" sin cargar ninguna página (el próximo escaneo programado lo reintenta).
+"""
+import time
+import logging
+import threading
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+AGOTADO = "agotado"
+
+# Decisiones de permitir()
+PASAR = "pasar"
+ESPERAR = "esperar"
+DESCARTAR = "descartar"
+
+# Títulos típicos de páginas de bloqueo, captcha o rate limiting
+TITULOS_BLOQUEO = (
+    "access denied", "acceso denegado", "attention required", "just a moment",
+    "403 forbidden", "429 too many requests", "too many requests", "request blocked",
+)
+
+
+def detectar_bloqueo(driver):
+    """Devuelve un motivo si la página cargada parece un bloqueo del sitio, o None."""
+    try:
+        titulo = (driver.title or "").strip().lower()
+    except Exception:
+        return None
+    for marca in TITULOS_BLOQUEO:
+        if marca in titulo:
+            return f"bloqueo ({titulo[:60]})"
+    return None
+
+
+class Circuito:
+    """
+    Estado del circuito de un sitio, compartido por todos sus hilos de búsqueda.
+
+    Args:
+        site_name: Nombre del sitio
+        umbral: Fallas consecutivas que abren el circuito
+        espera: Segundos hasta la primera búsqueda de prueba
+        espera_maxima: Tope de la espera entre pruebas (se duplica en cada falla)
+        max_sondeos: Pruebas fallidas antes de dar el sitio por caído (None = nunca)
+        al_cambiar: Callback al_cambiar(info) en cada cambio de estado
+    """
+
+    def __init__(self, site_name, umbral=5, espera=60, espera_maxima=300, max_sondeos=3, al_cambiar=None):
+        self.site_name = site_name
+        self.umbral = umbral
+        self.espera = espera
+        self.espera_maxima = espera_maxima
+        self.max_sondeos = max_sondeos
+        self.al_cambiar = al_cambiar
+
+        self.estado = CERRADO
+        self.fallas = 0
+        self.sondeos = 0
+        self.aperturas = 0
+        self.motivo = ""
+        self.reintento = 0
+        self._espera_actual = espera
+        self._lock = threading.Lock()
+
+    def info(self):
+        return {
+            'site': self.site_name,
+            'estado': self.estado,
+            'fallas': self.fallas,
+            'motivo': self.motivo,
+            'reintento_en': max(0, round(self.reintento - time.time())) if self.estado == ABIERTO else 0,
+        }
+
+    def _cambiar(self, estado):
+        self.estado = estado
+        etiqueta = self.site_name.upper()
+        if estado == ABIERTO:
+            logging.warning(f"[{etiqueta}] 🔌 Circuito abierto tras {self.fallas} fallas ({self.motivo}). "
+                            f"Próxima prueba en {self._espera_actual:.0f}s")
+        elif estado == SEMIABIERTO:
+            logging.info(f"[{etiqueta}] 🔌 Circuito semiabierto: búsqueda de prueba")
+        elif estado == AGOTADO:
+            logging.error(f"[{etiqueta}] 🔌 Sitio caído tras {self.sondeos} pruebas fallidas: "
+                          f"lo pendiente se marca como Error")
+        else:
+            logging.info(f"[{etiqueta}] 🔌 Circuito cerrado: el sitio responde de nuevo")
+        if self.al_cambiar:
+            try:
+                self.al_cambiar(self.info())
+            except Exception:
+                pass
+
+    def _abrir(self):
+        self.aperturas += 1
+        self.reintento = time.time() + self._espera_actual
+        self._cambiar(ABIERTO)
+
+    def disponible(self):
+        """True si una búsqueda podría pasar ahora (no consume la prueba del semiabierto)."""
+        with self._lock:
+            if self.estado == ABIERTO:
+                return time.time() >= self.reintento
+            return self.estado != SEMIABIERTO
+
+    def permitir(self):
+        """
+        Decide si se puede buscar ahora.
+
+        Returns:
+            PASAR, ESPERAR (circuito abierto o prueba en curso) o DESCARTAR (sitio caído)
+        """
+        with self._lock:
+            if self.estado == CERRADO:
+                return PASAR
+            if self.estado == AGOTADO:
+                return DESCARTAR
+            if self.estado == ABIERTO and time.time() >= self.reintento:
+                self._cambiar(SEMIABIERTO)
+                return PASAR
+            return ESPERAR
+
+    def exito(self):
+        with self._lock:
+            self.fallas = 0
+            if self.estado in (ABIERTO, SEMIABIERTO):
+                self.sondeos = 0
+                self._espera_actual = self.espera
+                self.motivo = ""
+                self._cambiar(CERRADO)
+
+    def falla(self, motivo):
+        with self._lock:
+            self.fallas += 1
+            self.motivo = motivo
+            if self.estado == SEMIABIERTO:
+                self.sondeos += 1
+                if self.max_sondeos is not None and self.sondeos >= self.max_sondeos:
+                    self._cambiar(AGOTADO)
+                else:
+                    self._espera_actual = min(self._espera_actual * 2, self.espera_maxima)
+                    self._abrir()
+            elif self.estado == CERRADO and self.fallas >= self.umbral:
+                self._abrir()
@@ -1,6 +1,8 @@
 from sre_constants import LITERAL
 import time
 import os
+import queue
+import threading
 import pandas as pd
 from datetime import datetime
 
@@ -10,36 +12,46 @@ from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.chrome.options import Options
 from webdriver_manager.chrome import ChromeDriverManager
 import logging
 import logging.handlers
 
-# =====================================================
-# CONFIGURACIÓN LOGGING
-# =====================================================
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("scraper_debug.log", encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+from cache_negativo import CacheNegativo
+from ingesta import iterar_planilla, TAMANO_BLOQUE
+from exportaciones import ExportacionIncremental
+from resultados import ResultadosAnteriores, EscritorResultados, preparar_bloque
+from precios import agregar_columnas_numericas, comparar_sitios
+from historial import HistorialPrecios, EscrituraHistorial, codificar_precio
+from prioridad import PuntajesSitio
+from broker import crear_broker
+from circuito import Circuito, detectar_bloqueo, ESPERAR, DESCARTAR
+from supervisor import SupervisorDriver, SesionNoIniciada
+from cancelacion import TokenCancelacion, Cancelado, esperar, registrar_grupo
+from instantaneas import ArchivoInstantaneas, archivar
+from catalogo_vtex import CatalogoVTEX, formatear_resultado, nombre_entrada
+from similares import IndiceSimilares
+from enlaces import IndiceEnlaces, capturar_enlace
+from perfilado import Perfilador, tramo, instrumentar_driver
+from capacidad import Planificador, flags_chrome, hilos_http
+from concurrent.futures import ThreadPoolExecutor
 
 # =====================================================
-# CONFIGURACIÓN GENERAL
+# CONFIGURACIÓN GENERAL (ver configuracion.py)
 # =====================================================
+from configuracion import (
+    configurar_logging, HEADLESS, BASE_DIR, INPUT_FILE, OUTPUT_FILE, DATA_DIR, EXPORT_DIR, HISTORIAL_DIR,
+    PROGRAMACION_FILE, DIAS_REVERIFICAR_NEGATIVOS, NAVEGADOR_BACKEND, BUSQUEDAS_PARALELAS, BROKER_URL,
+    MAX_NAVEGADORES_SITIO, MB_POR_NAVEGADOR, RESERVA_MEMORIA_MB, NAVEGADORES_POR_CPU,
+    ESPERA_SIN_TRABAJADORES, CIRCUITO_FALLAS, CIRCUITO_ESPERA, CIRCUITO_SONDEOS, PLAZO_BUSQUEDA,
+    ESTRATEGIA_CARGA, TIMEOUT_PAGINA_LISTA, ARCHIVAR_INSTANTANEAS, INSTANTANEAS_DIR, MODO_CATALOGO,
+    CATALOGO_FALTANTES, CATALOGO_DIR, TIENDAS_VTEX, USAR_ENLACES, ENLACES_DB, HILOS_ENLACES,
+    BUSQUEDA_SIMILARES, UMBRAL_SIMILITUD, PERFILES_DIR, PERFIL_INTERVALO_MS
+)
 
-HEADLESS = True
-
-# Usar rutas relativas para compatibilidad con Railway
-import os as _os
-BASE_DIR = _os.path.dirname(_os.path.abspath(__file__))
-INPUT_FILE = _os.path.join(BASE_DIR, "planilla_ofertas.xlsx")
-OUTPUT_FILE = _os.path.join(BASE_DIR, "precios_resultados.xlsx")
-
-print("🚀 Scraper automático de precios")
+# Navegadores que entran en el contenedor, por sitio (ver capacidad.py)
+PLANIFICADOR = Planificador(MB_POR_NAVEGADOR, RESERVA_MEMORIA_MB, NAVEGADORES_POR_CPU)
 
 # =====================================================
 # DRIVER
@@ -47,7 +59,6 @@ print("🚀 Scraper automático de precios")
 
 def configurar_driver(optimized=True):
     import random
-    import threading
     
     logging.info("Iniciando configuración del driver...")
     options = Options()
@@ -85,17 +96,22 @@ def configurar_driver(optimized=True):
     options.add_argument("--disable-notifications")
     options.add_argument("--disable-blink-features=AutomationControlled")
     options.add_argument("--log-level=3")
+
+    # Con "eager" driver.get vuelve con el DOM listo, sin esperar imágenes, scripts
+    # diferidos ni iframes; cargar_pagina() espera lo que cada sitio necesita
+    options.page_load_strategy = ESTRATEGIA_CARGA
     
     # Opciones adicionales para Railway/Docker
     if is_railway:
         options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
         options.add_argument("--disable-gpu")
         options.add_argument("--disable-extensions")
         options.add_argument("--remote-debugging-port=9222")
         
-        # CRÍTICO: Prevenir "unable to connect to renderer"
-        options.add_argument("--single-process")  # Ejecutar en proceso único
+        # Proceso único y /tmp en lugar de /dev/shm sólo si el contenedor es chico
+        # (previenen "unable to connect to renderer" con poca memoria)
+        for flag in flags_chrome():
+            options.add_argument(flag)
         options.add_argument("--disable-software-rasterizer")
         options.add_argument("--disable-setuid-sandbox")
         
@@ -152,9 +168,12 @@ def configurar_driver(optimized=True):
             base_port = 9500 + (thread_id % 100)
             port = base_port + random.randint(0, 100)
             
+            # Sesión propia: el grupo de procesos del chromedriver incluye sus Chrome
+            # y se puede matar entero al cancelar (ver cancelacion.py)
             service = Service(
                 executable_path=chromedriver_path,
-                port=port
+                port=port,
+                popen_kw={"start_new_session": True} if os.name == "posix" else {}
             )
             
             # Pequeño delay aleatorio para evitar race conditions
@@ -167,6 +186,9 @@ def configurar_driver(optimized=True):
                 service=service,
                 options=options
             )
+            if os.name == "posix" and service.process is not None:
+                driver.grupo_procesos = service.process.pid
+                registrar_grupo(driver.grupo_procesos)
 
             # Timeout implícito corto para evitar esperas infinitas si el navegador falla
             driver.set_page_load_timeout(30)
@@ -192,6 +214,125 @@ def configurar_driver(optimized=True):
                 raise
 
 
+# Página lista para extraer: algún selector presente o algún texto en el body.
+# En los VTEX el precio dentro del product-summary o la marca de "no encontrado".
+LISTO_SITIO = {
+    "carrefour": (
+        ["[class*='notFoundRow1']", "span[class*='sellingPrice']"],
+        ["No encontramos resultados para", "No hay productos que coincidan"],
+    ),
+    "vea": (
+        ["[class*='row-opss-notfound']", "article[class*='vtex-product-summary-2-x-element'] div[class*='2t-mVsKNpKjmCAEM_AMCQH']"],
+        ["No encontramos resultados"],
+    ),
+    "disco": (
+        ["[class*='row-opss-notfound']", "article[class*='vtex-product-summary-2-x-element'] div[class*='2t-mVsKNpKjmCAEM_AMCQH']"],
+        ["No encontramos resultados"],
+    ),
+}
+
+# Lo que se archiva de cada búsqueda (ver instantaneas.py): todo lo que leen los
+# buscar_precio_* de los VTEX. NINI busca dentro de un pedido abierto y no se re-extrae.
+FRAGMENTO_SITIO = {
+    "carrefour": ["article[class*='vtex-product-summary-2-x-element']", "span[class*='sellingPrice']",
+                  ".tooltipText", "[class*='notFoundRow1']"],
+    "vea": ["article[class*='vtex-product-summary-2-x-element']", "[class*='row-opss-notfound']"],
+    "disco": ["article[class*='vtex-product-summary-2-x-element']", "[class*='row-opss-notfound']"],
+}
+
+JS_PAGINA_LISTA = """
+const selectores = arguments[0], textos = arguments[1];
+if (selectores.some(s => document.querySelector(s))) return true;
+const texto = document.body ? document.body.textContent : '';
+return textos.some(t => texto.includes(t));
+"""
+
+
+def cargar_pagina(driver, url, site_name, timeout=None):
+    """
+    driver.get(url) y espera hasta que se cumpla el predicado del sitio (LISTO_SITIO);
+    en ese momento detiene el resto de la carga con window.stop().
+
+    Returns:
+        True si el predicado se cumplió, False si se agotó el timeout
+        (la extracción sigue igual, con sus propias esperas).
+
+    Raises:
+        TimeoutException: si driver.get agotó su timeout y el predicado nunca se
+        cumplió. Una página que no cargó no es un "No encontrado": el llamador
+        devuelve "Error" (no va al caché negativo y lo cuentan el circuito y el supervisor).
+    """
+    selectores, textos = LISTO_SITIO[site_name]
+    inicio = time.time()
+    timeout_carga = None
+    try:
+        with tramo("navegar", url=url):
+            driver.get(url)
+    except TimeoutException as e:
+        # Con el DOM parcial alcanza si el predicado ya se cumple
+        logging.warning(f"{site_name.upper()}: timeout de carga en {url}, se intenta extraer igual")
+        timeout_carga = e
+    try:
+        with tramo("esperar"):
+            WebDriverWait(driver, timeout or TIMEOUT_PAGINA_LISTA, poll_frequency=0.2).until(
+                lambda d: d.execute_script(JS_PAGINA_LISTA, selectores, textos)
+            )
+        listo = True
+    except TimeoutException:
+        listo = False
+    try:
+        driver.execute_script("window.stop();")
+    except Exception:
+        pass
+    if timeout_carga is not None and not listo:
+        logging.warning(f"{site_name.upper()}: la página no cargó en {url}")
+        raise timeout_carga
+    logging.debug(f"{site_name.upper()}: página {'lista' if listo else 'sin predicado'} en {time.time() - inicio:.2f}s")
+    return listo
+
+
+def crear_navegador():
+    """
+    Crea el driver de un hilo de búsqueda según NAVEGADOR_BACKEND: un Chrome propio
+    o un contexto aislado del Chromium compartido. Ambos exponen la interfaz de
+    WebDriver que usan los buscar_precio_*.
+    """
+    if NAVEGADOR_BACKEND == "contextos":
+        from navegador_contextos import NavegadorCompartido
+        return NavegadorCompartido.obtener(headless=HEADLESS).nuevo_contexto(estrategia_carga=ESTRATEGIA_CARGA)
+    return configurar_driver(optimized=True)
+
+
+def iniciar_navegador(etiqueta, intentos=2):
+    """crear_navegador() con reintentos."""
+    for attempt in range(intentos):
+        try:
+            driver = crear_navegador()
+            logging.info(f"[{etiqueta}] ✅ Driver inicializado correctamente")
+            return instrumentar_driver(driver)
+        except Exception as driver_error:
+            if attempt < intentos - 1:
+                logging.warning(f"[{etiqueta}] ⚠️ Error al iniciar driver (intento {attempt + 1}/{intentos}): {driver_error}")
+                time.sleep(2)
+            else:
+                logging.error(f"[{etiqueta}] ❌ Error fatal al iniciar driver después de {intentos} intentos: {driver_error}")
+                raise
+
+
+def preparar_sesion(driver, site_name):
+    """NINI requiere login y abrir un pedido antes de poder buscar. Devuelve False si falla."""
+    if site_name == "nini":
+        login_nini(driver)
+        return iniciar_pedido_nini(driver)
+    return True
+
+
+def paralelismo_sitio(site_name):
+    """Máximo de navegadores del sitio; cuántos se abren lo decide PLANIFICADOR según la memoria."""
+    # NINI trabaja sobre un único pedido abierto: una sola sesión
+    return 1 if site_name == "nini" else (BUSQUEDAS_PARALELAS or MAX_NAVEGADORES_SITIO)
+
+
 # =====================================================
 # NINI
 # =====================================================
@@ -367,14 +508,17 @@ def buscar_precio_nini(driver, ean):
             except Exception as e:
                 logging.debug(f"NINI [{elapsed}s]: Error buscando elementos: {e}")
 
-            time.sleep(1)
+            # Interrumpible: cancelar el escaneo no espera a que venza el timeout
+            if esperar(1):
+                return "Error", ""
 
+        # Sin respuesta no es "no existe": un "No encontrado" iría al caché negativo por días
         logging.warning(f"⌛ NINI: Timeout buscando {ean} tras {timeout}s.")
-        return "No encontrado", ""
+        return "Error", ""
 
     except Exception as e:
         logging.error(f"❌ NINI: Error fatal buscando {ean}: {e}")
-        return "No encontrado", ""
+        return "Error", ""
 
 # =====================================================
 # CARREFOUR
@@ -388,12 +532,8 @@ def buscar_precio_carrefour(driver, ean):
     try:
         logging.info(f"Buscando en CARREFOUR - EAN: {ean}")
         url = f"https://www.carrefour.com.ar/{ean}?_q={ean}&map=ft"
-        driver.get(url)
-
-        # Esperar que la página cargue completamente
-        WebDriverWait(driver, 6).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        ) 
+        # Extraer apenas aparece el producto o la marca de "no encontrado" (ver LISTO_SITIO)
+        cargar_pagina(driver, url, "carrefour")
 
         # 1. Chequeo explícito de "No encontrado"
         src = driver.page_source
@@ -477,7 +617,7 @@ def buscar_precio_carrefour(driver, ean):
     except Exception as e:
         logging.error(f"Error buscando {ean} en CARREFOUR: {e}", exc_info=True)
         print(f"❌ CARREFOUR | {ean} | Error")
-        return "No encontrado", ""
+        return "Error", ""
 
 # =====================================================
 # VEA
@@ -487,12 +627,8 @@ def buscar_precio_vea(driver, ean):
     try:
         logging.info(f"Buscando en VEA - EAN: {ean}")
         url = f"https://www.vea.com.ar/{ean}?_q={ean}&map=ft"
-        driver.get(url)
-
-        # Esperar que la página cargue completamente
-        WebDriverWait(driver, 6).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
+        # Extraer apenas aparece el producto o la marca de "no encontrado" (ver LISTO_SITIO)
+        cargar_pagina(driver, url, "vea")
 
         # 1. Chequeo explícito de "No encontrado"
         # Estrategia 1: Clase específica reportada por el usuario
@@ -594,7 +730,7 @@ def buscar_precio_vea(driver, ean):
     except Exception as e:
         logging.error(f"Error buscando {ean} en VEA: {e}", exc_info=True)
         print(f"❌ VEA | {ean} | Error")
-        return "No encontrado", "", ""
+        return "Error", "", ""
 
 # =====================================================
 # DISCO
@@ -604,12 +740,8 @@ def buscar_precio_disco(driver, ean):
     try:
         logging.info(f"Buscando en DISCO - EAN: {ean}")
         url = f"https://www.disco.com.ar/{ean}?_q={ean}&map=ft"
-        driver.get(url)
-
-        # Esperar que la página cargue completamente
-        WebDriverWait(driver, 6).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
+        # Extraer apenas aparece el producto o la marca de "no encontrado" (ver LISTO_SITIO)
+        cargar_pagina(driver, url, "disco")
 
         # 1. Chequeo explícito de "No encontrado"
         try:
@@ -700,7 +832,7 @@ def buscar_precio_disco(driver, ean):
 
     except Exception as e:
         logging.error(f"Error buscando {ean} en DISCO: {e}", exc_info=True)
-        return "No encontrado", "", ""
+        return "Error", "", ""
 
 # =====================================================
 # MENÚ INTERACTIVO PARA SELECCIÓN DE PÁGINAS
@@ -776,9 +908,113 @@ def menu_seleccion_paginas():
 # EJECUCIÓN PRINCIPAL
 # =====================================================
 
-def worker_site(site_name, df, results_dict, selection, log_queue=None, pause_event=None, product_queue=None):
+BUSCADORES = {
+    "nini": buscar_precio_nini,
+    "carrefour": buscar_precio_carrefour,
+    "vea": buscar_precio_vea,
+    "disco": buscar_precio_disco,
+}
+
+def normalizar_resultado(res):
+    """
+    Unifica lo que devuelven las funciones buscar_precio_*:
+    un string suelto o una tupla de 2 o 3 elementos -> (precio, oferta, dinamica).
+    """
+    if isinstance(res, tuple):
+        precio = res[0]
+        oferta = res[1] if len(res) > 1 else ''
+        dinamica = res[2] if len(res) > 2 else ''
+        return precio, oferta, dinamica
+    return res, '', ''
+
+def crear_resolvedores():
+    """
+    Resolvedores de la consulta rápida por EAN (ver consulta.py): los sitios VTEX
+    por HTTP y NINI con un navegador supervisado que queda abierto entre consultas.
+    """
+    from consulta import ResolvedorVTEX, ResolvedorNavegador
+    enlaces = IndiceEnlaces(ENLACES_DB) if USAR_ENLACES else None
+    resolvedores = {
+        site: ResolvedorVTEX(CatalogoVTEX(site, url, CATALOGO_DIR), enlaces)
+        for site, url in TIENDAS_VTEX.items()
+    }
+    supervisor = SupervisorDriver(
+        "NINI@consulta",
+        crear=lambda: iniciar_navegador("NINI@consulta"),
+        preparar=lambda driver: preparar_sesion(driver, "nini"),
+        plazo=PLAZO_BUSQUEDA
+    )
+    resolvedores["nini"] = ResolvedorNavegador(supervisor, BUSCADORES["nini"], normalizar_resultado)
+    return resolvedores
+
+class RecursosSitio:
+    """
+    Estado de un sitio que dura todo el escaneo, no un bloque: el circuito (un sitio
+    descartado no se vuelve a sondear en cada bloque), el caché negativo, el catálogo
+    del día, el índice de enlaces, los puntajes de prioridad y el cursor del broker.
+    Se arma una vez en run_scraper y se pasa a cada worker_site.
+
+    Args:
+        site_name: Nombre del sitio
+        usar_cache_negativo: Cargar el caché negativo del sitio (ver cache_negativo.py)
+        usar_catalogo: Cargar el catálogo del día si el sitio es VTEX (ver catalogo_vtex.py)
+        enlaces: IndiceEnlaces compartido, o None (ver enlaces.py)
+        product_queue: Cola de actualizaciones de la web app, para informar el estado del circuito
+        historial: HistorialPrecios para puntuar los EANs (ver prioridad.py), o None para no priorizar
+    """
+
+    def __init__(self, site_name, usar_cache_negativo=True, usar_catalogo=False, enlaces=None,
+                 product_queue=None, historial=None):
+        self.site_name = site_name
+        self.cache_negativo = None
+        if usar_cache_negativo:
+            self.cache_negativo = CacheNegativo(site_name, DATA_DIR, DIAS_REVERIFICAR_NEGATIVOS)
+        
+        def emitir_circuito(info):
+            if product_queue:
+                try:
+                    product_queue.put({'type': 'circuito', **info})
+                except:
+                    pass
+        
+        self.circuito = Circuito(site_name, CIRCUITO_FALLAS, CIRCUITO_ESPERA, max_sondeos=CIRCUITO_SONDEOS,
+                                 al_cambiar=emitir_circuito)
+        
+        es_vtex = site_name in TIENDAS_VTEX
+        self.enlaces = enlaces if es_vtex else None
+        # Tienda VTEX: resuelve los enlaces conocidos y, en modo catálogo, tiene el índice del día
+        self.tienda = CatalogoVTEX(site_name, TIENDAS_VTEX[site_name], CATALOGO_DIR) if es_vtex else None
+        self.catalogo = None
+        if usar_catalogo and es_vtex:
+            try:
+                self.tienda.cargar()
+                self.catalogo = self.tienda
+            except Exception as e:
+                logging.error(f"[{site_name.upper()}] 📚 No se pudo sincronizar el catálogo, se busca EAN por EAN: {e}")
+        
+        # Puntajes de volatilidad de todo el historial del sitio: no dependen del bloque
+        self.puntajes = PuntajesSitio(historial, site_name) if historial is not None else None
+        # Resultados del broker ya leídos: los de bloques anteriores no se vuelven a pedir
+        self.cursor_broker = 0
+
+    def cerrar(self):
+        if self.cache_negativo is not None:
+            try:
+                self.cache_negativo.guardar()
+            except Exception as e:
+                logging.warning(f"[{self.site_name.upper()}] No se pudo guardar el caché negativo: {e}")
+
+def worker_site(site_name, df, results_dict, selection, log_queue=None, pause_event=None, product_queue=None,
+                stats_dict=None, recursos=None, skus_pendientes=None, puntajes=None,
+                presupuesto_segundos=None, broker=None, trabajo_id=None, instantaneas=None,
+                cancelacion=None):
     """
     Worker que procesa un sitio completo en un thread separado.
+
+    Los productos a buscar se encolan y los toman hasta paralelismo_sitio() navegadores
+    (o contextos, ver NAVEGADOR_BACKEND) del sitio, tantos como permita el cupo de
+    PLANIFICADOR según la memoria disponible. Con broker, las búsquedas se
+    publican para los workers remotos y acá sólo se reciben los resultados.
     
     Args:
         site_name: Nombre del sitio ('nini', 'carrefour', 'vea', 'disco')
@@ -788,34 +1024,45 @@ def worker_site(site_name, df, results_dict, selection, log_queue=None, pause_ev
         log_queue: Cola para logs (opcional)
         pause_event: Evento para pausar/reanudar (opcional)
         product_queue: Cola para actualizaciones de productos en tiempo real (opcional)
+        stats_dict: Diccionario compartido para estadísticas por sitio (opcional)
+        recursos: RecursosSitio del escaneo (circuito, caché negativo, catálogo, enlaces).
+                  Por defecto se arman para este llamado, sin catálogo ni enlaces
+        skus_pendientes: Conjunto de SKUs a buscar en este sitio (opcional, por defecto todos)
+        puntajes: Dict {sku: probabilidad de cambio} para ordenar la búsqueda (ver prioridad.py)
+        presupuesto_segundos: Tiempo máximo de búsqueda; al agotarse se corta el recorrido
+        broker: Broker de tareas para el modo distribuido (ver broker.py), opcional
+        trabajo_id: Identificador del escaneo (en el broker y en el archivo de instantáneas)
+        instantaneas: ArchivoInstantaneas donde guardar cada búsqueda (ver instantaneas.py), opcional
+        cancelacion: TokenCancelacion del escaneo (ver cancelacion.py); al cancelar se cierran
+                     los navegadores y lo que quedaba sin buscar no se registra
     """
-    driver = None
+    if cancelacion is None:
+        cancelacion = TokenCancelacion()
+    propios = recursos is None
+    if propios:
+        recursos = RecursosSitio(site_name, product_queue=product_queue)
+    cache_negativo = recursos.cache_negativo
+    circuito = recursos.circuito
+    enlaces = recursos.enlaces
+    catalogo = recursos.catalogo
+    # Los contadores del caché y del circuito son del escaneo: las estadísticas del bloque son la diferencia
+    omitidos_previos = cache_negativo.omitidos if cache_negativo is not None else 0
+    aperturas_previas = circuito.aperturas
+    supervisores = []
+    site_results = []
+    desde_catalogo = 0
+    desde_enlace = 0
     try:
         logging.info(f"[{site_name.upper()}] 🚀 Iniciando worker thread...")
         
-        # Intentar configurar driver con retry
-        max_driver_retries = 2
-        for attempt in range(max_driver_retries):
-            try:
-                driver = configurar_driver(optimized=True)
-                logging.info(f"[{site_name.upper()}] ✅ Driver inicializado correctamente")
-                break
-            except Exception as driver_error:
-                if attempt < max_driver_retries - 1:
-                    logging.warning(f"[{site_name.upper()}] ⚠️ Error al iniciar driver (intento {attempt + 1}/{max_driver_retries}): {driver_error}")
-                    import time
-                    time.sleep(2)
-                else:
-                    logging.error(f"[{site_name.upper()}] ❌ Error fatal al iniciar driver después de {max_driver_retries} intentos: {driver_error}")
-                    raise
-        
-        
         # Función para chequear pausa
-        def check_pause():
+        def check_pause(etiqueta):
             if pause_event and not pause_event.is_set():
-                logging.info(f"[{site_name.upper()}] ⏸️ Pausado")
-                pause_event.wait()
-                logging.info(f"[{site_name.upper()}] ▶️ Reanudado")
+                logging.info(f"[{etiqueta}] ⏸️ Pausado")
+                while not pause_event.wait(0.5):
+                    if cancelacion.cancelado:
+                        return
+                logging.info(f"[{etiqueta}] ▶️ Reanudado")
         
         # Función helper para emitir actualizaciones de producto
         def emit_product_update(idx, sku, codigo, descripcion, precio, oferta="", dinamica=""):
@@ -835,163 +1082,401 @@ def worker_site(site_name, df, results_dict, selection, log_queue=None, pause_ev
                 except:
                     pass
         
-        site_results = []
+        def guardar_resultado(idx, row, precio, oferta='', dinamica='', omitido=False):
+            site_results.append({
+                'idx': idx,
+                'SKU': row['SKU'],
+                'Precio': precio,
+                'Oferta': oferta,
+                'Dinamica': dinamica,
+                'omitido': omitido
+            })
+            emit_product_update(idx, row['SKU'], row.get('codigo', ''), row.get('descripcion', ''), precio, oferta, dinamica)
         
-        # Procesar según sitio
-        if site_name == "nini":
-            login_nini(driver)
-            if iniciar_pedido_nini(driver):
-                for idx, row in df.iterrows():
-                    check_pause()
-                    # Verificar si ya tiene resultado válido
-                    if str(row.get("Precio NINI", "Pendiente")) not in ["Pendiente", "No encontrado", "Error"]:
-                        continue
-                    
-                    res = buscar_precio_nini(driver, row["SKU"])
-                    if isinstance(res, tuple):
-                        precio, oferta = res[0], res[1]
-                        site_results.append({
-                            'idx': idx,
-                            'SKU': row['SKU'],
-                            'Precio': precio,
-                            'Oferta': oferta
-                        })
-                        emit_product_update(idx, row['SKU'], row.get('codigo', ''), row.get('descripcion', ''), precio, oferta)
-                    else:
-                        site_results.append({
-                            'idx': idx,
-                            'SKU': row['SKU'],
-                            'Precio': res,
-                            'Oferta': ''
-                        })
-                        emit_product_update(idx, row['SKU'], row.get('codigo', ''), row.get('descripcion', ''), res)
-            else:
-                logging.error(f"[{site_name.upper()}] ⚠️ Falla en inicialización del pedido")
+        def registrar_busqueda(idx, row, precio, oferta, dinamica):
+            guardar_resultado(idx, row, precio, oferta, dinamica)
+            if cache_negativo is not None:
+                if precio == "No encontrado" and not oferta:
+                    cache_negativo.registrar(row["SKU"])
+                elif precio != "Error":
+                    cache_negativo.descartar(row["SKU"])
         
-        elif site_name == "carrefour":
-            for idx, row in df.iterrows():
-                check_pause()
-                if str(row.get("Precio CARREFOUR", "Pendiente")) not in ["Pendiente", "No encontrado", "Error"]:
-                    continue
-                
-                res = buscar_precio_carrefour(driver, row["SKU"])
-                if isinstance(res, tuple):
-                    precio, oferta = res[0], res[1]
-                    site_results.append({
-                        'idx': idx,
-                        'SKU': row['SKU'],
-                        'Precio': precio,
-                        'Oferta': oferta
-                    })
-                    emit_product_update(idx, row['SKU'], row.get('codigo', ''), row.get('descripcion', ''), precio, oferta)
-                else:
-                    site_results.append({
-                        'idx': idx,
-                        'SKU': row['SKU'],
-                        'Precio': res,
-                        'Oferta': ''
-                    })
-                    emit_product_update(idx, row['SKU'], row.get('codigo', ''), row.get('descripcion', ''), res)
+        def aprender_enlace(driver, sku, precio):
+            if enlaces is not None and precio not in ("No encontrado", "Error"):
+                try:
+                    enlaces.aprender(site_name, sku, capturar_enlace(driver))
+                except Exception as e:
+                    logging.debug(f"[{site_name.upper()}] No se pudo guardar el enlace de {sku}: {e}")
         
-        elif site_name == "vea":
-            for idx, row in df.iterrows():
-                check_pause()
-                if str(row.get("Precio VEA", "Pendiente")) not in ["Pendiente", "No encontrado", "Error"]:
-                    continue
-                
-                res = buscar_precio_vea(driver, row["SKU"])
-                if isinstance(res, tuple):
-                    precio, oferta, dinamica = res[0], res[1], res[2] if len(res) > 2 else ''
-                    site_results.append({
-                        'idx': idx,
-                        'SKU': row['SKU'],
-                        'Precio': precio,
-                        'Oferta': oferta,
-                        'Dinamica': dinamica
-                    })
-                    emit_product_update(idx, row['SKU'], row.get('codigo', ''), row.get('descripcion', ''), precio, oferta, dinamica)
-                else:
-                    site_results.append({
-                        'idx': idx,
-                        'SKU': row['SKU'],
-                        'Precio': res,
-                        'Oferta': '',
-                        'Dinamica': ''
-                    })
-                    emit_product_update(idx, row['SKU'], row.get('codigo', ''), row.get('descripcion', ''), res)
+        buscar_precio = BUSCADORES[site_name]
+        col_precio = f"Precio {site_name.upper()}"
         
-        elif site_name == "disco":
-            for idx, row in df.iterrows():
-                check_pause()
-                if str(row.get("Precio DISCO", "Pendiente")) not in ["Pendiente", "No encontrado", "Error"]:
+        # Con puntajes, buscar primero los productos con más probabilidad de haber cambiado
+        filas = df
+        if puntajes:
+            orden = sorted(df.index, key=lambda i: -puntajes.get(str(df.at[i, 'SKU']).strip(), 1.0))
+            filas = df.loc[orden]
+        
+        # Encolar lo que hay que buscar; lo ya resuelto o conocido como inexistente no necesita navegador
+        tareas = queue.Queue()
+        conocidos = enlaces.obtener(site_name, df['SKU']) if enlaces is not None else {}
+        por_enlace = []
+        for idx, row in filas.iterrows():
+            # Verificar si ya tiene resultado válido
+            if str(row.get(col_precio, "Pendiente")) not in ["Pendiente", "No encontrado", "Error"]:
+                continue
+            if skus_pendientes is not None and str(row["SKU"]).strip() not in skus_pendientes:
+                continue
+            # Modo catálogo: los EANs del índice del día se resuelven sin navegador
+            if catalogo is not None:
+                resultado = catalogo.resultado(row["SKU"])
+                if resultado is None and CATALOGO_FALTANTES == "no_encontrado":
+                    resultado = ("No encontrado", "", "")
+                if resultado is not None:
+                    registrar_busqueda(idx, row, *resultado)
+                    desde_catalogo += 1
                     continue
-                
+            if cache_negativo is not None and cache_negativo.contiene(row["SKU"]):
+                logging.info(f"[{site_name.upper()}] ⏭️ {row['SKU']} omitido: conocido como inexistente")
+                guardar_resultado(idx, row, "No encontrado", omitido=True)
+                continue
+            if str(row["SKU"]).strip() in conocidos:
+                por_enlace.append((idx, row, conocidos[str(row["SKU"]).strip()]))
+                continue
+            tareas.put((idx, row))
+        
+        # EANs con enlace conocido: se piden directo a la API del producto; los
+        # enlaces rotos (o los errores de red) vuelven a la búsqueda con navegador
+        if por_enlace:
+            tienda = recursos.tienda
+            
+            def resolver_por_enlace(item):
+                idx, row, ruta = item
                 try:
-                    res = buscar_precio_disco(driver, row["SKU"])
-                    if isinstance(res, tuple):
-                        precio, oferta, dinamica = res[0], res[1], res[2] if len(res) > 2 else ''
-                        site_results.append({
-                            'idx': idx,
-                            'SKU': row['SKU'],
-                            'Precio': precio,
-                            'Oferta': oferta,
-                            'Dinamica': dinamica
-                        })
-                        emit_product_update(idx, row['SKU'], row.get('codigo', ''), row.get('descripcion', ''), precio, oferta, dinamica)
-                    else:
-                        site_results.append({
-                            'idx': idx,
-                            'SKU': row['SKU'],
-                            'Precio': res,
-                            'Oferta': '',
-                            'Dinamica': ''
-                        })
-                        emit_product_update(idx, row['SKU'], row.get('codigo', ''), row.get('descripcion', ''), res)
+                    cancelacion.verificar()
+                    return item, tienda.resultado_por_enlace(ruta, row["SKU"]), None
                 except Exception as e:
-                    error_msg = str(e).lower()
-                    if "tab crashed" in error_msg or "session deleted" in error_msg:
-                        logging.error(f"[{site_name.upper()}] ⚠️ Navegador crasheó. Reiniciando...")
-                        try:
-                            driver.quit()
-                        except:
-                            pass
-                        driver = configurar_driver(optimized=True)
-                        site_results.append({
-                            'idx': idx,
-                            'SKU': row['SKU'],
-                            'Precio': 'Error',
-                            'Oferta': '',
-                            'Dinamica': ''
-                        })
+                    return item, None, e
+            
+            with ThreadPoolExecutor(max_workers=HILOS_ENLACES or hilos_http(),
+                                    thread_name_prefix=f"Enlaces-{site_name}") as ejecutor:
+                for (idx, row, ruta), resultado, error in ejecutor.map(resolver_por_enlace, por_enlace):
+                    if resultado is not None:
+                        registrar_busqueda(idx, row, *resultado)
+                        desde_enlace += 1
+                        continue
+                    if error is None:
+                        enlaces.olvidar(site_name, row["SKU"])
                     else:
-                        logging.error(f"[{site_name.upper()}] Error procesando {row['SKU']}: {e}")
-                        site_results.append({
-                            'idx': idx,
-                            'SKU': row['SKU'],
-                            'Precio': 'No encontrado',
-                            'Oferta': '',
-                            'Dinamica': ''
-                        })
+                        logging.debug(f"[{site_name.upper()}] 🔗 {row['SKU']}: {error}")
+                    tareas.put((idx, row))
+            logging.info(f"[{site_name.upper()}] 🔗 {desde_enlace}/{len(por_enlace)} EANs resueltos por enlace conocido")
+        
+        inicio_busqueda = time.time()
+        presupuesto_agotado = threading.Event()
+        n_navegadores = min(paralelismo_sitio(site_name), tareas.qsize())
+        
+        def buscar_con_navegador(n):
+            """Toma productos de la cola hasta vaciarla, con su propio navegador y sesión."""
+            etiqueta = site_name.upper() if n_navegadores == 1 else f"{site_name.upper()}#{n + 1}"
+            supervisor = SupervisorDriver(
+                etiqueta,
+                crear=lambda: iniciar_navegador(etiqueta),
+                preparar=lambda driver: preparar_sesion(driver, site_name),
+                plazo=PLAZO_BUSQUEDA,
+                cancelacion=cancelacion
+            )
+            supervisores.append(supervisor)
+            contado = False
+            
+            def contar_navegador():
+                """Informa al planificador si este hilo tiene un navegador abierto."""
+                nonlocal contado
+                if supervisor.listo() != contado:
+                    contado = supervisor.listo()
+                    (PLANIFICADOR.abierto if contado else PLANIFICADOR.cerrado)(site_name)
+            
+            try:
+                while not tareas.empty():
+                    check_pause(etiqueta)
+                    if cancelacion.cancelado:
+                        return
+                    if presupuesto_segundos and time.time() - inicio_busqueda > presupuesto_segundos:
+                        presupuesto_agotado.set()
+                        return
+                    
+                    # Fuera del cupo (presión de memoria): soltar el navegador hasta que vuelva a haber lugar
+                    contar_navegador()
+                    if n >= PLANIFICADOR.cupo(site_name):
+                        if supervisor.listo():
+                            logging.info(f"[{etiqueta}] 🧮 Fuera del cupo de navegadores: se cierra y espera")
+                            supervisor.cerrar()
+                            contar_navegador()
+                        cancelacion.esperar(1)
+                        continue
+                    
+                    # Circuito abierto: las búsquedas quedan estacionadas hasta la próxima prueba
+                    decision = circuito.permitir()
+                    if decision == ESPERAR:
+                        cancelacion.esperar(1)
+                        continue
+                    if decision == DESCARTAR:
+                        try:
+                            idx, row = tareas.get_nowait()
+                        except queue.Empty:
+                            return
+                        guardar_resultado(idx, row, 'Error')
+                        continue
+                    
+                    if not supervisor.listo():
+                        try:
+                            supervisor.iniciar()
+                            contar_navegador()
+                        except SesionNoIniciada as e:
+                            logging.error(f"[{etiqueta}] ⚠️ {e}")
+                            circuito.falla("sesión no iniciada")
+                            continue
+                    
+                    try:
+                        idx, row = tareas.get_nowait()
+                    except queue.Empty:
+                        return
+                    
+                    try:
+                        # Línea de tiempo del EAN si el escaneo se perfila (ver perfilado.py)
+                        with tramo(f"EAN {row['SKU']}", sitio=site_name) as t:
+                            precio, oferta, dinamica = normalizar_resultado(supervisor.ejecutar(buscar_precio, row["SKU"]))
+                            # Una página de bloqueo no es un "No encontrado": no debe ir al caché negativo
+                            bloqueo = detectar_bloqueo(supervisor.driver) if precio in ("No encontrado", "Error") else None
+                            with tramo("emitir"):
+                                if bloqueo:
+                                    logging.warning(f"[{etiqueta}] 🚫 {row['SKU']}: {bloqueo}")
+                                    precio, oferta, dinamica = 'Error', '', ''
+                                else:
+                                    aprender_enlace(supervisor.driver, row["SKU"], precio)
+                                    if instantaneas is not None and site_name in FRAGMENTO_SITIO:
+                                        archivar(instantaneas, supervisor.driver, trabajo_id, site_name, row["SKU"], idx,
+                                                 FRAGMENTO_SITIO[site_name], (precio, oferta, dinamica))
+                                registrar_busqueda(idx, row, precio, oferta, dinamica)
+                            if t.args is not None:
+                                t.args['precio'] = str(precio)
+                        if precio == 'Error':
+                            circuito.falla(bloqueo or "error en la búsqueda")
+                        else:
+                            circuito.exito()
+                    except Cancelado:
+                        # El navegador se mató a mitad de la búsqueda: el producto queda sin buscar
+                        tareas.put((idx, row))
+                        return
+                    except Exception as e:
+                        logging.error(f"[{etiqueta}] Error procesando {row['SKU']}: {e}")
+                        guardar_resultado(idx, row, 'Error')
+                        circuito.falla(str(e).splitlines()[0][:80] if str(e) else type(e).__name__)
+            except Cancelado:
+                pass
+            except Exception as e:
+                logging.error(f"[{etiqueta}] ❌ Error crítico en navegador: {e}", exc_info=True)
+            finally:
+                supervisor.cerrar()
+                contar_navegador()
+        
+        def coordinar_remoto():
+            """Publica la cola en el broker y recibe los resultados de los workers. Devuelve cuántos quedaron sin buscar."""
+            filas_por_idx = {}
+            while not tareas.empty():
+                idx, row = tareas.get_nowait()
+                filas_por_idx[idx] = row
+            broker.publicar(trabajo_id, site_name, [(idx, row['SKU']) for idx, row in filas_por_idx.items()])
+            logging.info(f"[{site_name.upper()}] 📮 {len(filas_por_idx)} búsquedas publicadas en el broker")
+            
+            recibidos = set()
+            # Los resultados del broker se acumulan por (trabajo, sitio) durante todo el escaneo
+            cursor = recursos.cursor_broker
+            ultimo_progreso = time.time()
+            while len(recibidos) < len(filas_por_idx):
+                if pause_event and not pause_event.is_set():
+                    broker.pausar(trabajo_id, True)
+                    check_pause(site_name.upper())
+                    broker.pausar(trabajo_id, False)
+                if cancelacion.cancelado:
+                    broker.cancelar(trabajo_id, site_name)
+                    break
+                if presupuesto_segundos and time.time() - inicio_busqueda > presupuesto_segundos:
+                    broker.cancelar(trabajo_id, site_name)
+                    presupuesto_agotado.set()
+                    break
+                
+                nuevos, cursor = broker.resultados(trabajo_id, site_name, cursor)
+                recursos.cursor_broker = cursor
+                for idx, _, resultado in nuevos:
+                    if idx in recibidos or idx not in filas_por_idx:
+                        continue
+                    recibidos.add(idx)
+                    registrar_busqueda(idx, filas_por_idx[idx], resultado['precio'],
+                                       resultado.get('oferta', ''), resultado.get('dinamica', ''))
+                if nuevos:
+                    ultimo_progreso = time.time()
+                    continue
+                if time.time() - ultimo_progreso > ESPERA_SIN_TRABAJADORES and not broker.trabajadores_activos():
+                    logging.warning(f"[{site_name.upper()}] 📮 Sin workers activos: {len(filas_por_idx) - len(recibidos)} búsquedas esperando")
+                    ultimo_progreso = time.time()
+                cancelacion.esperar(1)
+            return len(filas_por_idx) - len(recibidos)
+        
+        if broker is not None:
+            sin_buscar = coordinar_remoto()
+        elif n_navegadores > 0:
+            # Un hilo por navegador posible; los que quedan fuera del cupo esperan sin navegador
+            PLANIFICADOR.registrar(site_name, n_navegadores)
+            try:
+                if n_navegadores == 1:
+                    buscar_con_navegador(0)
+                else:
+                    logging.info(f"[{site_name.upper()}] 🌐 Hasta {n_navegadores} búsquedas en paralelo ({NAVEGADOR_BACKEND}), "
+                                 f"{PLANIFICADOR.cupo(site_name)} según la capacidad actual")
+                    hilos = [
+                        threading.Thread(target=buscar_con_navegador, args=(n,), name=f"Worker-{site_name}-{n + 1}")
+                        for n in range(n_navegadores)
+                    ]
+                    for hilo in hilos:
+                        hilo.start()
+                    for hilo in hilos:
+                        hilo.join()
+            finally:
+                PLANIFICADOR.retirar(site_name)
+        
+        if cancelacion.cancelado:
+            if broker is None:
+                sin_buscar = tareas.qsize()
+            logging.warning(f"[{site_name.upper()}] 🛑 Cancelado: {sin_buscar} productos quedan sin buscar")
+        elif presupuesto_agotado.is_set():
+            if broker is None:
+                sin_buscar = tareas.qsize()
+            logging.warning(f"[{site_name.upper()}] ⏱️ Presupuesto de {presupuesto_segundos:.0f}s agotado: "
+                            f"{sin_buscar} productos quedan sin buscar")
         
         results_dict[site_name] = site_results
-        logging.info(f"[{site_name.upper()}] ✅ Worker finalizado - {len(site_results)} productos procesados")
+        omitidos = cache_negativo.omitidos - omitidos_previos if cache_negativo is not None else 0
+        logging.info(f"[{site_name.upper()}] ✅ Worker finalizado - {len(site_results)} productos procesados "
+                     f"({omitidos} omitidos por caché negativo, {desde_catalogo} desde el catálogo, "
+                     f"{desde_enlace} por enlace conocido)")
         
     except Exception as e:
         logging.error(f"[{site_name.upper()}] ❌ Error crítico en worker: {e}", exc_info=True)
         results_dict[site_name] = []
     finally:
-        if driver:
-            try:
-                driver.quit()
-                logging.info(f"[{site_name.upper()}] Navegador cerrado")
-            except:
-                pass
+        if stats_dict is not None:
+            stats_dict[site_name] = {
+                'procesados': len(site_results),
+                'omitidos_negativos': cache_negativo.omitidos - omitidos_previos if cache_negativo is not None else 0,
+                'desde_catalogo': desde_catalogo,
+                'desde_enlace': desde_enlace,
+                'aperturas_circuito': circuito.aperturas - aperturas_previas,
+                'reinicios_driver': sum(sup.reinicios for sup in supervisores),
+                'tiempo_perdido': sum(sup.tiempo_perdido for sup in supervisores),
+                'estado_circuito': circuito.estado
+            }
+        if propios:
+            recursos.cerrar()
+
+def registrar_historial(df, results_dict, historial, ts=None):
+    """
+    Agrega al historial las observaciones de este escaneo (sólo las búsquedas reales,
+    no las omitidas por caché negativo). Usa las columnas numéricas de precios.py.
 
-def run_scraper(selection, log_queue=None, input_df=None, ignore_cache=False, pause_event=None, product_queue=None):
+    Args:
+        historial: HistorialPrecios, o la EscrituraHistorial del escaneo
+    """
+    for site_name, site_results in results_dict.items():
+        col_num = f"Precio Num {site_name.upper()}"
+        observaciones = []
+        for result in site_results:
+            if result.get('omitido'):
+                continue
+            centavos = df.at[result['idx'], col_num] if col_num in df.columns else None
+            oferta = " | ".join(t for t in (str(result['Oferta']), str(result.get('Dinamica', ''))) if t)
+            observaciones.append((result['SKU'], codificar_precio(centavos, result['Precio']), oferta))
+        guardadas = historial.agregar(site_name, observaciones, ts)
+        logging.info(f"🗂️ [{site_name.upper()}] {guardadas} observaciones agregadas al historial")
+
+def cargar_similares(sitios):
+    """
+    Índices de nombres del catálogo del día de cada sitio VTEX (ver similares.py).
+    Devuelve {sitio: (catalogo, indice)}; los sitios cuyo catálogo no se pudo cargar se omiten.
+    """
+    similares = {}
+    for site_name in sitios:
+        try:
+            catalogo = CatalogoVTEX(site_name, TIENDAS_VTEX[site_name], CATALOGO_DIR)
+            catalogo.cargar()
+            indice = IndiceSimilares((ean, nombre_entrada(e)) for ean, e in catalogo.indice.items())
+        except Exception as e:
+            logging.error(f"[{site_name.upper()}] 🔎 Sin coincidencias por descripción: {e}")
+            continue
+        if not len(indice):
+            # Índice guardado antes de que el catálogo incluyera los nombres
+            logging.warning(f"[{site_name.upper()}] 🔎 El catálogo de hoy no tiene nombres de productos: "
+                            f"sin coincidencias por descripción hasta la próxima sincronización")
+            continue
+        similares[site_name] = (catalogo, indice)
+    return similares
+
+def completar_similares(df, similares):
+    """
+    Para los "No encontrado" de cada sitio, el producto del catálogo con la descripción
+    más parecida, en la columna "Similar <SITIO>": "similitud · nombre · EAN · precio".
+    El precio del EAN no se toca: la coincidencia es una sugerencia a revisar.
+    """
+    if 'descripcion' not in df.columns:
+        return df
+    for site_name, (catalogo, indice) in similares.items():
+        col_precio = f"Precio {site_name.upper()}"
+        col_similar = f"Similar {site_name.upper()}"
+        df[col_similar] = ""
+        encontrados = 0
+        for idx in df.index[df[col_precio].astype(str) == "No encontrado"]:
+            descripcion = str(df.at[idx, 'descripcion'] or "")
+            coincidencias = indice.buscar(descripcion, limite=1, umbral=UMBRAL_SIMILITUD)
+            if not coincidencias:
+                continue
+            similitud, ean, nombre = coincidencias[0]
+            precio, oferta, _ = formatear_resultado(site_name, catalogo.indice[ean])
+            df.at[idx, col_similar] = " · ".join(
+                t for t in (f"{similitud:.2f}", nombre, f"EAN {ean}", precio, oferta) if t
+            )
+            encontrados += 1
+        if encontrados:
+            logging.info(f"[{site_name.upper()}] 🔎 {encontrados} productos no encontrados por EAN "
+                         f"tienen un similar por descripción")
+    return df
+
+def bloques_entrada(input_df=None, planilla=None, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Recorre la entrada del escaneo de a bloques de filas.
+
+    La planilla subida se lee por bloques del disco (ver ingesta.iterar_planilla);
+    un DataFrame ya cargado o el INPUT_FILE de la CLI se cortan en bloques.
+    """
+    if input_df is None and planilla is not None:
+        yield from iterar_planilla(planilla, tamano_bloque)
+        return
+    if input_df is None:
+        input_df = pd.read_excel(INPUT_FILE, dtype={"SKU": str})
+    for inicio in range(0, len(input_df), tamano_bloque):
+        yield input_df.iloc[inicio:inicio + tamano_bloque].copy()
+
+def run_scraper(selection, log_queue=None, input_df=None, ignore_cache=False, pause_event=None, product_queue=None,
+                usar_cache_negativo=True, planilla=None, pendientes=None, output_file=None,
+                priorizar=False, presupuesto_segundos=None, usar_catalogo=None, usar_enlaces=None,
+                cancelacion=None, perfilar=False):
     """
     Función principal para ejecutar el scraper.
     Puede ser llamada desde la CLI o desde la web app.
-    
+
+    La entrada se procesa de a TAMANO_BLOQUE filas (ver bloques_entrada y
+    resultados.py): cada bloque se busca en todos los sitios, se escribe y se
+    libera antes de leer el siguiente.
+
     Args:
         selection (dict): Diccionario con las páginas a buscar
                           {'nini': bool, 'carrefour': bool, ...}
@@ -1001,18 +1486,54 @@ def run_scraper(selection, log_queue=None, input_df=None, ignore_cache=False, pa
         ignore_cache (bool): Si es True, no lée el archivo de salida existente.
         pause_event (threading.Event, optional): Evento para pausar/reanudar.
         product_queue (Queue, optional): Cola para enviar actualizaciones de productos en tiempo real.
+        usar_cache_negativo (bool): Si es True, saltea los EANs que cada sitio ya sabemos que no tiene.
+        planilla (Planilla, optional): Planilla subida y validada (ver ingesta.py).
+                                       Se parsea acá, fuera del thread del request.
+        pendientes (dict, optional): {sitio: set(SKUs)} a buscar por sitio; el resto se saltea.
+                                     Lo usan los escaneos programados (ver programador.py).
+        output_file (str, optional): Archivo de resultados. Por defecto OUTPUT_FILE.
+        priorizar (bool): Si es True, cada sitio busca primero los EANs más volátiles según el historial.
+                          Con presupuesto el orden es el de todo el escaneo (ver buscar_por_prioridad).
+        presupuesto_segundos (float, optional): Tiempo máximo de búsqueda por sitio.
+        usar_catalogo (bool, optional): Cruzar los sitios VTEX contra su catálogo del día.
+                                        Por defecto MODO_CATALOGO.
+        usar_enlaces (bool, optional): Resolver por su enlace los EANs ya encontrados en los sitios VTEX.
+                                       Por defecto USAR_ENLACES.
+        cancelacion (TokenCancelacion, optional): Al cancelarlo se cierran los navegadores enseguida
+                                                  y se guarda lo encontrado hasta ese momento.
+        perfilar (bool): Si es True, guarda un flame graph y una traza por EAN del escaneo
+                         en PERFILES_DIR/<trabajo_id>/ (ver perfilado.py).
     """
+    if cancelacion is None:
+        cancelacion = TokenCancelacion()
     
     def check_pause():
         if pause_event and not pause_event.is_set():
             logging.info("⏸️ Scraper pausado. Esperando reanudación...")
-            pause_event.wait()
+            while not pause_event.wait(0.5):
+                if cancelacion.cancelado:
+                    return
             logging.info("▶️ Scraper reanudado.")
     
-    # El logging se configura ahora centralizadamente en app.py para la web app
-    # o via basicConfig en la CLI. No agregamos handlers aqui para evitar duplicados.
+    # El logging se configura en cada punto de entrada (ver configurar_logging).
+    # No agregamos handlers aqui para evitar duplicados.
+    
+    output_file = output_file or OUTPUT_FILE
+    if usar_catalogo is None:
+        usar_catalogo = MODO_CATALOGO
+    if usar_enlaces is None:
+        usar_enlaces = USAR_ENLACES
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
     
     driver = None
+    broker = None
+    trabajo_id = None
+    anteriores = None
+    salida = None
+    exportacion = None
+    perfilador = None
+    recursos = {}
+    escritura_historial = None
     try:
         logging.info("Inicio del script de scraping")
         logging.info(f"Páginas seleccionadas: {selection}")
@@ -1024,11 +1545,26 @@ def run_scraper(selection, log_queue=None, input_df=None, ignore_cache=False, pa
         buscar_vea = selection.get("vea", False)
         buscar_disco = selection.get("disco", False)
 
-        df = None
+        # Crear lista de sitios a procesar
+        sites_to_scrape = []
+        if buscar_nini:
+            sites_to_scrape.append("nini")
+        if buscar_carrefour:
+            sites_to_scrape.append("carrefour")
+        if buscar_vea:
+            sites_to_scrape.append("vea")
+        if buscar_disco:
+            sites_to_scrape.append("disco")
+        
+        if not sites_to_scrape:
+            logging.warning("⚠️ No se seleccionó ningún sitio para scraping")
+            logging.info("STOP_SIGNAL")
+            return
         
         if input_df is not None:
              logging.info("Usando datos del archivo CSV subido")
-             df = input_df
+        elif planilla is not None:
+             logging.info(f"Leyendo planilla subida ({planilla.formato}) por bloques de {TAMANO_BLOQUE} filas...")
         else:
             logging.info(f"Leyendo archivo de entrada: {INPUT_FILE}")
             # Verificar si existe el archivo de entrada antes de leer
@@ -1037,151 +1573,366 @@ def run_scraper(selection, log_queue=None, input_df=None, ignore_cache=False, pa
                  logging.critical(msg)
                  if log_queue: logging.critical("STOP_SIGNAL")
                  return
-            df = pd.read_excel(INPUT_FILE, dtype={"SKU": str})
-
-        # Loguear primeros 5 SKUs para que el usuario verifique
-        if df is not None:
-             first_skus = df['SKU'].head(5).tolist()
-             logging.info(f"Cargados {len(df)} productos. Primeros SKUs: {first_skus}")
-
-        if not ignore_cache and os.path.exists(OUTPUT_FILE):
-            logging.info(f"Leyendo archivo de salida existente: {OUTPUT_FILE}")
-            df_old = pd.read_excel(OUTPUT_FILE, dtype={"SKU": str})
-            df = df.merge(df_old, on="SKU", how="left", suffixes=("", "_old"))
-
-            for col in ["Precio NINI", "Oferta NINI", "Precio CARREFOUR", "Oferta CARREFOUR", "Precio VEA", "Oferta VEA", "Dinamica VEA", "Precio DISCO", "Oferta DISCO", "Dinamica DISCO"]:
-                if f"{col}_old" in df.columns:
-                    df[col] = df[f"{col}_old"]
-
-            df = df[df.columns.drop(list(df.filter(regex="_old")))]
+        
+        # Resultados anteriores: se consultan por SKU bloque a bloque, sin cargarlos enteros
+        if not ignore_cache and os.path.exists(output_file):
+            logging.info(f"Leyendo archivo de salida existente: {output_file}")
+            anteriores = ResultadosAnteriores(output_file)
+            logging.info(f"{anteriores.filas} resultados anteriores indexados")
+        elif ignore_cache and os.path.exists(output_file):
+            logging.info("Ignorando archivo de salida existente (Force Rescan).")
         else:
-            if ignore_cache and os.path.exists(OUTPUT_FILE):
-                logging.info("Ignorando archivo de salida existente (Force Rescan).")
-            else:
-                logging.info("Creando nuevo archivo de resultados")
-            
-            # Inicializar columnas por defecto
-            for col in ["Precio NINI", "Oferta NINI", "Precio CARREFOUR", "Oferta CARREFOUR", "Precio VEA", "Oferta VEA", "Dinamica VEA", "Precio DISCO", "Oferta DISCO", "Dinamica DISCO"]:
-                 if col not in df.columns:
-                      df[col] = "Pendiente"
-            
-            # Asegurar que no haya NaNs en las columnas de precio si el DF venía con ellas
-            for col in ["Precio NINI", "Precio CARREFOUR", "Oferta CARREFOUR", "Precio VEA", "Oferta VEA", "Dinamica VEA", "Precio DISCO", "Oferta DISCO", "Dinamica DISCO"]:
-                 df[col] = df[col].fillna("Pendiente")
-
-        # Guardar resultados finales
-        df.to_excel(OUTPUT_FILE, index=False)
+            logging.info("Creando nuevo archivo de resultados")
+        
+        salida = EscritorResultados(output_file)
+        # Generar xlsx/csv/parquet para /download a medida que se escriben los bloques
+        if output_file == OUTPUT_FILE:
+            exportacion = ExportacionIncremental(EXPORT_DIR)
 
         # ===================================================================
         # IMPLEMENTACIÓN PARALELA - FASE 1
         # ===================================================================
         
-        import threading
-        
-        buscar_nini = selection.get("nini", False)
-        buscar_carrefour = selection.get("carrefour", False)
-        buscar_vea = selection.get("vea", False)
-        buscar_disco = selection.get("disco", False)
-
-        # Preparar estructura de resultados compartida (thread-safe para escritura por keys únicas)
-        results_dict = {}
-        threads = []
-        
-        # Crear lista de sitios a procesar
-        sites_to_scrape = []
-        if buscar_nini:
-            sites_to_scrape.append("nini")
-        if buscar_carrefour:
-            sites_to_scrape.append("carrefour")
-        if buscar_vea:
-            sites_to_scrape.append("vea")
-        if buscar_disco:
-            sites_to_scrape.append("disco")
-        
-        if not sites_to_scrape:
-            logging.warning("⚠️ No se seleccionó ningún sitio para scraping")
-            logging.info("STOP_SIGNAL")
-            return
-        
         logging.info(f"🚀 Iniciando scraping PARALELO en {len(sites_to_scrape)} sitios: {sites_to_scrape}")
         logging.info("=" * 60)
         
-        # Enviar lista inicial de productos al frontend
-        if product_queue:
-            for idx, row in df.iterrows():
-                try:
-                    product_queue.put({
-                        'type': 'init',
-                        'index': int(idx),
-                        'sku': str(row['SKU']),
-                        'codigo': str(row.get('codigo', '')),
-                        'descripcion': str(row.get('descripcion', ''))
-                    })
-                except:
-                    pass
+        historial = HistorialPrecios(HISTORIAL_DIR)
+        # Las observaciones del escaneo se fusionan en el historial al final, no por bloque
+        escritura_historial = EscrituraHistorial(historial)
         
-        # Lanzar threads (uno por sitio)
+        # Estado por sitio de todo el escaneo: circuito, caché negativo, catálogo del día,
+        # enlaces y puntajes se arman una vez y sirven a todos los bloques
+        enlaces = None
+        if usar_enlaces and any(s in TIENDAS_VTEX for s in sites_to_scrape):
+            try:
+                enlaces = IndiceEnlaces(ENLACES_DB)
+            except Exception as e:
+                logging.warning(f"🔗 Índice de enlaces no disponible: {e}")
         for site_name in sites_to_scrape:
-            thread = threading.Thread(
-                target=worker_site,
-                args=(site_name, df, results_dict, selection, log_queue, pause_event, product_queue),
-                name=f"Worker-{site_name.upper()}"
+            recursos[site_name] = RecursosSitio(
+                site_name, usar_cache_negativo=usar_cache_negativo, usar_catalogo=usar_catalogo,
+                enlaces=enlaces, product_queue=product_queue, historial=historial if priorizar else None
             )
-            threads.append(thread)
-            thread.start()
-            logging.info(f"✅ [{site_name.upper()}] Thread lanzado")
         
-        # Esperar a que todos terminen
-        logging.info("⏳ Esperando finalización de todos los workers...")
-        for thread in threads:
-            thread.join()
-            logging.info(f"✅ [{thread.name}] Thread completado")
+        # Coincidencias por descripción para los EANs que los sitios VTEX no tienen
+        similares = {}
+        if BUSQUEDA_SIMILARES:
+            similares = cargar_similares([s for s in sites_to_scrape if s in TIENDAS_VTEX])
         
-        logging.info("=" * 60)
-        logging.info("📊 Consolidando resultados de todos los sitios...")
+        # Identificador del escaneo: ordena el archivo de instantáneas y las tareas del broker
+        import uuid
+        trabajo_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        if perfilar:
+            perfilador = Perfilador(PERFILES_DIR, trabajo_id, PERFIL_INTERVALO_MS / 1000)
+            if not perfilador.iniciar():
+                perfilador = None
+        instantaneas = ArchivoInstantaneas(INSTANTANEAS_DIR) if ARCHIVAR_INSTANTANEAS else None
+        if instantaneas is not None:
+            logging.info(f"🗃️ Archivando instantáneas del escaneo {trabajo_id} en {INSTANTANEAS_DIR}")
+        
+        # Modo distribuido: los threads por sitio sólo coordinan (ver broker.py)
+        if BROKER_URL:
+            broker = crear_broker(BROKER_URL)
+            logging.info(f"📮 Modo distribuido: escaneo {trabajo_id} vía {BROKER_URL} "
+                         f"({len(broker.trabajadores_activos())} workers activos)")
+        
+        def bloques_indexados():
+            """Bloques de la entrada con el índice global: lo usan el frontend, el broker y las instantáneas."""
+            total = 0
+            for df in bloques_entrada(input_df, planilla):
+                df.index = range(total, total + len(df))
+                total += len(df)
+                yield df
+        
+        def emitir_productos(df):
+            """Envía los productos del bloque al frontend."""
+            if product_queue:
+                for idx, row in df.iterrows():
+                    try:
+                        product_queue.put({
+                            'type': 'init',
+                            'index': int(idx),
+                            'sku': str(row['SKU']),
+                            'codigo': str(row.get('codigo', '')),
+                            'descripcion': str(row.get('descripcion', ''))
+                        })
+                    except:
+                        pass
+        
+        def buscar(dfs, puntajes_por_sitio, presupuesto, results_dict, stats_dict):
+            """Busca cada dfs[sitio] en su sitio, un thread por sitio, y espera a que terminen."""
+            threads = []
+            for site_name, df in dfs.items():
+                thread = threading.Thread(
+                    target=worker_site,
+                    args=(site_name, df, results_dict, selection, log_queue, pause_event, product_queue,
+                          stats_dict, recursos[site_name]),
+                    kwargs={
+                        'skus_pendientes': pendientes.get(site_name) if pendientes is not None else None,
+                        'puntajes': puntajes_por_sitio.get(site_name),
+                        'presupuesto_segundos': presupuesto,
+                        'broker': broker,
+                        'trabajo_id': trabajo_id,
+                        'instantaneas': instantaneas,
+                        'cancelacion': cancelacion
+                    },
+                    name=f"Worker-{site_name.upper()}"
+                )
+                threads.append(thread)
+                thread.start()
+                logging.info(f"✅ [{site_name.upper()}] Thread lanzado")
+            
+            # Esperar a que todos terminen
+            logging.info("⏳ Esperando finalización de todos los workers...")
+            for thread in threads:
+                thread.join()
+                logging.info(f"✅ [{thread.name}] Thread completado")
+        
+        stats_totales = {}
+        
+        def acumular_stats(stats_dict):
+            for site_name, stats in stats_dict.items():
+                acumulado = stats_totales.setdefault(site_name, dict.fromkeys(stats, 0))
+                for clave, valor in stats.items():
+                    acumulado[clave] = valor if clave == 'estado_circuito' else acumulado[clave] + valor
+        
+        def buscar_por_prioridad():
+            """
+            Con presupuesto, el orden de búsqueda es el de todo el escaneo y no el de
+            cada bloque: si no, al agotarse el presupuesto quedarían sin buscar EANs
+            volátiles de los últimos bloques mientras se buscaron los estables de los
+            primeros.
+
+            Se puntúan las filas pendientes de toda la entrada, se ordenan por sitio y se
+            buscan de a TAMANO_BLOQUE en ese orden (releyendo la entrada para armar cada
+            tramo) hasta agotar el presupuesto.
+
+            Returns:
+                Dict {sitio: {idx: resultado}} con lo encontrado
+            """
+            import numpy as np
+            # Puntaje de cada fila por buscar, en todo el escaneo
+            candidatos = {site_name: ([], []) for site_name in sites_to_scrape}
+            for df in bloques_indexados():
+                check_pause()
+                df = preparar_bloque(df, anteriores)
+                emitir_productos(df)
+                for site_name, (indices, valores) in candidatos.items():
+                    col_precio = f"Precio {site_name.upper()}"
+                    skus_pendientes = pendientes.get(site_name) if pendientes is not None else None
+                    puntajes = recursos[site_name].puntajes.para(df['SKU'])
+                    for idx, sku, precio in zip(df.index, df['SKU'], df[col_precio]):
+                        sku = str(sku).strip()
+                        if str(precio) not in ("Pendiente", "No encontrado", "Error"):
+                            continue
+                        if skus_pendientes is not None and sku not in skus_pendientes:
+                            continue
+                        indices.append(idx)
+                        valores.append(puntajes[sku])
+            
+            ordenes = {}
+            for site_name, (indices, valores) in candidatos.items():
+                valores = np.asarray(valores, dtype=np.float64)
+                ordenes[site_name] = np.asarray(indices, dtype=np.int64)[np.argsort(-valores, kind='stable')]
+                probables = int((valores >= 0.5).sum())
+                logging.info(f"🎯 [{site_name.upper()}] Priorización: {probables}/{len(valores)} EANs con probabilidad de cambio >= 50%")
+            del candidatos
+            
+            buscados = {site_name: {} for site_name in sites_to_scrape}
+            n_tramos = max(-(-len(orden) // TAMANO_BLOQUE) for orden in ordenes.values())
+            for n_tramo in range(n_tramos):
+                check_pause()
+                restante = presupuesto_segundos - (time.time() - inicio_escaneo)
+                if cancelacion.cancelado or restante <= 0:
+                    break
+                tramos = {site_name: orden[n_tramo * TAMANO_BLOQUE:(n_tramo + 1) * TAMANO_BLOQUE]
+                          for site_name, orden in ordenes.items()}
+                tramos = {site_name: tramo for site_name, tramo in tramos.items() if len(tramo)}
+                buscar_idx = np.unique(np.concatenate(list(tramos.values())))
+                partes = []
+                for df in bloques_indexados():
+                    df = df[df.index.isin(buscar_idx)]
+                    if len(df):
+                        partes.append(preparar_bloque(df.copy(), anteriores))
+                filas = pd.concat(partes)
+                logging.info(f"🎯 Tramo de prioridad {n_tramo + 1}/{n_tramos}: {len(filas)} productos")
+                
+                dfs = {site_name: filas.loc[tramo] for site_name, tramo in tramos.items()}
+                puntajes_por_sitio = {site_name: recursos[site_name].puntajes.para(df['SKU'])
+                                      for site_name, df in dfs.items()}
+                results_dict = {}
+                stats_dict = {}
+                buscar(dfs, puntajes_por_sitio, restante, results_dict, stats_dict)
+                for site_name, site_results in results_dict.items():
+                    for result in site_results:
+                        buscados[site_name][result['idx']] = result
+                acumular_stats(stats_dict)
+                del filas, dfs, results_dict
+            
+            for site_name, orden in ordenes.items():
+                sin_buscar = len(orden) - len(buscados[site_name])
+                if sin_buscar and not cancelacion.cancelado:
+                    logging.warning(f"⏱️ [{site_name.upper()}] Presupuesto agotado: {sin_buscar} EANs "
+                                    f"de menor prioridad quedan sin buscar")
+            return buscados
+        
+        inicio_escaneo = time.time()
+        # Priorización con presupuesto: primero se busca en el orden de todo el escaneo,
+        # después los bloques sólo se completan con lo encontrado y se escriben
+        buscados = None
+        if priorizar and presupuesto_segundos and not cancelacion.cancelado:
+            buscados = buscar_por_prioridad()
         
-        # Consolidar resultados en el DataFrame
+        # Cada bloque se busca, se escribe y se libera antes de leer el siguiente:
+        # la memoria no crece con el tamaño del catálogo
+        total_filas = 0
         total_actualizados = 0
-        for site_name, site_results in results_dict.items():
-            logging.info(f"[{site_name.upper()}] Consolidando {len(site_results)} resultados...")
+        for n_bloque, df in enumerate(bloques_indexados(), start=1):
+            check_pause()
+            total_filas += len(df)
+            df = preparar_bloque(df, anteriores)
+            
+            # Loguear primeros 5 SKUs para que el usuario verifique
+            if n_bloque == 1:
+                 first_skus = df['SKU'].head(5).tolist()
+                 logging.info(f"Primer bloque: {len(df)} productos. Primeros SKUs: {first_skus}")
+            logging.info(f"📦 Bloque {n_bloque}: filas {df.index[0] + 1}-{df.index[-1] + 1}")
+            
+            # El presupuesto es por escaneo: cada bloque recibe lo que queda
+            presupuesto_bloque = None
+            if presupuesto_segundos:
+                presupuesto_bloque = presupuesto_segundos - (time.time() - inicio_escaneo)
             
-            for result in site_results:
-                idx = result['idx']
+            # Preparar estructura de resultados compartida (thread-safe para escritura por keys únicas)
+            results_dict = {}
+            stats_dict = {}
+            
+            if buscados is not None:
+                # Ya se buscó en orden de prioridad: sólo se toma lo encontrado para este bloque
+                for site_name, por_idx in buscados.items():
+                    results_dict[site_name] = [por_idx.pop(idx) for idx in df.index if idx in por_idx]
+            elif cancelacion.cancelado:
+                # Tras cancelar, los bloques restantes se guardan con los resultados anteriores
+                emitir_productos(df)
+                logging.info(f"🛑 Escaneo cancelado: el bloque {n_bloque} se guarda sin buscar")
+            elif presupuesto_bloque is not None and presupuesto_bloque <= 0:
+                emitir_productos(df)
+                logging.warning(f"⏱️ Presupuesto agotado: el bloque {n_bloque} se guarda sin buscar")
+            else:
+                emitir_productos(df)
+                # Puntajes de volatilidad por sitio (ver prioridad.py)
+                puntajes_por_sitio = {}
+                for site_name in sites_to_scrape:
+                    if recursos[site_name].puntajes is not None:
+                        puntajes = recursos[site_name].puntajes.para(df['SKU'])
+                        puntajes_por_sitio[site_name] = puntajes
+                        probables = sum(1 for p in puntajes.values() if p >= 0.5)
+                        logging.info(f"🎯 [{site_name.upper()}] Priorización: {probables}/{len(puntajes)} EANs con probabilidad de cambio >= 50%")
                 
-                if site_name == "nini":
-                    df.at[idx, "Precio NINI"] = result['Precio']
-                    df.at[idx, "Oferta NINI"] = result['Oferta']
-                    total_actualizados += 1
-                    
-                elif site_name == "carrefour":
-                    df.at[idx, "Precio CARREFOUR"] = result['Precio']
-                    df.at[idx, "Oferta CARREFOUR"] = result['Oferta']
-                    total_actualizados += 1
-                    
-                elif site_name == "vea":
-                    df.at[idx, "Precio VEA"] = result['Precio']
-                    df.at[idx, "Oferta VEA"] = result['Oferta']
-                    df.at[idx, "Dinamica VEA"] = result.get('Dinamica', '')
-                    total_actualizados += 1
+                buscar({site_name: df for site_name in sites_to_scrape}, puntajes_por_sitio,
+                       presupuesto_bloque, results_dict, stats_dict)
+            
+            logging.info(f"📊 Consolidando resultados del bloque {n_bloque}...")
+            
+            # Consolidar resultados en el DataFrame
+            for site_name, site_results in results_dict.items():
+                logging.info(f"[{site_name.upper()}] Consolidando {len(site_results)} resultados...")
+                
+                for result in site_results:
+                    idx = result['idx']
                     
-                elif site_name == "disco":
-                    df.at[idx, "Precio DISCO"] = result['Precio']
-                    df.at[idx, "Oferta DISCO"] = result['Oferta']
-                    df.at[idx, "Dinamica DISCO"] = result.get('Dinamica', '')
-                    total_actualizados += 1
+                    if site_name == "nini":
+                        df.at[idx, "Precio NINI"] = result['Precio']
+                        df.at[idx, "Oferta NINI"] = result['Oferta']
+                        total_actualizados += 1
+                        
+                    elif site_name == "carrefour":
+                        df.at[idx, "Precio CARREFOUR"] = result['Precio']
+                        df.at[idx, "Oferta CARREFOUR"] = result['Oferta']
+                        total_actualizados += 1
+                        
+                    elif site_name == "vea":
+                        df.at[idx, "Precio VEA"] = result['Precio']
+                        df.at[idx, "Oferta VEA"] = result['Oferta']
+                        df.at[idx, "Dinamica VEA"] = result.get('Dinamica', '')
+                        total_actualizados += 1
+                        
+                    elif site_name == "disco":
+                        df.at[idx, "Precio DISCO"] = result['Precio']
+                        df.at[idx, "Oferta DISCO"] = result['Oferta']
+                        df.at[idx, "Dinamica DISCO"] = result.get('Dinamica', '')
+                        total_actualizados += 1
+            
+            if similares:
+                df = completar_similares(df, similares)
+            
+            # Pasada vectorizada: precios a centavos, tipo de promo y comparación entre sitios
+            df = comparar_sitios(agregar_columnas_numericas(df))
+            
+            try:
+                registrar_historial(df, results_dict, escritura_historial)
+            except Exception as e:
+                logging.error(f"Error guardando historial de precios: {e}", exc_info=True)
+            
+            # Persistir el bloque y soltarlo
+            salida.agregar(df)
+            if exportacion is not None:
+                exportacion.agregar(df)
+            acumular_stats(stats_dict)
+            del df, results_dict, stats_dict
         
         # Guardar resultados finales consolidados
-        df.to_excel(OUTPUT_FILE, index=False)
-        logging.info(f"💾 Resultados guardados: {total_actualizados} precios actualizados")
+        salida.cerrar()
+        logging.info(f"💾 Resultados guardados: {total_filas} filas, {total_actualizados} precios actualizados")
+        if exportacion is not None:
+            exportacion.cerrar(xlsx=output_file)
+            exportacion = None
+        
+        # Estadísticas por sitio
+        for site_name, stats in stats_totales.items():
+            logging.info(f"📈 [{site_name.upper()}] Procesados: {stats['procesados']} | "
+                         f"Omitidos conocidos inexistentes (skipped known-missing): {stats['omitidos_negativos']} | "
+                         f"Desde catálogo: {stats['desde_catalogo']} | "
+                         f"Por enlace: {stats['desde_enlace']} | "
+                         f"Aperturas del circuito: {stats['aperturas_circuito']} | "
+                         f"Reinicios de driver: {stats['reinicios_driver']} ({stats['tiempo_perdido']:.0f}s perdidos)")
         logging.info("=" * 60)
 
-        logging.info("Proceso finalizado correctamente")
-        print("✅ Proceso finalizado correctamente")
+        if cancelacion.cancelado:
+            logging.warning("🛑 Escaneo cancelado: se guardaron los resultados encontrados hasta la cancelación")
+        else:
+            logging.info("Proceso finalizado correctamente")
+            print("✅ Proceso finalizado correctamente")
 
     except Exception as e:
         logging.critical(f"Error inesperado en la ejecución principal: {e}", exc_info=True)
         print(f"❌ Error fatal: {e}")
     finally:
+        if salida is not None:
+            salida.descartar()
+        if exportacion is not None:
+            exportacion.descartar()
+        if anteriores is not None:
+            anteriores.cerrar()
+        for recursos_sitio in recursos.values():
+            recursos_sitio.cerrar()
+        if escritura_historial is not None:
+            try:
+                escritura_historial.cerrar()
+            except Exception as e:
+                logging.error(f"Error guardando historial de precios: {e}", exc_info=True)
+        if planilla is not None:
+            planilla.eliminar()
+        if broker is not None:
+            try:
+                broker.finalizar(trabajo_id)
+            except Exception as e:
+                logging.warning(f"No se pudo limpiar el escaneo en el broker: {e}")
+        if perfilador is not None:
+            try:
+                perfilador.detener()
+            except Exception as e:
+                logging.warning(f"No se pudo guardar el perfil del escaneo: {e}")
         # Los drivers ahora son manejados por cada worker thread
         # Señal de fin para el stream
         if log_queue:
@@ -1191,11 +1942,17 @@ def run_scraper(selection, log_queue=None, input_df=None, ignore_cache=False, pa
 
 
 if __name__ == "__main__":
-    import logging.handlers # Import inside main to avoid circular deps if needed elsewhere
+    import argparse
+    parser = argparse.ArgumentParser(description="Scraper automático de precios")
+    parser.add_argument("--perfilar", action="store_true",
+                        help=f"Guardar flame graph y traza del escaneo en {PERFILES_DIR}")
+    args = parser.parse_args()
+    configurar_logging()
+    print("🚀 Scraper automático de precios")
     try:
         # Mostrar menú y obtener selección del usuario
         paginas_seleccionadas = menu_seleccion_paginas()
-        run_scraper(paginas_seleccionadas)
+        run_scraper(paginas_seleccionadas, perfilar=args.perfilar)
 
     except KeyboardInterrupt:
         print("\n👋 Programa cancelado por el usuario.")
@@ -0,0 +1,129 @@
+"""
+Configuración general del comparador (variables de entorno y rutas).
+
+Se separa de comparador_completo.py para que la app web pueda leerla sin
+cargar pandas ni selenium: importar este módulo no tiene efectos secundarios.
+El logging tampoco se configura al importar; cada punto de entrada (app.py,
+la CLI, trabajador.py) llama a configurar_logging() al arrancar.
+"""
+import os
+import logging
+
+# =====================================================
+# CONFIGURACIÓN LOGGING
+# =====================================================
+ARCHIVO_LOG = "scraper_debug.log"
+FORMATO_LOG = "%(asctime)s - %(levelname)s - %(message)s"
+
+
+def configurar_logging(nivel=logging.INFO, archivo=ARCHIVO_LOG):
+    """
+    Logger raíz a consola y al archivo de depuración.
+    Si ya tiene handlers (p.ej. lo configuró otro punto de entrada) no hace nada.
+    """
+    raiz = logging.getLogger()
+    if raiz.handlers:
+        return
+    logging.basicConfig(
+        level=nivel,
+        format=FORMATO_LOG,
+        handlers=[
+            logging.FileHandler(archivo, encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+
+# =====================================================
+# CONFIGURACIÓN GENERAL
+# =====================================================
+
+HEADLESS = True
+
+# Usar rutas relativas para compatibilidad con Railway
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INPUT_FILE = os.path.join(BASE_DIR, "planilla_ofertas.xlsx")
+OUTPUT_FILE = os.path.join(BASE_DIR, "precios_resultados.xlsx")
+DATA_DIR = os.environ.get("DATA_DIR", os.path.join(BASE_DIR, "data"))
+EXPORT_DIR = os.path.join(DATA_DIR, "exports")
+HISTORIAL_DIR = os.path.join(DATA_DIR, "historial")
+PROGRAMACION_FILE = os.path.join(DATA_DIR, "programacion.json")
+
+# Caché negativo: días antes de volver a buscar un EAN que el sitio no tiene
+DIAS_REVERIFICAR_NEGATIVOS = float(os.environ.get("DIAS_REVERIFICAR_NEGATIVOS", "7"))
+
+# Backend de navegador: "selenium" (un Chrome completo por hilo) o "contextos"
+# (un único Chromium con un contexto aislado por hilo, ver navegador_contextos.py)
+NAVEGADOR_BACKEND = os.environ.get("NAVEGADOR_BACKEND", "selenium")
+
+# Búsquedas simultáneas por sitio: el planificador de capacidad (ver capacidad.py)
+# abre tantos navegadores como entren en la memoria y la CPU del contenedor, hasta
+# BUSQUEDAS_PARALELAS por sitio ("0" = hasta MAX_NAVEGADORES_SITIO).
+BUSQUEDAS_PARALELAS = int(os.environ.get("BUSQUEDAS_PARALELAS", "0"))
+MAX_NAVEGADORES_SITIO = 8
+# Estimación inicial de memoria por navegador (después se mide): un Chrome completo
+# con selenium, un contexto del Chromium compartido con "contextos"
+MB_POR_NAVEGADOR = float(os.environ.get("MB_POR_NAVEGADOR", "80" if NAVEGADOR_BACKEND == "contextos" else "350"))
+# Memoria que el planificador deja libre para la app y los picos
+RESERVA_MEMORIA_MB = float(os.environ.get("RESERVA_MEMORIA_MB", "512"))
+NAVEGADORES_POR_CPU = float(os.environ.get("NAVEGADORES_POR_CPU", "2"))
+
+# Modo distribuido: con BROKER_URL, run_scraper coordina y las búsquedas las hacen
+# los procesos de trabajador.py (ver broker.py). Vacío = todo en este proceso.
+BROKER_URL = os.environ.get("BROKER_URL", "")
+# Aviso cuando hay tareas pendientes y ningún worker dio señales en este lapso
+ESPERA_SIN_TRABAJADORES = 60
+
+# Circuit breaker por sitio (ver circuito.py): fallas consecutivas que lo abren,
+# segundos hasta la primera búsqueda de prueba y pruebas fallidas antes de abandonar el sitio
+CIRCUITO_FALLAS = int(os.environ.get("CIRCUITO_FALLAS", "5"))
+CIRCUITO_ESPERA = float(os.environ.get("CIRCUITO_ESPERA", "60"))
+CIRCUITO_SONDEOS = int(os.environ.get("CIRCUITO_SONDEOS", "3"))
+
+# Plazo máximo de una búsqueda antes de dar el driver por colgado (ver supervisor.py)
+PLAZO_BUSQUEDA = float(os.environ.get("PLAZO_BUSQUEDA", "90"))
+
+# Estrategia de carga de páginas: "eager" (DOM listo), "none" (sin esperar) o "normal".
+# La extracción empieza cuando se cumple el predicado del sitio (ver cargar_pagina)
+ESTRATEGIA_CARGA = os.environ.get("ESTRATEGIA_CARGA", "eager")
+TIMEOUT_PAGINA_LISTA = float(os.environ.get("TIMEOUT_PAGINA_LISTA", "10"))
+
+# Archivo de instantáneas (ver instantaneas.py): con "1" cada búsqueda guarda su
+# fragmento de DOM para poder re-extraer offline si cambian los selectores
+ARCHIVAR_INSTANTANEAS = os.environ.get("ARCHIVAR_INSTANTANEAS", "0") == "1"
+INSTANTANEAS_DIR = os.path.join(DATA_DIR, "instantaneas")
+
+# Modo catálogo (ver catalogo_vtex.py): con "1" los sitios VTEX bajan su catálogo
+# completo una vez por día y la planilla se cruza contra ese índice. Los EANs que
+# no están en el catálogo se buscan igual ("buscar") o se dan por inexistentes ("no_encontrado")
+MODO_CATALOGO = os.environ.get("MODO_CATALOGO", "0") == "1"
+CATALOGO_FALTANTES = os.environ.get("CATALOGO_FALTANTES", "buscar")
+CATALOGO_DIR = os.path.join(DATA_DIR, "catalogo")
+TIENDAS_VTEX = {
+    "carrefour": "https://www.carrefour.com.ar",
+    "vea": "https://www.vea.com.ar",
+    "disco": "https://www.disco.com.ar",
+}
+
+# Enlaces aprendidos (ver enlaces.py): los EANs ya encontrados se resuelven por la
+# página de su producto, sin búsqueda ni navegador. "0" para desactivar
+USAR_ENLACES = os.environ.get("USAR_ENLACES", "1") == "1"
+ENLACES_DB = os.path.join(DATA_DIR, "enlaces.db")
+# Pedidos HTTP simultáneos al resolver enlaces conocidos ("0" = según la CPU, ver capacidad.hilos_http)
+HILOS_ENLACES = int(os.environ.get("HILOS_ENLACES", "0"))
+
+# Servidor web (ver asgi.py): requests de Flask atendidos a la vez. Los streams
+# de logs y productos no cuentan: se atienden en el event loop sin thread propio
+HILOS_WSGI = int(os.environ.get("HILOS_WSGI", "8"))
+
+# Coincidencias por descripción (ver similares.py): los "No encontrado" de los sitios
+# VTEX se buscan por descripción en el catálogo del día y el producto más parecido
+# se informa en la columna "Similar <SITIO>". "1" para activar
+BUSQUEDA_SIMILARES = os.environ.get("BUSQUEDA_SIMILARES", "0") == "1"
+# Similitud mínima (0 a 1) para informar una coincidencia
+UMBRAL_SIMILITUD = float(os.environ.get("UMBRAL_SIMILITUD", "0.6"))
+
+# Perfilado por escaneo (ver perfilado.py): flame graph y traza de los escaneos
+# lanzados con "Perfilar escaneo" (o --perfilar en la CLI)
+PERFILES_DIR = os.path.join(DATA_DIR, "perfiles")
+# Milisegundos entre muestras de las pilas de los threads del escaneo
+PERFIL_INTERVALO_MS = float(os.environ.get("PERFIL_INTERVALO_MS", "10"))
@@ -0,0 +1,237 @@
+"""
+Consulta sincrónica del precio de un EAN en todos los sitios, con plazo.
+
+La búsqueda individual de /start lanza un run_scraper completo (navegadores
+nuevos, archivo de resultados reescrito) y la respuesta llega por SSE. Para
+el POS y las herramientas de compras, GET /api/price/<ean> usa ConsultaPrecios:
+
+- un valor reciente (de una consulta anterior o del historial) se responde al instante;
+- el resto de los sitios se consulta en paralelo: los VTEX por HTTP (enlace
+  aprendido o búsqueda por EAN en su API) y NINI con un navegador que queda
+  abierto y logueado entre consultas;
+- vencido el plazo se responde con lo que haya; los sitios que faltan siguen
+  buscándose y su resultado queda en caché para la próxima consulta.
+
+No escribe el archivo de resultados ni el historial.
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+
+from catalogo_vtex import formatear_precio
+
+# Consultas en vivo guardadas en memoria
+MAX_CACHE = 10000
+
+
+class ResolvedorVTEX:
+    """
+    Precio de un EAN en un sitio VTEX por HTTP, sin navegador.
+
+    Args:
+        tienda: CatalogoVTEX del sitio (ver catalogo_vtex.py)
+        enlaces: IndiceEnlaces para usar y aprender el enlace del producto (opcional)
+    """
+
+    def __init__(self, tienda, enlaces=None):
+        self.tienda = tienda
+        self.enlaces = enlaces
+
+    def __call__(self, ean):
+        site_name = self.tienda.site_name
+        if self.enlaces is not None:
+            ruta = self.enlaces.obtener(site_name, [ean]).get(ean)
+            if ruta:
+                resultado = self.tienda.resultado_por_enlace(ruta, ean)
+                if resultado is not None:
+                    return resultado
+                self.enlaces.olvidar(site_name, ean)
+        resultado, ruta = self.tienda.resultado_por_ean(ean)
+        if resultado is None:
+            return "No encontrado", "", ""
+        if self.enlaces is not None and resultado[0] != "No encontrado":
+            self.enlaces.aprender(site_name, ean, ruta)
+        return resultado
+
+
+class ResolvedorNavegador:
+    """
+    Precio de un EAN con un navegador supervisado que queda abierto entre
+    consultas (para NINI, con la sesión y el pedido ya iniciados).
+
+    Las consultas en vivo se encolan en un thread propio (ver enviar): una ráfaga
+    de consultas a este sitio no ocupa los threads compartidos de ConsultaPrecios
+    esperando el único navegador, y los sitios VTEX se siguen atendiendo.
+
+    Args:
+        supervisor: SupervisorDriver del sitio (ver supervisor.py)
+        buscar: buscar_precio_* del sitio
+        normalizar: Función que lleva el resultado a (precio, oferta, dinamica)
+    """
+
+    def __init__(self, supervisor, buscar, normalizar):
+        self.supervisor = supervisor
+        self.buscar = buscar
+        self.normalizar = normalizar
+        self._lock = threading.Lock()
+        self._ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"Consulta-{supervisor.etiqueta}")
+
+    def __call__(self, ean):
+        # Un solo navegador: las consultas al sitio se atienden de a una
+        with self._lock:
+            if not self.supervisor.listo():
+                self.supervisor.iniciar()
+            return self.normalizar(self.supervisor.ejecutar(self.buscar, ean))
+
+    def enviar(self, ean):
+        """Futuro de la consulta, en el thread del navegador."""
+        return self._ejecutor.submit(self, ean)
+
+    def cerrar(self):
+        self._ejecutor.shutdown(wait=False, cancel_futures=True)
+        self.supervisor.cerrar()
+
+
+class ConsultaPrecios:
+    """
+    Consultas de un EAN en varios sitios a la vez, con caché y plazo.
+
+    Args:
+        resolvedores: Dict {sitio: callable(ean) -> (precio, oferta, dinamica)}
+        historial: HistorialPrecios para responder con observaciones recientes (opcional)
+        hilos: Consultas en vivo simultáneas
+    """
+
+    def __init__(self, resolvedores, historial=None, hilos=8):
+        self.resolvedores = resolvedores
+        self.historial = historial
+        self._ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="Consulta")
+        self._cache = OrderedDict()
+        self._en_curso = {}
+        # Reentrante: si la consulta ya terminó, add_done_callback llama a _guardar en el mismo thread
+        self._lock = threading.RLock()
+
+    def _guardar(self, clave, futuro):
+        with self._lock:
+            self._en_curso.pop(clave, None)
+            if futuro.cancelled():
+                return
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                logging.warning(f"[{clave[0].upper()}] 🔎 Error consultando {clave[1]}: {e}")
+                return
+            if resultado[0] == "Error":
+                return
+            self._cache[clave] = (time.time(), resultado)
+            self._cache.move_to_end(clave)
+            while len(self._cache) > MAX_CACHE:
+                self._cache.popitem(last=False)
+
+    def _lanzar(self, site_name, ean):
+        """Futuro de la consulta en vivo; si ya hay una en curso para el mismo EAN se reutiliza."""
+        clave = (site_name, ean)
+        with self._lock:
+            futuro = self._en_curso.get(clave)
+            if futuro is None:
+                resolvedor = self.resolvedores[site_name]
+                # Los resolvedores con un solo navegador tienen su propia cola (ver ResolvedorNavegador)
+                enviar = getattr(resolvedor, 'enviar', None)
+                futuro = enviar(ean) if enviar is not None else self._ejecutor.submit(resolvedor, ean)
+                self._en_curso[clave] = futuro
+                futuro.add_done_callback(lambda f: self._guardar(clave, f))
+            return futuro
+
+    def _del_historial(self, ean, sitios, max_edad):
+        if self.historial is None:
+            return {}
+        limite = time.time() - max_edad
+        recientes = {}
+        desde = date.fromtimestamp(limite) - timedelta(days=1)
+        for obs in self.historial.historial_ean(ean, sitios=sitios, desde=desde):
+            if obs['ts'] >= limite:
+                recientes[obs['site']] = obs  # ordenadas por momento: queda la última
+        return {
+            site: {
+                'precio': formatear_precio(obs['precio_centavos'] / 100) if obs['precio_centavos'] is not None else obs['estado'],
+                'oferta': obs['oferta'],
+                'dinamica': '',
+                'fuente': 'historial',
+                'edad_segundos': round(time.time() - obs['ts']),
+            }
+            for site, obs in recientes.items()
+        }
+
+    def resolver(self, site_name, ean, max_edad=3600):
+        """
+        Consulta bloqueante de un sitio, en el thread que llama (para lotes, ver lotes.py).
+
+        Returns:
+            ((precio, oferta, dinamica), fuente) con fuente 'cache' o 'vivo'
+        """
+        ean = str(ean).strip()
+        clave = (site_name, ean)
+        if max_edad > 0:
+            with self._lock:
+                guardado = self._cache.get(clave)
+            if guardado and time.time() - guardado[0] <= max_edad:
+                return guardado[1], 'cache'
+        futuro = Future()
+        try:
+            futuro.set_result(self.resolvedores[site_name](ean))
+        except Exception as e:
+            futuro.set_exception(e)
+        self._guardar(clave, futuro)
+        return futuro.result(), 'vivo'
+
+    def consultar(self, ean, sitios=None, plazo=3, max_edad=3600):
+        """
+        Args:
+            ean: EAN a consultar
+            sitios: Sitios a consultar (por defecto todos los que tienen resolvedor)
+            plazo: Segundos máximos de espera por las consultas en vivo
+            max_edad: Segundos de validez de un valor cacheado (0 = siempre en vivo)
+
+        Returns:
+            Dict con 'resultados' {sitio: {precio, oferta, dinamica, fuente, edad_segundos}}
+            y 'pendientes' (sitios que no respondieron en el plazo)
+        """
+        ean = str(ean).strip()
+        sitios = [s for s in (sitios or self.resolvedores) if s in self.resolvedores]
+        resultados = {}
+
+        if max_edad > 0:
+            ahora = time.time()
+            with self._lock:
+                for site in sitios:
+                    guardado = self._cache.get((site, ean))
+                    if guardado and ahora - guardado[0] <= max_edad:
+                        precio, oferta, dinamica = guardado[1]
+                        resultados[site] = {'precio': precio, 'oferta': oferta, 'dinamica': dinamica,
+                                            'fuente': 'cache', 'edad_segundos': round(ahora - guardado[0])}
+            faltan = [s for s in sitios if s not in resultados]
+            if faltan:
+                resultados.update(self._del_historial(ean, faltan, max_edad))
+
+        inicio = time.time()
+        vivos = {site: self._lanzar(site, ean) for site in sitios if site not in resultados}
+        if vivos:
+            wait(list(vivos.values()), timeout=plazo)
+        for site, futuro in vivos.items():
+            if not futuro.done():
+                continue
+            try:
+                precio, oferta, dinamica = futuro.result()
+            except Exception:
+                precio, oferta, dinamica = "Error", "", ""
+            resultados[site] = {'precio': precio, 'oferta': oferta, 'dinamica': dinamica,
+                                'fuente': 'vivo', 'edad_segundos': 0}
+
+        pendientes = [s for s in sitios if s not in resultados]
+        if vivos:
+            logging.info(f"🔎 {ean}: {len(vivos) - len(pendientes)}/{len(vivos)} sitios en vivo "
+                         f"en {time.time() - inicio:.2f}s" + (f" (pendientes: {pendientes})" if pendientes else ""))
+        return {'ean': ean, 'resultados': resultados, 'pendientes': pendientes}
@@ -0,0 +1,222 @@
+"""
+Difusión de eventos del escaneo (logs y productos) a los monitores conectados.
+
+Antes cada /stream_* leía de una queue.Queue con un thread bloqueado por
+conexión: dos pestañas abiertas ocupaban la mitad de los threads de gunicorn
+(y además se repartían los mensajes entre sí en lugar de recibirlos todos).
+
+Un Difusor recibe los eventos desde los threads del scraper con la misma
+interfaz que una cola (put / put_nowait, así sirve para QueueHandler), los
+serializa una sola vez y los reparte a cada suscriptor:
+
+- los suscriptores async (ver asgi.py) son una asyncio.Queue en el event loop
+  del servidor: un monitor inactivo no ocupa ningún thread;
+- los suscriptores sync (el servidor de desarrollo de Flask) usan una
+  queue.Queue propia.
+
+Cada evento lleva un id creciente. Los eventos del escaneo en curso quedan en
+un historial acotado para que un monitor que se conecta o reconecta tarde
+reciba lo que se perdió (?desde=<último id recibido>). Si lo que se perdió ya
+no está en el historial (o es de otro escaneo), primero recibe un evento de
+resincronización para que descarte lo que tiene y se quede con lo reenviado.
+"""
+import json
+import queue
+import logging
+import threading
+import collections
+
+STOP_SIGNAL = "STOP_SIGNAL"
+# Eventos pendientes por suscriptor: si un cliente lento se atrasa más, se lo desconecta
+MAX_PENDIENTES = 1000
+# Segundos entre heartbeats de una conexión sin eventos
+INTERVALO_HEARTBEAT = 15
+
+
+def evento_sse(id_evento, datos):
+    """Un evento en formato text/event-stream."""
+    if id_evento is None:
+        return f"data: {datos}\n\n"
+    return f"id: {id_evento}\ndata: {datos}\n\n"
+
+
+class Suscripcion:
+    """
+    Eventos de un monitor conectado. Se crea con Difusor.suscribir().
+
+    Sync: siguiente(timeout) devuelve (id, datos, final) o None si no llegó nada.
+    Async: el difusor deja los eventos en `cola` (asyncio.Queue) vía `loop`.
+
+    `reenvio` son los eventos del historial que se le entregan al suscribirse:
+    no cuentan para MAX_PENDIENTES, que limita sólo el atraso con los eventos nuevos.
+    """
+
+    def __init__(self, loop=None, reenvio=0):
+        self.loop = loop
+        self.desconectado = False
+        if loop is None:
+            self.cola = queue.Queue(MAX_PENDIENTES + reenvio)
+        else:
+            import asyncio
+            self.cola = asyncio.Queue(MAX_PENDIENTES + reenvio)
+
+    def _entregar(self, item):
+        # En el event loop si es async; desde el thread que publica si es sync
+        try:
+            self.cola.put_nowait(item)
+        except (queue.Full, Exception) as e:
+            if not self.desconectado:
+                self.desconectado = True
+                logging.warning(f"📡 Monitor demasiado lento, se lo desconecta ({type(e).__name__})")
+
+    def entregar(self, item):
+        if self.loop is None:
+            self._entregar(item)
+        else:
+            try:
+                self.loop.call_soon_threadsafe(self._entregar, item)
+            except RuntimeError:
+                # El event loop ya se cerró
+                self.desconectado = True
+
+    def siguiente(self, timeout):
+        try:
+            return self.cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Difusor:
+    """
+    Canal de eventos con varios suscriptores e historial del escaneo en curso.
+
+    Args:
+        serializar: Callable serializar(item) -> (texto JSON, final). `final` indica
+                    el fin del escaneo: los suscriptores se cierran después de enviarlo
+        max_historial: Eventos del escaneo en curso que se guardan para monitores tardíos
+        resincronizar: Texto JSON que avisa al monitor que descarte lo recibido antes
+                       (le faltan eventos que ya no están en el historial)
+    """
+
+    def __init__(self, serializar, max_historial=5000, resincronizar=None):
+        self.serializar = serializar
+        self.resincronizar = resincronizar
+        self._historial = collections.deque(maxlen=max_historial)
+        self._suscriptores = set()
+        self._siguiente = 1
+        # Último id que salió del historial y primer id del escaneo en curso
+        self._perdido = 0
+        self._inicio = 1
+        self._lock = threading.Lock()
+
+    # Interfaz de cola: la usan logging.handlers.QueueHandler y el scraper
+    def put(self, item, block=True, timeout=None):
+        self.publicar(item)
+
+    def put_nowait(self, item):
+        self.publicar(item)
+
+    def publicar(self, item):
+        try:
+            datos, final = self.serializar(item)
+        except Exception as e:
+            logging.debug(f"Evento no serializable descartado: {e}")
+            return
+        with self._lock:
+            evento = (self._siguiente, datos, final)
+            self._siguiente += 1
+            if len(self._historial) == self._historial.maxlen:
+                self._perdido = self._historial[0][0]
+            self._historial.append(evento)
+            suscriptores = list(self._suscriptores)
+        for suscripcion in suscriptores:
+            suscripcion.entregar(evento)
+
+    def reiniciar(self):
+        """Empieza un escaneo nuevo: el historial del anterior ya no se reenvía."""
+        with self._lock:
+            self._historial.clear()
+            self._perdido = 0
+            self._inicio = self._siguiente
+
+    def suscribir(self, desde=0, loop=None):
+        """
+        Nuevo suscriptor. Recibe primero los eventos del historial posteriores a `desde`
+        (todos, aunque sean más de MAX_PENDIENTES), precedidos por el evento de
+        resincronización si entre `desde` y el historial faltan eventos.
+
+        Args:
+            desde: Último id que el monitor ya recibió
+            loop: Event loop del suscriptor async (None para uno sync)
+        """
+        with self._lock:
+            reenvio = [evento for evento in self._historial if evento[0] > desde]
+            # Le faltan eventos que ya no están, o lo que tiene es de un escaneo anterior
+            faltan = desde < self._perdido or 0 < desde < self._inicio
+            if faltan and self.resincronizar is not None:
+                reenvio.insert(0, (None, self.resincronizar, False))
+            suscripcion = Suscripcion(loop, len(reenvio))
+            for evento in reenvio:
+                suscripcion._entregar(evento)
+            self._suscriptores.add(suscripcion)
+        return suscripcion
+
+    def desuscribir(self, suscripcion):
+        with self._lock:
+            self._suscriptores.discard(suscripcion)
+
+    @property
+    def conectados(self):
+        with self._lock:
+            return len(self._suscriptores)
+
+    def transmitir(self, desde=0, heartbeat=None):
+        """
+        Generador sync de eventos SSE (para Flask sin servidor ASGI).
+
+        Args:
+            desde: Último id que el monitor ya recibió
+            heartbeat: Texto JSON que se envía cada INTERVALO_HEARTBEAT segundos sin eventos
+        """
+        suscripcion = self.suscribir(desde)
+        try:
+            while not suscripcion.desconectado:
+                evento = suscripcion.siguiente(INTERVALO_HEARTBEAT)
+                if evento is None:
+                    if heartbeat is not None:
+                        yield evento_sse(None, heartbeat)
+                    continue
+                id_evento, datos, final = evento
+                yield evento_sse(id_evento, datos)
+                if final:
+                    break
+        finally:
+            self.desuscribir(suscripcion)
+
+
+# =====================================================
+# SERIALIZACIÓN DE LOS CANALES DE LA APP
+# =====================================================
+
+def serializar_log(record):
+    """LogRecord (o texto) -> evento de /stream_logs."""
+    if isinstance(record, logging.LogRecord):
+        msg = record.getMessage()
+        level = record.levelname
+    else:
+        msg = str(record)
+        level = "INFO"
+    return json.dumps({'message': msg, 'level': level}), msg == STOP_SIGNAL
+
+
+def serializar_producto(dato):
+    """Actualización de producto -> evento de /stream_products."""
+    if dato == STOP_SIGNAL:
+        return json.dumps({'type': 'stop'}), True
+    return json.dumps(dato), False
+
+
+HEARTBEAT_LOG = json.dumps({'heartbeat': True})
+HEARTBEAT_PRODUCTOS = json.dumps({'type': 'heartbeat'})
+RESYNC_LOG = json.dumps({'resync': True})
+RESYNC_PRODUCTOS = json.dumps({'type': 'resync'})
@@ -0,0 +1,97 @@
+"""
+Índice aprendido EAN -> página de producto, por sitio VTEX.
+
+Cada buscar_precio_carrefour/vea/disco pasa por la página de búsqueda
+(?_q={ean}&map=ft) aunque el producto se haya encontrado ayer. Cuando una
+búsqueda encuentra el producto, se guarda el enlace de su ficha (/slug/p); en
+los escaneos siguientes ese EAN se resuelve pidiendo el producto por su enlace
+a la API del sitio (ver CatalogoVTEX.resultado_por_enlace), sin navegador.
+
+Si el enlace ya no existe o no lleva al mismo EAN, se olvida y el EAN vuelve
+a la búsqueda normal, que aprende el enlace nuevo.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from urllib.parse import urlparse
+
+JS_ENLACE_PRODUCTO = """
+const articulo = document.querySelector("article[class*='vtex-product-summary-2-x-element']");
+const enlace = (articulo && articulo.closest('a[href]'))
+    || document.querySelector("a[class*='vtex-product-summary-2-x-clearLink'][href]");
+return enlace ? enlace.getAttribute('href') : null;
+"""
+
+
+def capturar_enlace(driver):
+    """Ruta (/slug/p) del primer producto de la página de búsqueda actual, o None."""
+    try:
+        href = driver.execute_script(JS_ENLACE_PRODUCTO)
+    except Exception:
+        return None
+    ruta = urlparse(href or "").path
+    return ruta if ruta.endswith("/p") else None
+
+
+class IndiceEnlaces:
+    """
+    Enlaces aprendidos en un archivo SQLite (compartido por hilos, procesos y workers).
+
+    Args:
+        ruta: Archivo de la base (se crea si no existe)
+    """
+
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS enlaces (
+            site TEXT NOT NULL,
+            ean TEXT NOT NULL,
+            ruta TEXT NOT NULL,
+            aprendido REAL NOT NULL,
+            PRIMARY KEY (site, ean)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self._local = threading.local()
+        self._conexion().executescript(self.ESQUEMA)
+
+    def _conexion(self):
+        # sqlite3 no comparte conexiones entre threads: una por thread
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def obtener(self, site_name, eans):
+        """Dict {ean: ruta} con los enlaces conocidos de los EANs pedidos."""
+        eans = [str(e).strip() for e in eans]
+        conocidos = {}
+        db = self._conexion()
+        # De a bloques: SQLite limita la cantidad de parámetros por consulta
+        for i in range(0, len(eans), 500):
+            bloque = eans[i:i + 500]
+            filas = db.execute(
+                f"SELECT ean, ruta FROM enlaces WHERE site = ? AND ean IN ({','.join('?' * len(bloque))})",
+                [site_name, *bloque]
+            )
+            conocidos.update(filas)
+        return conocidos
+
+    def aprender(self, site_name, ean, ruta):
+        if not ruta:
+            return
+        self._conexion().execute(
+            "INSERT OR REPLACE INTO enlaces (site, ean, ruta, aprendido) VALUES (?, ?, ?, ?)",
+            (site_name, str(ean).strip(), ruta, time.time())
+        )
+
+    def olvidar(self, site_name, ean):
+        self._conexion().execute("DELETE FROM enlaces WHERE site = ? AND ean = ?", (site_name, str(ean).strip()))
+        logging.info(f"[{site_name.upper()}] 🔗 Enlace de {ean} roto: vuelve a la búsqueda")
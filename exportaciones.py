@@ -0,0 +1,235 @@
+"""
+Exportaciones de resultados (xlsx, CSV y Parquet) direccionadas por contenido.
+
+Durante el escaneo cada bloque de resultados se agrega a los archivos CSV y
+Parquet y a un hash del contenido (ver ExportacionIncremental); al terminar se
+publican como exports/<hash>.<formato>, junto con una copia del xlsx de
+resultados. Si el resultado no cambió, el hash es el mismo y los archivos ya
+existen: no se regenera nada y /download responde 304 gracias al ETag.
+
+Un xlsx de resultados sin exportaciones publicadas (p.ej. el de antes de un
+deploy) se exporta una sola vez en segundo plano la primera vez que se pide
+(ver exportar_en_segundo_plano).
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+
+FORMATOS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Cantidad de resultados distintos que se conservan en disco
+MAX_VERSIONES = 5
+
+# Filas del xlsx que se leen por vez al exportarlo en segundo plano
+FILAS_POR_BLOQUE = 5000
+
+_lock = threading.Lock()
+_exportando = None
+
+
+class ExportacionNoDisponible(Exception):
+    """El formato pedido no existe para el último resultado (p.ej. faltaba pyarrow para Parquet)."""
+
+
+def _ruta(directorio, contenido_hash, formato):
+    return os.path.join(directorio, f"{contenido_hash}.{formato}")
+
+
+def _limpiar_versiones(directorio, vigente):
+    """Borra los archivos de resultados viejos, conservando las últimas MAX_VERSIONES."""
+    archivos = {}
+    for nombre in os.listdir(directorio):
+        base, _, ext = nombre.partition('.')
+        if ext in FORMATOS:
+            ruta = os.path.join(directorio, nombre)
+            archivos.setdefault(base, []).append(ruta)
+
+    antiguedad = sorted(archivos, key=lambda b: max(os.path.getmtime(r) for r in archivos[b]), reverse=True)
+    for base in antiguedad[MAX_VERSIONES:]:
+        if base == vigente:
+            continue
+        for ruta in archivos[base]:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+
+class ExportacionIncremental:
+    """
+    Exportaciones de un escaneo por bloques (ver resultados.py), generadas a
+    medida que llegan los bloques en lugar de sobre el DataFrame completo.
+
+    El hash se calcula bloque a bloque sobre el texto de las filas, así que un
+    resultado sin cambios da el mismo hash y sigue respondiendo 304.
+
+    Args:
+        directorio: Carpeta de exportaciones
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self.columnas = None
+        self.filas = 0
+        self._hash = hashlib.sha256()
+        self._tmp = {formato: os.path.join(directorio, f"escaneo.{threading.get_ident()}.{formato}.tmp")
+                     for formato in ('csv', 'parquet')}
+        self._parquet = None
+        self._sin_parquet = False
+        os.makedirs(directorio, exist_ok=True)
+
+    def agregar(self, df):
+        import pandas as pd
+        primero = self.columnas is None
+        if primero:
+            self.columnas = list(df.columns)
+            self._hash.update("\x1f".join(map(str, self.columnas)).encode('utf-8'))
+        df = df.reindex(columns=self.columnas)
+        texto = df.astype(str)
+        self._hash.update(pd.util.hash_pandas_object(texto, index=False).values.tobytes())
+        # La marca BOM de Excel va sólo al principio del archivo
+        df.to_csv(self._tmp['csv'], mode='w' if primero else 'a', header=primero, index=False,
+                  encoding='utf-8-sig' if primero else 'utf-8')
+        self._agregar_parquet(texto)
+        self.filas += len(df)
+
+    def _agregar_parquet(self, texto):
+        if self._sin_parquet:
+            return
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            self._sin_parquet = True
+            logging.info("Exportación parquet omitida: Parquet requiere pyarrow instalado")
+            return
+        tabla = pa.Table.from_pandas(texto, preserve_index=False)
+        if self._parquet is None:
+            self._parquet = pq.ParquetWriter(self._tmp['parquet'], tabla.schema)
+        self._parquet.write_table(tabla)
+
+    def cerrar(self, xlsx=None):
+        """
+        Publica las exportaciones como el último resultado. Devuelve el hash del contenido.
+
+        Args:
+            xlsx: Archivo de resultados ya escrito con las mismas filas; se copia
+                  como exportación xlsx en lugar de generarla de nuevo
+        """
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+        if self.columnas is None:
+            self.descartar()
+            return None
+
+        contenido_hash = self._hash.hexdigest()[:20]
+        with _lock:
+            try:
+                for formato, tmp in self._tmp.items():
+                    if os.path.exists(tmp) and not os.path.exists(_ruta(self.directorio, contenido_hash, formato)):
+                        os.replace(tmp, _ruta(self.directorio, contenido_hash, formato))
+                ruta_xlsx = _ruta(self.directorio, contenido_hash, 'xlsx')
+                if xlsx is not None and not os.path.exists(ruta_xlsx):
+                    shutil.copyfile(xlsx, f"{ruta_xlsx}.tmp")
+                    os.replace(f"{ruta_xlsx}.tmp", ruta_xlsx)
+            finally:
+                self.descartar()
+            with open(os.path.join(self.directorio, "ultimo.json"), 'w', encoding='utf-8') as f:
+                json.dump({'hash': contenido_hash, 'filas': self.filas, 'generado': time.time()}, f)
+            try:
+                _limpiar_versiones(self.directorio, contenido_hash)
+            except Exception as e:
+                logging.warning(f"No se pudieron limpiar exportaciones viejas: {e}")
+        logging.info(f"📦 Exportaciones del escaneo publicadas ({self.filas} filas)")
+        return contenido_hash
+
+    def descartar(self):
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+        for tmp in self._tmp.values():
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def _exportar_xlsx(directorio, xlsx):
+    import pandas as pd
+    from openpyxl import load_workbook
+    exportacion = ExportacionIncremental(directorio)
+    try:
+        wb = load_workbook(xlsx, read_only=True)
+        try:
+            filas = wb.active.iter_rows(values_only=True)
+            columnas = list(next(filas, ()))
+            bloque = []
+            for fila in filas:
+                bloque.append(fila)
+                if len(bloque) >= FILAS_POR_BLOQUE:
+                    exportacion.agregar(pd.DataFrame(bloque, columns=columnas))
+                    bloque = []
+            if bloque or not exportacion.filas:
+                exportacion.agregar(pd.DataFrame(bloque, columns=columnas))
+        finally:
+            wb.close()
+        # Un escaneo que terminó mientras tanto ya publicó un resultado más nuevo
+        if ultima_exportacion(directorio) is not None:
+            exportacion.descartar()
+            return
+        exportacion.cerrar(xlsx=xlsx)
+    except Exception as e:
+        logging.error(f"No se pudieron generar las exportaciones de {xlsx}: {e}", exc_info=True)
+        exportacion.descartar()
+
+
+def exportar_en_segundo_plano(directorio, xlsx):
+    """
+    Publica en un thread aparte las exportaciones de un xlsx de resultados que
+    todavía no las tiene. Devuelve True si hay una exportación en curso.
+    """
+    global _exportando
+    with _lock:
+        if _exportando is not None and _exportando.is_alive():
+            return True
+        if ultima_exportacion(directorio) is not None:
+            return False
+        _exportando = threading.Thread(target=_exportar_xlsx, args=(directorio, xlsx),
+                                       name="Exportacion", daemon=True)
+        _exportando.start()
+    logging.info(f"📦 Generando en segundo plano las exportaciones de {xlsx}")
+    return True
+
+
+def ultima_exportacion(directorio):
+    """Datos del último resultado registrado ({'hash', 'filas', 'generado'}) o None."""
+    try:
+        with open(os.path.join(directorio, "ultimo.json"), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def obtener_exportacion(directorio, formato):
+    """
+    Devuelve (ruta, hash) del último resultado en el formato pedido, o None si
+    todavía no se publicó ninguna exportación (se publican al terminar cada
+    escaneo, o con exportar_en_segundo_plano).
+    """
+    if formato not in FORMATOS:
+        raise ExportacionNoDisponible(f"Formato no soportado: {formato}")
+
+    ultimo = ultima_exportacion(directorio)
+    if not ultimo:
+        return None
+    ruta = _ruta(directorio, ultimo['hash'], formato)
+    if not os.path.exists(ruta):
+        raise ExportacionNoDisponible(f"El último resultado no tiene exportación {formato}")
+    return ruta, ultimo['hash']
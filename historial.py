@@ -0,0 +1,545 @@
+"""
+Historial de precios: serie temporal compacta de observaciones (EAN, sitio, momento, precio, oferta).
+
+Estructura en disco (columnar, particionada por fecha y sitio):
+
+    historial/
+        eans.txt                  diccionario de EANs (id = número de línea)
+        ofertas.txt               diccionario de textos de oferta (id 0 = sin oferta)
+        2026-10-19/vea/ean.bin    uint32, id del EAN
+                      /ts.bin     uint32, epoch en segundos
+                      /precio.bin int32, centavos (o PRECIO_NO_ENCONTRADO / PRECIO_ERROR)
+                      /oferta.bin uint32, id del texto de oferta
+        ultimo/vea/*.bin          última observación de cada EAN (mismas columnas)
+
+Cada observación ocupa 16 bytes. Dentro de cada partición las filas están
+ordenadas por (ean, ts), así que el historial de un EAN se resuelve con una
+búsqueda binaria por partición sobre archivos mapeados en memoria.
+
+Las cuatro columnas de una partición se reemplazan de a una: las fusiones toman
+historial/.lock exclusivo y las consultas compartido, así nunca se leen
+columnas de versiones distintas.
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import argparse
+import threading
+import contextlib
+from datetime import datetime, date
+
+import numpy as np
+
+PRECIO_NO_ENCONTRADO = -1
+PRECIO_ERROR = -2
+
+# Observaciones que un escaneo acumula antes de fusionarlas (ver EscrituraHistorial): 64 MB
+MAX_PENDIENTES_ESCRITURA = 4_000_000
+
+COLUMNAS = {
+    'ean': np.uint32,
+    'ts': np.uint32,
+    'precio': np.int32,
+    'oferta': np.uint32,
+}
+
+
+def codificar_precio(centavos, texto):
+    """Precio a guardar: centavos, o un código negativo para 'No encontrado'/'Error'. None si no hay dato."""
+    if centavos is not None and centavos == centavos:  # descarta NaN/NA
+        try:
+            return int(centavos)
+        except (TypeError, ValueError):
+            pass
+    texto = str(texto)
+    if texto == "No encontrado":
+        return PRECIO_NO_ENCONTRADO
+    if texto == "Error":
+        return PRECIO_ERROR
+    return None
+
+
+def describir_precio(precio):
+    if precio == PRECIO_NO_ENCONTRADO:
+        return "No encontrado"
+    if precio == PRECIO_ERROR:
+        return "Error"
+    return None
+
+
+class _Diccionario:
+    """Diccionario append-only texto <-> id persistido como un texto por línea."""
+
+    def __init__(self, ruta, con_vacio=False):
+        self.ruta = ruta
+        self.valores = []
+        self.ids = {}
+        self._leido = 0
+        self.refrescar()
+        if con_vacio and not self.valores:
+            self.obtener_id('', crear=True)
+
+    def refrescar(self):
+        """Lee las líneas agregadas por otro proceso/instancia desde la última lectura."""
+        if not os.path.exists(self.ruta) or os.path.getsize(self.ruta) == self._leido:
+            return
+        with open(self.ruta, 'rb') as f:
+            f.seek(self._leido)
+            datos = f.read()
+        completo = datos[:datos.rfind(b'\n') + 1]
+        # Sólo '\n' separa valores (ver _limpiar): splitlines() también corta en \x0b, \x1c, \u2028...
+        for linea in completo.decode('utf-8').split('\n')[:-1]:
+            self._registrar(linea)
+        self._leido += len(completo)
+
+    def _registrar(self, valor):
+        self.ids.setdefault(valor, len(self.valores))
+        self.valores.append(valor)
+
+    @staticmethod
+    def _limpiar(valor):
+        return str(valor).replace('\r', ' ').replace('\n', ' ')
+
+    def obtener_id(self, valor, crear=False):
+        valor = self._limpiar(valor)
+        id_ = self.ids.get(valor)
+        if id_ is None and crear:
+            self._crear([valor])
+            id_ = self.ids[valor]
+        return id_
+
+    def obtener_ids(self, valores):
+        """Ids de varios textos, creando los que falten con una sola escritura."""
+        valores = [self._limpiar(v) for v in valores]
+        faltantes = [v for v in dict.fromkeys(valores) if v not in self.ids]
+        if faltantes:
+            self._crear(faltantes)
+        return [self.ids[v] for v in valores]
+
+    def _crear(self, valores):
+        """
+        Agrega al archivo los valores que todavía no tienen id.
+
+        Otras instancias (la app, el scraper, otro proceso) agregan al mismo archivo:
+        bajo lock de archivo se lee lo que agregaron antes de asignar ids nuevos.
+        """
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        with open(self.ruta, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self.refrescar()
+                nuevos = [v for v in valores if v not in self.ids]
+                if not nuevos:
+                    return
+                datos = "".join(v + '\n' for v in nuevos).encode('utf-8')
+                f.write(datos)
+                f.flush()
+                self._leido += len(datos)
+                for valor in nuevos:
+                    self._registrar(valor)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class HistorialPrecios:
+    """
+    Almacén de observaciones de precios.
+
+    Args:
+        directorio: Carpeta raíz del historial
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+        self._eans = None
+        self._ofertas = None
+
+    # ---------------------------------------------------------------
+    # Diccionarios
+    # ---------------------------------------------------------------
+
+    def _diccionarios(self):
+        if self._eans is None:
+            self._eans = _Diccionario(os.path.join(self.directorio, "eans.txt"))
+            self._ofertas = _Diccionario(os.path.join(self.directorio, "ofertas.txt"), con_vacio=True)
+        else:
+            self._eans.refrescar()
+            self._ofertas.refrescar()
+        return self._eans, self._ofertas
+
+    # ---------------------------------------------------------------
+    # Particiones
+    # ---------------------------------------------------------------
+
+    @contextlib.contextmanager
+    def _bloqueo(self, exclusivo=False):
+        """Lock de archivo de las particiones: exclusivo para fusionar, compartido para leer."""
+        if not exclusivo and not os.path.isdir(self.directorio):
+            # Todavía no hay historial: nada que proteger
+            yield
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        with open(os.path.join(self.directorio, ".lock"), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _ruta_particion(self, fecha, site):
+        return os.path.join(self.directorio, fecha, site)
+
+    def _leer(self, ruta, mmap=True):
+        """Columnas de una partición (memmap de sólo lectura) o None si no existe."""
+        if not os.path.exists(os.path.join(ruta, "ean.bin")):
+            return None
+        columnas = {}
+        for nombre, dtype in COLUMNAS.items():
+            archivo = os.path.join(ruta, f"{nombre}.bin")
+            if os.path.getsize(archivo) == 0:
+                columnas[nombre] = np.empty(0, dtype=dtype)
+            elif mmap:
+                columnas[nombre] = np.memmap(archivo, dtype=dtype, mode='r')
+            else:
+                columnas[nombre] = np.fromfile(archivo, dtype=dtype)
+        return columnas
+
+    def _escribir(self, ruta, columnas):
+        os.makedirs(ruta, exist_ok=True)
+        for nombre, dtype in COLUMNAS.items():
+            archivo = os.path.join(ruta, f"{nombre}.bin")
+            tmp = archivo + ".tmp"
+            np.asarray(columnas[nombre], dtype=dtype).tofile(tmp)
+            os.replace(tmp, archivo)
+
+    def _fechas(self, desde=None):
+        if not os.path.isdir(self.directorio):
+            return []
+        fechas = []
+        for nombre in os.listdir(self.directorio):
+            try:
+                dia = datetime.strptime(nombre, "%Y-%m-%d").date()
+            except ValueError:
+                continue
+            if desde is None or dia >= desde:
+                fechas.append(nombre)
+        return sorted(fechas)
+
+    def sitios(self):
+        ruta = os.path.join(self.directorio, "ultimo")
+        return sorted(os.listdir(ruta)) if os.path.isdir(ruta) else []
+
+    # ---------------------------------------------------------------
+    # Escritura
+    # ---------------------------------------------------------------
+
+    def agregar(self, site, observaciones, ts=None):
+        """
+        Agrega observaciones de un sitio.
+
+        Args:
+            site: Nombre del sitio
+            observaciones: Iterable de (ean, precio_codificado, oferta_txt)
+            ts: Momento de la observación (epoch). Por defecto, ahora.
+
+        Returns:
+            Cantidad de observaciones guardadas.
+        """
+        ts = int(ts or time.time())
+        with self._lock:
+            nuevas = self._codificar(observaciones, ts)
+            if nuevas is None:
+                return 0
+            self._guardar(site, nuevas)
+        return len(nuevas['ean'])
+
+    def _codificar(self, observaciones, ts):
+        """Columnas de las observaciones (los textos pasan a ids), o None si no hay ninguna con precio."""
+        eans, ofertas = self._diccionarios()
+        nuevas = {nombre: [] for nombre in COLUMNAS}
+        for ean, precio, oferta in observaciones:
+            if precio is None:
+                continue
+            nuevas['ean'].append(str(ean).strip())
+            nuevas['ts'].append(ts)
+            nuevas['precio'].append(precio)
+            nuevas['oferta'].append(oferta or '')
+        if not nuevas['ean']:
+            return None
+        nuevas['ean'] = eans.obtener_ids(nuevas['ean'])
+        nuevas['oferta'] = ofertas.obtener_ids(nuevas['oferta'])
+        return {n: np.asarray(v, dtype=COLUMNAS[n]) for n, v in nuevas.items()}
+
+    def _guardar(self, site, nuevas):
+        """Fusiona columnas ya codificadas en las particiones de sus días y en "ultimo"."""
+        # Leer, fusionar y reescribir bajo lock de archivo: otra instancia u otro
+        # proceso puede estar fusionando en las mismas particiones o leyéndolas
+        with self._bloqueo(exclusivo=True):
+            self._guardar_particiones(site, nuevas)
+
+    def _guardar_particiones(self, site, nuevas):
+        ts_unicos = np.unique(nuevas['ts'])
+        dias = [datetime.fromtimestamp(t).strftime("%Y-%m-%d") for t in ts_unicos.tolist()]
+        if len(set(dias)) == 1:
+            self._fusionar(self._ruta_particion(dias[0], site), nuevas, solo_ultimo=False)
+        else:
+            # Un escaneo que cruzó la medianoche: cada fila a la partición de su día
+            dia_por_fila = np.array(dias)[np.searchsorted(ts_unicos, nuevas['ts'])]
+            for fecha in sorted(set(dias)):
+                filas = dia_por_fila == fecha
+                self._fusionar(self._ruta_particion(fecha, site), {n: c[filas] for n, c in nuevas.items()},
+                               solo_ultimo=False)
+        self._fusionar(os.path.join(self.directorio, "ultimo", site), nuevas, solo_ultimo=True)
+
+    def _fusionar(self, ruta, nuevas, solo_ultimo):
+        existentes = self._leer(ruta, mmap=False)
+        if existentes is not None:
+            columnas = {n: np.concatenate([existentes[n], nuevas[n]]) for n in COLUMNAS}
+        else:
+            columnas = nuevas
+        orden = np.lexsort((columnas['ts'], columnas['ean']))
+        columnas = {n: c[orden] for n, c in columnas.items()}
+        if solo_ultimo:
+            # Quedarse con la última fila de cada EAN
+            ultimas = np.r_[columnas['ean'][1:] != columnas['ean'][:-1], True]
+            columnas = {n: c[ultimas] for n, c in columnas.items()}
+        self._escribir(ruta, columnas)
+
+    # ---------------------------------------------------------------
+    # Consultas
+    # ---------------------------------------------------------------
+
+    def _fila(self, site, ean, ts, precio, oferta_id):
+        _, ofertas = self._diccionarios()
+        return {
+            'ean': ean,
+            'site': site,
+            'ts': int(ts),
+            'fecha': datetime.fromtimestamp(int(ts)).isoformat(timespec='seconds'),
+            'precio_centavos': int(precio) if precio >= 0 else None,
+            'estado': describir_precio(precio) or 'OK',
+            'oferta': ofertas.valores[oferta_id] if oferta_id < len(ofertas.valores) else '',
+        }
+
+    def historial_ean(self, ean, sitios=None, desde=None):
+        """Observaciones de un EAN en todos los sitios, ordenadas por momento."""
+        eans, _ = self._diccionarios()
+        ean = str(ean).strip()
+        ean_id = eans.obtener_id(ean)
+        if ean_id is None:
+            return []
+
+        with self._bloqueo():
+            filas = self._historial_ean(ean, ean_id, sitios, desde)
+        filas.sort(key=lambda f: (f['ts'], f['site']))
+        return filas
+
+    def _historial_ean(self, ean, ean_id, sitios, desde):
+        filas = []
+        for fecha in self._fechas(desde):
+            ruta_fecha = os.path.join(self.directorio, fecha)
+            for site in sorted(os.listdir(ruta_fecha)):
+                if sitios and site not in sitios:
+                    continue
+                ruta = os.path.join(ruta_fecha, site)
+                archivo_ean = os.path.join(ruta, "ean.bin")
+                if not os.path.exists(archivo_ean) or os.path.getsize(archivo_ean) == 0:
+                    continue
+                col_ean = np.memmap(archivo_ean, dtype=COLUMNAS['ean'], mode='r')
+                ini = int(np.searchsorted(col_ean, ean_id, side='left'))
+                fin = int(np.searchsorted(col_ean, ean_id, side='right'))
+                if ini == fin:
+                    continue
+                # Leer sólo el tramo del EAN en el resto de las columnas
+                cols = {
+                    n: np.fromfile(os.path.join(ruta, f"{n}.bin"), dtype=COLUMNAS[n],
+                                   count=fin - ini, offset=ini * np.dtype(COLUMNAS[n]).itemsize)
+                    for n in ('ts', 'precio', 'oferta')
+                }
+                for i in range(fin - ini):
+                    filas.append(self._fila(site, ean, cols['ts'][i], cols['precio'][i], cols['oferta'][i]))
+        return filas
+
+    def cambios_desde(self, desde, sitios=None):
+        """
+        Cambios de precio u oferta a partir de la fecha `desde` (date).
+        Cada cambio incluye el valor anterior (aunque sea previo a `desde`).
+        """
+        with self._bloqueo():
+            cambios = self._cambios_desde(desde, sitios)
+        cambios.sort(key=lambda f: (f['ts'], f['site'], f['ean']))
+        return cambios
+
+    def _cambios_desde(self, desde, sitios):
+        eans, _ = self._diccionarios()
+        fechas = self._fechas()
+        recientes = [f for f in fechas if datetime.strptime(f, "%Y-%m-%d").date() >= desde]
+        anteriores = [f for f in fechas if f not in recientes]
+
+        cambios = []
+        for site in (sitios or self.sitios()):
+            partes = [self._leer(self._ruta_particion(f, site), mmap=False) for f in recientes]
+            partes = [p for p in partes if p is not None]
+            if not partes:
+                continue
+            cols = {n: np.concatenate([p[n] for p in partes]) for n in COLUMNAS}
+            orden = np.lexsort((cols['ts'], cols['ean']))
+            cols = {n: c[orden] for n, c in cols.items()}
+
+            # Valor previo de cada EAN: la observación anterior dentro del rango,
+            # o la última observación antes de `desde` para la primera del rango
+            prev_precio = np.r_[0, cols['precio'][:-1]]
+            prev_oferta = np.r_[0, cols['oferta'][:-1]]
+            prev_ts = np.r_[0, cols['ts'][:-1]]
+            primera = np.r_[True, cols['ean'][1:] != cols['ean'][:-1]]
+            tiene_prev = ~primera
+
+            pendientes = np.unique(cols['ean'][primera])
+            previos = {}
+            for fecha in reversed(anteriores):
+                if not len(pendientes):
+                    break
+                viejas = self._leer(self._ruta_particion(fecha, site))
+                if viejas is None or not len(viejas['ean']):
+                    continue
+                ultimas = np.flatnonzero(np.r_[viejas['ean'][1:] != viejas['ean'][:-1], True])
+                ultimas = ultimas[np.isin(viejas['ean'][ultimas], pendientes)]
+                for i in ultimas:
+                    previos[int(viejas['ean'][i])] = (viejas['ts'][i], viejas['precio'][i], viejas['oferta'][i])
+                pendientes = np.setdiff1d(pendientes, viejas['ean'][ultimas])
+            for i in np.flatnonzero(primera):
+                previo = previos.get(int(cols['ean'][i]))
+                if previo is not None:
+                    prev_ts[i], prev_precio[i], prev_oferta[i] = previo
+                    tiene_prev[i] = True
+
+            cambio = tiene_prev & ((cols['precio'] != prev_precio) | (cols['oferta'] != prev_oferta))
+            for i in np.flatnonzero(cambio):
+                fila = self._fila(site, eans.valores[cols['ean'][i]], cols['ts'][i], cols['precio'][i], cols['oferta'][i])
+                anterior = self._fila(site, fila['ean'], prev_ts[i], prev_precio[i], prev_oferta[i])
+                fila['anterior'] = {k: anterior[k] for k in ('fecha', 'precio_centavos', 'estado', 'oferta')}
+                cambios.append(fila)
+        return cambios
+
+    def iterar_particiones(self, site, desde=None):
+        """
+        Recorre las particiones de un sitio en orden cronológico.
+
+        Yields:
+            (fecha, columnas) con las columnas ordenadas por (ean, ts).
+        """
+        for fecha in self._fechas(desde):
+            with self._bloqueo():
+                cols = self._leer(self._ruta_particion(fecha, site), mmap=False)
+            if cols is not None and len(cols['ean']):
+                yield fecha, cols
+
+    def cantidad_eans(self):
+        eans, _ = self._diccionarios()
+        return len(eans.valores)
+
+    def id_ean(self, ean):
+        eans, _ = self._diccionarios()
+        return eans.obtener_id(str(ean).strip())
+
+    def ultimas_observaciones(self, site):
+        """
+        Última observación de cada EAN para un sitio.
+
+        Returns:
+            Dict {ean: (ts, precio_codificado, oferta_txt)}
+        """
+        eans, ofertas = self._diccionarios()
+        with self._bloqueo():
+            cols = self._leer(os.path.join(self.directorio, "ultimo", site), mmap=False)
+        if cols is None:
+            return {}
+        return {
+            eans.valores[e]: (int(t), int(p), ofertas.valores[o])
+            for e, t, p, o in zip(cols['ean'], cols['ts'], cols['precio'], cols['oferta'])
+        }
+
+
+class EscrituraHistorial:
+    """
+    Observaciones de un escaneo que se escriben juntas.
+
+    Fusionar cada bloque de la entrada reescribiría la partición del día y la de
+    "ultimo" una vez por bloque (cuadrático en la cantidad de bloques). Las
+    observaciones se codifican al agregarlas (16 bytes cada una) y se fusionan al
+    cerrar, o antes si se acumulan más de max_pendientes.
+
+    Args:
+        historial: HistorialPrecios donde se escriben
+        max_pendientes: Observaciones acumuladas antes de fusionar
+    """
+
+    def __init__(self, historial, max_pendientes=None):
+        self.historial = historial
+        self.max_pendientes = max_pendientes or MAX_PENDIENTES_ESCRITURA
+        self._pendientes = {}
+        self._cantidad = 0
+
+    def agregar(self, site, observaciones, ts=None):
+        """Misma interfaz que HistorialPrecios.agregar; las observaciones quedan pendientes."""
+        ts = int(ts or time.time())
+        with self.historial._lock:
+            nuevas = self.historial._codificar(observaciones, ts)
+        if nuevas is None:
+            return 0
+        self._pendientes.setdefault(site, []).append(nuevas)
+        self._cantidad += len(nuevas['ean'])
+        if self._cantidad >= self.max_pendientes:
+            self.escribir()
+        return len(nuevas['ean'])
+
+    def escribir(self):
+        """Fusiona lo pendiente en las particiones."""
+        pendientes, self._pendientes, self._cantidad = self._pendientes, {}, 0
+        with self.historial._lock:
+            for site, partes in pendientes.items():
+                self.historial._guardar(site, {n: np.concatenate([p[n] for p in partes]) for n in COLUMNAS})
+
+    def cerrar(self):
+        self.escribir()
+
+
+# =====================================================
+# CLI
+# =====================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consultas al historial de precios")
+    parser.add_argument("--dir", help="Carpeta del historial (por defecto DATA_DIR/historial)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_ean = sub.add_parser("ean", help="Historial de un EAN en todos los sitios")
+    p_ean.add_argument("ean")
+    p_ean.add_argument("--sitio", action="append")
+
+    p_cambios = sub.add_parser("cambios", help="Cambios de precio desde una fecha")
+    p_cambios.add_argument("--desde", required=True, help="YYYY-MM-DD")
+    p_cambios.add_argument("--sitio", action="append")
+
+    args = parser.parse_args(argv)
+    directorio = args.dir
+    if not directorio:
+        from configuracion import HISTORIAL_DIR
+        directorio = HISTORIAL_DIR
+    historial = HistorialPrecios(directorio)
+
+    inicio = time.time()
+    if args.comando == "ean":
+        filas = historial.historial_ean(args.ean, sitios=args.sitio)
+    else:
+        filas = historial.cambios_desde(date.fromisoformat(args.desde), sitios=args.sitio)
+    for fila in filas:
+        print(json.dumps(fila, ensure_ascii=False))
+    print(f"{len(filas)} filas en {(time.time() - inicio) * 1000:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Ingesta de planillas subidas (CSV o Excel).
+
+La validación se hace leyendo sólo el encabezado: el archivo se guarda en disco,
+se detecta el separador con los primeros KB y se verifica que estén las columnas
+requeridas. El parseo completo queda para el thread del scraper, que recorre la
+planilla por bloques con iterar_planilla() leyendo sólo las columnas necesarias.
+"""
+import os
+import csv
+import uuid
+import codecs
+import logging
+import unicodedata
+
+REQUIRED_COLS = ['codigo', 'ean', 'descripcion']
+
+# Tamaño de la muestra usada para detectar separador y encabezado
+MUESTRA_BYTES = 64 * 1024
+TAMANO_BLOQUE = 5000
+
+
+def _latin1_si_falla(error):
+    """Bytes que no son UTF-8 válido más allá de la muestra: se leen como latin-1."""
+    return error.object[error.start:error.end].decode('latin-1'), error.end
+
+
+# El encoding se detecta con los primeros MUESTRA_BYTES: un byte latin-1 más
+# adelante no debe cortar el escaneo a mitad de camino
+codecs.register_error('latin1_si_falla', _latin1_si_falla)
+
+
+class PlanillaInvalida(Exception):
+    """Error de formato o columnas en la planilla subida (mensaje apto para el usuario)."""
+
+
+def normalizar_texto(text):
+    """Minúsculas, sin acentos y sin espacios en los extremos."""
+    if not isinstance(text, str): return str(text)
+    return "".join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c)).lower().strip()
+
+
+class Planilla:
+    """
+    Planilla ya validada y guardada en disco, lista para leerse por bloques.
+
+    Args:
+        ruta: Ruta del archivo guardado
+        formato: 'csv', 'xlsx' o 'xls'
+        columnas: Dict {'codigo': nombre_original, 'ean': ..., 'descripcion': ...}
+        separador: Separador detectado (sólo CSV)
+        encoding: Codificación detectada (sólo CSV)
+    """
+
+    def __init__(self, ruta, formato, columnas, separador=None, encoding=None):
+        self.ruta = ruta
+        self.formato = formato
+        self.columnas = columnas
+        self.separador = separador
+        self.encoding = encoding
+
+    def eliminar(self):
+        try:
+            os.remove(self.ruta)
+        except OSError:
+            pass
+
+
+def _mapear_columnas(encabezado):
+    """Devuelve {requerida: nombre_original} o lanza PlanillaInvalida si faltan columnas."""
+    valid_cols_map = {}
+    for c in encabezado:
+        if c is None:
+            continue
+        valid_cols_map.setdefault(normalizar_texto(c), c)
+
+    missing = [req for req in REQUIRED_COLS if req not in valid_cols_map]
+    if missing:
+        found_cols = ", ".join(str(c) for c in encabezado if c is not None)
+        raise PlanillaInvalida(f'Faltan columnas: {", ".join(missing)}. Columnas encontradas: {found_cols}')
+    return {req: valid_cols_map[req] for req in REQUIRED_COLS}
+
+
+def _inspeccionar_csv(ruta):
+    with open(ruta, 'rb') as f:
+        muestra = f.read(MUESTRA_BYTES)
+
+    encoding = 'utf-8-sig'
+    try:
+        texto = muestra.decode(encoding)
+    except UnicodeDecodeError as e:
+        # Un corte a mitad de un caracter multibyte al final de la muestra no cuenta
+        if e.start >= len(muestra) - 3:
+            texto = muestra[:e.start].decode(encoding)
+        else:
+            encoding = 'latin-1'
+            texto = muestra.decode(encoding)
+
+    # Descartar la última línea (posiblemente incompleta) salvo que sea la única
+    lineas = texto.splitlines()
+    if len(muestra) == MUESTRA_BYTES and len(lineas) > 1:
+        lineas = lineas[:-1]
+    if not lineas:
+        raise PlanillaInvalida('El archivo está vacío.')
+
+    try:
+        separador = csv.Sniffer().sniff("\n".join(lineas[:50]), delimiters=";,\t|").delimiter
+    except csv.Error:
+        separador = ';' if lineas[0].count(';') > lineas[0].count(',') else ','
+
+    encabezado = next(csv.reader([lineas[0]], delimiter=separador))
+    return Planilla(ruta, 'csv', _mapear_columnas(encabezado), separador, encoding)
+
+
+def _inspeccionar_xlsx(ruta):
+    from openpyxl import load_workbook
+    wb = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        encabezado = next(wb.active.iter_rows(max_row=1, values_only=True), ())
+    finally:
+        wb.close()
+    return Planilla(ruta, 'xlsx', _mapear_columnas(list(encabezado)))
+
+
+def _inspeccionar_xls(ruta):
+    import pandas as pd
+    encabezado = pd.read_excel(ruta, nrows=0).columns.tolist()
+    return Planilla(ruta, 'xls', _mapear_columnas(encabezado))
+
+
+def _formato(nombre):
+    nombre = nombre.lower()
+    if nombre.endswith('.xlsx'):
+        return 'xlsx'
+    if nombre.endswith('.xls'):
+        return 'xls'
+    if nombre.endswith('.csv'):
+        return 'csv'
+    raise PlanillaInvalida('Formato de archivo no soportado. Use CSV o Excel.')
+
+
+def abrir_planilla(ruta):
+    """Valida el encabezado de una planilla que ya está en disco."""
+    formato = _formato(ruta)
+    if formato == 'csv':
+        planilla = _inspeccionar_csv(ruta)
+    elif formato == 'xlsx':
+        planilla = _inspeccionar_xlsx(ruta)
+    else:
+        planilla = _inspeccionar_xls(ruta)
+    logging.info(f"Planilla validada ({formato}): columnas {planilla.columnas}")
+    return planilla
+
+
+def inspeccionar_planilla(file, directorio):
+    """
+    Guarda el archivo subido y valida su encabezado sin parsear el contenido.
+
+    Args:
+        file: FileStorage de Flask
+        directorio: Carpeta donde guardar la copia
+
+    Returns:
+        Planilla lista para iterar_planilla()
+
+    Raises:
+        PlanillaInvalida: formato no soportado o columnas faltantes
+    """
+    formato = _formato(file.filename)
+
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f"{uuid.uuid4().hex}.{formato}")
+    file.save(ruta)
+
+    try:
+        return abrir_planilla(ruta)
+    except Exception:
+        os.remove(ruta)
+        raise
+
+
+def _valor_celda(valor):
+    """Convierte una celda de Excel a texto (los EAN numéricos sin '.0')."""
+    if valor is None:
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def _bloque_estandar(codigo, ean, descripcion):
+    import pandas as pd
+    return pd.DataFrame({
+        'codigo': codigo,
+        'ean': ean,
+        'descripcion': descripcion,
+        'SKU': ean  # SKU is set from EAN
+    })
+
+
+def iterar_planilla(planilla, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Recorre la planilla por bloques de filas.
+
+    Cada bloque es un DataFrame con las columnas estándar
+    codigo, ean, descripcion y SKU (todas como texto).
+    """
+    # pandas se carga con la primera planilla: la app web arranca sin él
+    import pandas as pd
+    cols = planilla.columnas
+
+    if planilla.formato == 'csv':
+        lector = pd.read_csv(
+            planilla.ruta,
+            sep=planilla.separador,
+            encoding=planilla.encoding,
+            encoding_errors='latin1_si_falla',
+            engine='c',
+            usecols=list(cols.values()),
+            dtype=str,
+            chunksize=tamano_bloque
+        )
+        with lector:
+            for chunk in lector:
+                yield _bloque_estandar(chunk[cols['codigo']], chunk[cols['ean']], chunk[cols['descripcion']])
+
+    elif planilla.formato == 'xlsx':
+        from openpyxl import load_workbook
+        wb = load_workbook(planilla.ruta, read_only=True, data_only=True)
+        try:
+            filas = wb.active.iter_rows(values_only=True)
+            encabezado = list(next(filas, ()))
+            posiciones = [encabezado.index(cols[c]) for c in REQUIRED_COLS]
+
+            bloque = {c: [] for c in REQUIRED_COLS}
+            for fila in filas:
+                if not any(v is not None for v in fila):
+                    continue
+                for c, pos in zip(REQUIRED_COLS, posiciones):
+                    bloque[c].append(_valor_celda(fila[pos]) if pos < len(fila) else None)
+                if len(bloque['ean']) >= tamano_bloque:
+                    yield _bloque_estandar(bloque['codigo'], bloque['ean'], bloque['descripcion'])
+                    bloque = {c: [] for c in REQUIRED_COLS}
+            if bloque['ean']:
+                yield _bloque_estandar(bloque['codigo'], bloque['ean'], bloque['descripcion'])
+        finally:
+            wb.close()
+
+    else:
+        df = pd.read_excel(planilla.ruta, dtype=str, usecols=list(cols.values()))
+        for inicio in range(0, len(df), tamano_bloque):
+            chunk = df.iloc[inicio:inicio + tamano_bloque]
+            yield _bloque_estandar(chunk[cols['codigo']], chunk[cols['ean']], chunk[cols['descripcion']])
+
+
+def cargar_planilla(planilla):
+    """Lee la planilla completa en un único DataFrame estándar."""
+    import pandas as pd
+    bloques = list(iterar_planilla(planilla))
+    if not bloques:
+        return _bloque_estandar([], [], [])
+    return pd.concat(bloques, ignore_index=True)
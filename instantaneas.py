@@ -0,0 +1,429 @@
+"""
+Archivo de instantáneas: el fragmento de DOM de cada búsqueda, para re-extraer offline.
+
+Cuando un sitio renombra una clase hasheada (p.ej. veaargentina-store-theme-2t-mVsKNpKjmCAEM_AMCQH)
+todas las búsquedas del escaneo dan "No encontrado" y la única salida era
+volver a scrapear todo. Con ARCHIVAR_INSTANTANEAS=1 cada búsqueda guarda lo
+que la extracción necesita: el título, los product-summary y las marcas de
+"no encontrado" (o el body sin scripts si ningún selector aparece).
+
+Estructura en disco:
+
+    instantaneas/
+        objetos/ab/cdef...        fragmento comprimido con zlib, nombre = sha256 del contenido
+        escaneos/<escaneo>.jsonl  una línea por búsqueda: sitio, EAN, url, hash y resultado
+
+Los fragmentos repetidos (páginas de "no encontrado", mismo producto en varios
+escaneos) se guardan una sola vez.
+
+Después de corregir los selectores, los buscar_precio_* sin cambios se corren
+sobre el archivo con un driver offline (lxml) en varios procesos:
+
+    python instantaneas.py escaneos
+    python instantaneas.py reextraer 20261019-093000-1a2b3c --procesos 8 --actualizar precios_resultados.xlsx
+
+lxml y cssselect sólo hacen falta para re-extraer.
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import logging
+import argparse
+import hashlib
+import threading
+import functools
+from multiprocessing import Pool
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import NoSuchElementException
+
+# Elementos que se guardan de cada página (hasta MAX_POR_SELECTOR por selector)
+MAX_POR_SELECTOR = 3
+
+JS_FRAGMENTO = """
+const selectores = arguments[0], maximo = arguments[1];
+const partes = [];
+for (const s of selectores) {
+    Array.from(document.querySelectorAll(s)).slice(0, maximo).forEach(e => partes.push(e.outerHTML));
+}
+let cuerpo = partes.join('\\n');
+if (!partes.length && document.body) {
+    const copia = document.body.cloneNode(true);
+    copia.querySelectorAll('script, style, noscript, svg, iframe, link, template').forEach(e => e.remove());
+    cuerpo = copia.innerHTML;
+}
+return [document.title || '', cuerpo];
+"""
+
+PLANTILLA_HTML = "<html><head><title>{titulo}</title></head><body>\n{cuerpo}\n</body></html>"
+
+
+def capturar_fragmento(driver, selectores):
+    """Devuelve un documento HTML mínimo con el título y los fragmentos de la página actual."""
+    from html import escape
+    titulo, cuerpo = driver.execute_script(JS_FRAGMENTO, list(selectores), MAX_POR_SELECTOR)
+    return PLANTILLA_HTML.format(titulo=escape(titulo or ""), cuerpo=cuerpo or "")
+
+
+class ArchivoInstantaneas:
+    """
+    Almacén de fragmentos direccionado por contenido, con un índice por escaneo.
+
+    Args:
+        directorio: Carpeta raíz del archivo (se crea si no existe)
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._objetos = os.path.join(directorio, "objetos")
+        self._escaneos = os.path.join(directorio, "escaneos")
+        os.makedirs(self._objetos, exist_ok=True)
+        os.makedirs(self._escaneos, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _ruta_objeto(self, clave):
+        return os.path.join(self._objetos, clave[:2], clave[2:])
+
+    def guardar_objeto(self, html):
+        """Guarda el fragmento si no existe. Devuelve su clave (sha256)."""
+        datos = html.encode("utf-8")
+        clave = hashlib.sha256(datos).hexdigest()
+        ruta = self._ruta_objeto(clave)
+        if not os.path.exists(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporal, "wb") as f:
+                f.write(zlib.compress(datos, 9))
+            os.replace(temporal, ruta)
+        return clave
+
+    def leer(self, clave):
+        with open(self._ruta_objeto(clave), "rb") as f:
+            return zlib.decompress(f.read()).decode("utf-8")
+
+    def guardar(self, escaneo, site_name, sku, idx, url, html, resultado):
+        """
+        Archiva una búsqueda.
+
+        Args:
+            escaneo: Identificador del escaneo
+            site_name: Nombre del sitio
+            sku: EAN buscado
+            idx: Índice de la fila en la planilla
+            url: URL final de la página (los buscar_precio_* la usan para confirmar el EAN)
+            html: Documento devuelto por capturar_fragmento()
+            resultado: Tupla (precio, oferta, dinamica) extraída en vivo
+        """
+        precio, oferta, dinamica = resultado
+        linea = json.dumps({
+            'site': site_name, 'sku': str(sku), 'idx': int(idx), 'url': url,
+            'hash': self.guardar_objeto(html), 'ts': int(time.time()),
+            'precio': str(precio), 'oferta': str(oferta), 'dinamica': str(dinamica),
+        }, ensure_ascii=False)
+        with self._lock:
+            with open(os.path.join(self._escaneos, f"{escaneo}.jsonl"), "a", encoding="utf-8") as f:
+                f.write(linea + "\n")
+
+    def escaneos(self):
+        """Escaneos archivados, del más reciente al más viejo."""
+        nombres = [n[:-len(".jsonl")] for n in os.listdir(self._escaneos) if n.endswith(".jsonl")]
+        return sorted(nombres, key=lambda n: os.path.getmtime(os.path.join(self._escaneos, f"{n}.jsonl")), reverse=True)
+
+    def entradas(self, escaneo, sitios=None):
+        """Búsquedas archivadas de un escaneo (la última por sitio y EAN)."""
+        ultimas = {}
+        with open(os.path.join(self._escaneos, f"{escaneo}.jsonl"), encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    entrada = json.loads(linea)
+                except ValueError:
+                    continue  # línea cortada por un proceso interrumpido
+                if sitios and entrada['site'] not in sitios:
+                    continue
+                ultimas[(entrada['site'], entrada['sku'])] = entrada
+        return list(ultimas.values())
+
+
+def archivar(archivo, driver, escaneo, site_name, sku, idx, selectores, resultado):
+    """Captura y guarda la página actual del driver. Nunca interrumpe la búsqueda."""
+    try:
+        archivo.guardar(escaneo, site_name, sku, idx, driver.current_url,
+                        capturar_fragmento(driver, selectores), resultado)
+    except Exception as e:
+        logging.debug(f"[{site_name.upper()}] No se pudo archivar la instantánea de {sku}: {e}")
+
+
+# =====================================================
+# DRIVER OFFLINE (lxml)
+# =====================================================
+
+_BLOQUES = {
+    "address", "article", "aside", "blockquote", "dd", "div", "dl", "dt", "fieldset", "figcaption",
+    "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main",
+    "nav", "ol", "p", "pre", "section", "table", "tr", "ul",
+}
+_INVISIBLES = {"script", "style", "noscript", "template", "head"}
+
+
+@functools.lru_cache(maxsize=512)
+def _xpath(by, valor):
+    """Traduce un localizador de selenium (By.*, valor) a XPath relativo al elemento."""
+    if by == By.XPATH:
+        return valor
+    from cssselect import HTMLTranslator
+    if by == By.ID:
+        css = f'[id="{valor}"]'
+    elif by == By.CLASS_NAME:
+        css = f".{valor}"
+    elif by == By.NAME:
+        css = f'[name="{valor}"]'
+    elif by in (By.CSS_SELECTOR, By.TAG_NAME):
+        css = valor
+    else:
+        raise ValueError(f"Localizador no soportado: {by}")
+    return HTMLTranslator().css_to_xpath(css, prefix="descendant::")
+
+
+def _oculto(nodo):
+    estilo = (nodo.get("style") or "").replace(" ", "").lower()
+    return nodo.get("hidden") is not None or "display:none" in estilo or "visibility:hidden" in estilo
+
+
+def _texto_visible(nodo):
+    """Aproximación de WebElement.text: texto sin elementos ocultos, con saltos entre bloques."""
+    partes = []
+
+    def recorrer(n):
+        if isinstance(n.tag, str):
+            if n.tag in _INVISIBLES or _oculto(n):
+                return
+            if n.tag == "br":
+                partes.append("\n")
+            bloque = n.tag in _BLOQUES
+            if bloque:
+                partes.append("\n")
+            if n.text:
+                partes.append(n.text)
+            for hijo in n:
+                recorrer(hijo)
+                if hijo.tail:
+                    partes.append(hijo.tail)
+            if bloque:
+                partes.append("\n")
+
+    recorrer(nodo)
+    lineas = (" ".join(linea.split()) for linea in "".join(partes).split("\n"))
+    return "\n".join(linea for linea in lineas if linea)
+
+
+class _BuscadorOffline:
+    """find_element / find_elements sobre el árbol de lxml."""
+
+    def find_elements(self, by=By.ID, value=None):
+        return [ElementoOffline(n) for n in self._raiz().xpath(_xpath(by, value)) if isinstance(getattr(n, "tag", None), str)]
+
+    def find_element(self, by=By.ID, value=None):
+        elementos = self.find_elements(by, value)
+        if not elementos:
+            raise NoSuchElementException(f"No se encontró el elemento: {by}={value}")
+        return elementos[0]
+
+
+class DocumentoOffline(_BuscadorOffline):
+    """
+    Instantánea con la interfaz de WebDriver que usan los buscar_precio_* de los
+    sitios VTEX. get() no navega y execute_script() no ejecuta nada.
+    """
+
+    def __init__(self, html, url):
+        try:
+            import lxml.html
+        except ImportError:
+            raise ImportError("La re-extracción offline requiere lxml y cssselect: pip install lxml cssselect")
+        self._html = html
+        self._arbol = lxml.html.document_fromstring(html)
+        self.current_url = url
+
+    def _raiz(self):
+        return self._arbol
+
+    def get(self, url):
+        pass
+
+    def set_page_load_timeout(self, segundos):
+        pass
+
+    @property
+    def title(self):
+        return self._arbol.findtext(".//title") or ""
+
+    @property
+    def page_source(self):
+        return self._html
+
+    def execute_script(self, script, *args):
+        return None
+
+    def quit(self):
+        pass
+
+
+class ElementoOffline(_BuscadorOffline):
+    """Elemento de lxml con la interfaz de un WebElement."""
+
+    def __init__(self, nodo):
+        self._nodo = nodo
+
+    def _raiz(self):
+        return self._nodo
+
+    @property
+    def text(self):
+        return _texto_visible(self._nodo)
+
+    def get_attribute(self, nombre):
+        return self._nodo.get(nombre)
+
+    def is_displayed(self):
+        nodo = self._nodo
+        while nodo is not None:
+            if _oculto(nodo):
+                return False
+            nodo = nodo.getparent()
+        return True
+
+    def is_enabled(self):
+        return self._nodo.get("disabled") is None
+
+
+class EsperaInmediata(WebDriverWait):
+    """WebDriverWait que evalúa una sola vez: en un DOM estático esperar no cambia nada."""
+
+    def __init__(self, driver, timeout=0, poll_frequency=0.5, ignored_exceptions=None):
+        super().__init__(driver, 0, poll_frequency, ignored_exceptions)
+
+
+# =====================================================
+# RE-EXTRACCIÓN EN PARALELO
+# =====================================================
+
+_proceso = {}
+
+
+def _iniciar_proceso(directorio):
+    # Los buscar_precio_* imprimen y loguean cada paso: en los procesos hijos sólo interesan los errores
+    sys.stdout = open(os.devnull, "w")
+    logging.disable(logging.WARNING)
+    import comparador_completo
+    comparador_completo.WebDriverWait = EsperaInmediata
+    _proceso['archivo'] = ArchivoInstantaneas(directorio)
+    _proceso['buscadores'] = comparador_completo.BUSCADORES
+    _proceso['normalizar'] = comparador_completo.normalizar_resultado
+
+
+def _reextraer(entrada):
+    try:
+        driver = DocumentoOffline(_proceso['archivo'].leer(entrada['hash']), entrada['url'])
+        buscar = _proceso['buscadores'][entrada['site']]
+        precio, oferta, dinamica = _proceso['normalizar'](buscar(driver, entrada['sku']))
+    except Exception as e:
+        logging.error(f"[{entrada['site'].upper()}] Error re-extrayendo {entrada['sku']}: {e}")
+        precio, oferta, dinamica = "Error", "", ""
+    return {**entrada, 'precio_nuevo': str(precio), 'oferta_nueva': str(oferta), 'dinamica_nueva': str(dinamica)}
+
+
+def reextraer(directorio, escaneo, sitios=None, procesos=None):
+    """
+    Corre los buscar_precio_* actuales sobre las instantáneas de un escaneo.
+
+    Args:
+        directorio: Carpeta del archivo de instantáneas
+        escaneo: Identificador del escaneo
+        sitios: Sitios a re-extraer (por defecto todos los archivados)
+        procesos: Procesos en paralelo (por defecto, uno por núcleo)
+
+    Returns:
+        Lista de entradas del índice con precio_nuevo, oferta_nueva y dinamica_nueva
+    """
+    entradas = ArchivoInstantaneas(directorio).entradas(escaneo, sitios)
+    if not entradas:
+        return []
+    procesos = max(1, min(procesos or os.cpu_count() or 1, len(entradas)))
+    with Pool(procesos, initializer=_iniciar_proceso, initargs=(directorio,)) as pool:
+        return list(pool.imap_unordered(_reextraer, entradas, chunksize=32))
+
+
+def actualizar_resultados(archivo_salida, resultados):
+    """Vuelca los precios re-extraídos en un archivo de resultados y recalcula las columnas derivadas."""
+    import pandas as pd
+    from precios import agregar_columnas_numericas, comparar_sitios
+
+    df = pd.read_excel(archivo_salida, dtype={"SKU": str})
+    fila_por_sku = {str(sku).strip(): i for i, sku in zip(df.index, df["SKU"])}
+    actualizados = 0
+    for r in resultados:
+        i = fila_por_sku.get(r['sku'])
+        if i is None:
+            continue
+        sitio = r['site'].upper()
+        df.at[i, f"Precio {sitio}"] = r['precio_nuevo']
+        df.at[i, f"Oferta {sitio}"] = r['oferta_nueva']
+        if f"Dinamica {sitio}" in df.columns:
+            df.at[i, f"Dinamica {sitio}"] = r['dinamica_nueva']
+        actualizados += 1
+    df = comparar_sitios(agregar_columnas_numericas(df))
+    df.to_excel(archivo_salida, index=False)
+    return actualizados
+
+
+def main():
+    from configuracion import INSTANTANEAS_DIR, configurar_logging
+    configurar_logging()
+
+    parser = argparse.ArgumentParser(description="Archivo de instantáneas y re-extracción offline")
+    parser.add_argument("--dir", default=INSTANTANEAS_DIR, help="Carpeta del archivo de instantáneas")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("escaneos", help="Lista los escaneos archivados")
+    p = sub.add_parser("reextraer", help="Re-extrae los precios de un escaneo con los selectores actuales")
+    p.add_argument("escaneo")
+    p.add_argument("--sitios", default="", help="Sitios separados por coma (por defecto todos)")
+    p.add_argument("--procesos", type=int, default=None, help="Procesos en paralelo (por defecto uno por núcleo)")
+    p.add_argument("--salida", default=None, help="CSV con el resultado anterior y el nuevo de cada búsqueda")
+    p.add_argument("--actualizar", default=None, help="Archivo de resultados (xlsx) donde volcar los precios nuevos")
+    args = parser.parse_args()
+
+    archivo = ArchivoInstantaneas(args.dir)
+    if args.comando == "escaneos":
+        for escaneo in archivo.escaneos():
+            print(f"{escaneo}\t{len(archivo.entradas(escaneo))} búsquedas")
+        return
+
+    sitios = [s.strip() for s in args.sitios.split(",") if s.strip()] or None
+    inicio = time.time()
+    resultados = reextraer(args.dir, args.escaneo, sitios, args.procesos)
+    if not resultados:
+        print(f"El escaneo {args.escaneo} no tiene instantáneas")
+        return
+    print(f"🗃️ {len(resultados)} búsquedas re-extraídas en {time.time() - inicio:.1f}s")
+
+    for site in sorted({r['site'] for r in resultados}):
+        del_sitio = [r for r in resultados if r['site'] == site]
+        cambiados = sum(1 for r in del_sitio if (r['precio'], r['oferta']) != (r['precio_nuevo'], r['oferta_nueva']))
+        recuperados = sum(1 for r in del_sitio if r['precio'] in ("No encontrado", "Error")
+                          and r['precio_nuevo'] not in ("No encontrado", "Error"))
+        print(f"   [{site.upper()}] {len(del_sitio)} búsquedas | {cambiados} cambiaron | {recuperados} recuperadas")
+
+    if args.salida:
+        import pandas as pd
+        columnas = ['site', 'sku', 'idx', 'precio', 'oferta', 'dinamica', 'precio_nuevo', 'oferta_nueva', 'dinamica_nueva']
+        pd.DataFrame(resultados, columns=columnas).sort_values(['site', 'idx']).to_csv(args.salida, index=False)
+        print(f"💾 Detalle guardado en {args.salida}")
+    if args.actualizar:
+        print(f"💾 {actualizar_resultados(args.actualizar, resultados)} precios actualizados en {args.actualizar}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+Lotes de EANs por API: NDJSON o CSV de entrada, NDJSON de resultados.
+
+POST /api/jobs recibe el cuerpo fila por fila y cada EAN entra a la cola de
+cada sitio apenas se lee, así que las búsquedas empiezan antes de que termine
+la subida. Cada sitio tiene sus propios hilos (ver consulta.py para cómo se
+resuelve cada búsqueda) y los resultados se agregan, en orden de llegada, a
+un archivo NDJSON:
+
+    lotes/<id>.ndjson   una línea por (EAN, sitio) con su offset
+    lotes/<id>.json     sitios, estado y cantidad de filas del lote
+
+GET /api/jobs/<id>/results?desde=N devuelve las líneas desde el offset N y
+sigue transmitiendo hasta que el lote termina. Un cliente que se corta
+retoma con desde = último offset recibido + 1.
+"""
+import os
+import csv
+import json
+import asyncio
+import time
+import uuid
+import queue
+import logging
+import threading
+from array import array
+
+from ingesta import normalizar_texto
+
+# Lotes que se conservan en disco
+MAX_LOTES = 50
+# Segundos entre latidos del stream de resultados cuando no hay novedades
+INTERVALO_LATIDO = 15
+# Líneas de resultados por lectura del archivo en el stream async
+LINEAS_POR_LECTURA = 1000
+
+COLUMNAS_EAN = ('ean', 'sku', 'codigo de barras', 'codigo_barras')
+
+RECIBIENDO = "recibiendo"
+BUSCANDO = "buscando"
+TERMINADO = "terminado"
+INTERRUMPIDO = "interrumpido"
+
+
+class EntradaInvalida(Exception):
+    """El cuerpo del lote no se puede interpretar (mensaje apto para el usuario)."""
+
+
+# =====================================================
+# ENTRADA
+# =====================================================
+
+def _fila_ndjson(linea):
+    dato = json.loads(linea)
+    if isinstance(dato, (str, int)):
+        return {'ean': str(dato)}
+    if not isinstance(dato, dict):
+        raise ValueError("se esperaba un objeto o un EAN")
+    claves = {normalizar_texto(k): v for k, v in dato.items()}
+    ean = next((claves[c] for c in COLUMNAS_EAN if claves.get(c) not in (None, "")), None)
+    return {'ean': str(ean), 'codigo': str(claves.get('codigo', '')), 'descripcion': str(claves.get('descripcion', ''))}
+
+
+def leer_filas(lineas, formato):
+    """
+    Recorre el cuerpo línea por línea sin leerlo entero.
+
+    Args:
+        lineas: Iterable de líneas en bytes (p.ej. request.stream)
+        formato: 'ndjson' o 'csv'
+
+    Yields:
+        Dicts {'ean', 'codigo', 'descripcion'}, o None por cada línea inválida
+    """
+    textos = (l.decode('utf-8-sig', errors='replace') for l in lineas)
+    if formato == 'csv':
+        primera = next(textos, '')
+        try:
+            separador = csv.Sniffer().sniff(primera, delimiters=",;\t|").delimiter
+        except csv.Error:
+            separador = ','
+        encabezado = [normalizar_texto(c) for c in next(csv.reader([primera], delimiter=separador), [])]
+        col_ean = next((encabezado.index(c) for c in COLUMNAS_EAN if c in encabezado), None)
+        if col_ean is None:
+            raise EntradaInvalida(f"El CSV no tiene columna de EAN ({', '.join(COLUMNAS_EAN)})")
+        col_codigo = encabezado.index('codigo') if 'codigo' in encabezado else None
+        col_desc = encabezado.index('descripcion') if 'descripcion' in encabezado else None
+        for valores in csv.reader(textos, delimiter=separador):
+            if not valores:
+                continue
+            try:
+                yield {
+                    'ean': valores[col_ean],
+                    'codigo': valores[col_codigo] if col_codigo is not None else '',
+                    'descripcion': valores[col_desc] if col_desc is not None else '',
+                }
+            except IndexError:
+                yield None
+        return
+
+    for linea in textos:
+        if not linea.strip():
+            continue
+        try:
+            yield _fila_ndjson(linea)
+        except (ValueError, TypeError):
+            yield None
+
+
+def ean_valido(ean):
+    ean = str(ean).strip()
+    return ean.isdigit() and len(ean) <= 19
+
+
+# =====================================================
+# LOTE
+# =====================================================
+
+class Lote:
+    """
+    Un lote en curso o terminado.
+
+    Args:
+        lote_id: Identificador
+        directorio: Carpeta de los lotes
+        sitios: Sitios a consultar
+        resolver: Callable resolver(site, ean) -> (resultado, fuente) (ver ConsultaPrecios.resolver)
+        hilos_sitio: Callable hilos_sitio(site) -> búsquedas simultáneas en ese sitio
+    """
+
+    def __init__(self, lote_id, directorio, sitios, resolver=None, hilos_sitio=None):
+        self.id = lote_id
+        self.sitios = list(sitios)
+        self.ruta = os.path.join(directorio, f"{lote_id}.ndjson")
+        self.ruta_meta = os.path.join(directorio, f"{lote_id}.json")
+        self.resolver = resolver
+        self.estado = RECIBIENDO
+        self.filas = 0
+        self.invalidas = 0
+        self.creado = time.time()
+        self._pendientes = 0
+        self._offsets = array('Q')  # posición en bytes de cada línea del NDJSON
+        self._cond = threading.Condition()
+        # Lectores async de los resultados (ver leer_async): (event loop, asyncio.Event)
+        self._esperas = set()
+        self._colas = {}
+        self._hilos = {}
+        if resolver is not None:
+            open(self.ruta, 'wb').close()
+            for site in self.sitios:
+                self._colas[site] = queue.Queue()
+                self._hilos[site] = max(1, hilos_sitio(site) if hilos_sitio else 1)
+                for n in range(self._hilos[site]):
+                    threading.Thread(target=self._trabajar, args=(site,), daemon=True,
+                                     name=f"Lote-{lote_id[:8]}-{site}-{n + 1}").start()
+            self._guardar_meta()
+
+    @classmethod
+    def abrir(cls, lote_id, directorio):
+        """Lote de un proceso anterior (sólo lectura). Devuelve None si no existe."""
+        ruta_meta = os.path.join(directorio, f"{lote_id}.json")
+        if not os.path.exists(ruta_meta):
+            return None
+        with open(ruta_meta, encoding='utf-8') as f:
+            meta = json.load(f)
+        lote = cls(lote_id, directorio, meta['sitios'])
+        lote.filas = meta.get('filas', 0)
+        lote.invalidas = meta.get('invalidas', 0)
+        lote.creado = meta.get('creado', lote.creado)
+        # Un lote que no terminó quedó cortado por el reinicio
+        lote.estado = meta['estado'] if meta['estado'] == TERMINADO else INTERRUMPIDO
+        if os.path.exists(lote.ruta):
+            with open(lote.ruta, 'rb') as f:
+                posicion = 0
+                for linea in f:
+                    lote._offsets.append(posicion)
+                    posicion += len(linea)
+        return lote
+
+    def _guardar_meta(self):
+        tmp = f"{self.ruta_meta}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'sitios': self.sitios, 'estado': self.estado, 'filas': self.filas,
+                       'invalidas': self.invalidas, 'creado': self.creado}, f)
+        os.replace(tmp, self.ruta_meta)
+
+    def info(self):
+        return {
+            'id': self.id,
+            'estado': self.estado,
+            'sitios': self.sitios,
+            'filas': self.filas,
+            'invalidas': self.invalidas,
+            'resultados': len(self._offsets),
+            'esperados': self.filas * len(self.sitios),
+        }
+
+    # ---------------------------------------------------------------
+    # BÚSQUEDA
+    # ---------------------------------------------------------------
+
+    def agregar(self, fila):
+        """Encola un EAN en todos los sitios. Devuelve False si el EAN no es válido."""
+        if fila is None or not ean_valido(fila['ean']):
+            self.invalidas += 1
+            return False
+        fila = {**fila, 'ean': str(fila['ean']).strip()}
+        with self._cond:
+            self.filas += 1
+            self._pendientes += len(self.sitios)
+        for site in self.sitios:
+            self._colas[site].put(fila)
+        return True
+
+    def cerrar_entrada(self):
+        """Se terminó de leer el cuerpo: el lote termina cuando se vacíen las colas."""
+        with self._cond:
+            self.estado = BUSCANDO if self._pendientes else TERMINADO
+            self._guardar_meta()
+            self._notificar()
+        # Un aviso de fin por hilo, detrás de lo que ya está en la cola
+        for site, cola in self._colas.items():
+            for _ in range(self._hilos[site]):
+                cola.put(None)
+
+    def _trabajar(self, site):
+        cola = self._colas[site]
+        while True:
+            fila = cola.get()
+            if fila is None:
+                return
+            try:
+                (precio, oferta, dinamica), fuente = self.resolver(site, fila['ean'])
+            except Exception as e:
+                logging.warning(f"[{site.upper()}] 📦 Lote {self.id[:8]}: error con {fila['ean']}: {e}")
+                (precio, oferta, dinamica), fuente = ("Error", "", ""), "vivo"
+            self._escribir({
+                'ean': fila['ean'], 'codigo': fila.get('codigo', ''), 'descripcion': fila.get('descripcion', ''),
+                'site': site, 'precio': precio, 'oferta': oferta, 'dinamica': dinamica, 'fuente': fuente,
+            })
+
+    def _escribir(self, resultado):
+        with self._cond:
+            offset = len(self._offsets)
+            linea = (json.dumps({'tipo': 'resultado', 'offset': offset, **resultado}, ensure_ascii=False) + "\n").encode('utf-8')
+            with open(self.ruta, 'ab') as f:
+                self._offsets.append(f.tell())
+                f.write(linea)
+            self._pendientes -= 1
+            if self.estado == BUSCANDO and self._pendientes == 0:
+                self.estado = TERMINADO
+                self._guardar_meta()
+                logging.info(f"📦 Lote {self.id} terminado: {len(self._offsets)} resultados")
+            self._notificar()
+
+    # ---------------------------------------------------------------
+    # RESULTADOS
+    # ---------------------------------------------------------------
+
+    def _terminado(self):
+        return self.estado in (TERMINADO, INTERRUMPIDO)
+
+    def _notificar(self):
+        """Despierta a los lectores sync y async (con self._cond tomado)."""
+        self._cond.notify_all()
+        for loop, evento in self._esperas:
+            try:
+                loop.call_soon_threadsafe(evento.set)
+            except RuntimeError:
+                # El event loop ya se cerró
+                pass
+
+    def _lineas(self, desde, hasta):
+        """Líneas NDJSON [desde, hasta) juntas, en bytes."""
+        with open(self.ruta, 'rb') as f:
+            f.seek(self._offsets[desde])
+            return b"".join(f.readline() for _ in range(hasta - desde))
+
+    def _fin(self, total):
+        return (json.dumps({'tipo': 'fin', 'estado': self.estado, 'total': total}) + "\n").encode('utf-8')
+
+    @staticmethod
+    def _latido(offset):
+        return (json.dumps({'tipo': 'latido', 'offset': offset}) + "\n").encode('utf-8')
+
+    def leer(self, desde=0):
+        """
+        Líneas NDJSON (bytes) desde el offset `desde`; sigue esperando las nuevas
+        hasta que el lote termina. Cierra con {"tipo": "fin"}.
+        """
+        siguiente = max(0, desde)
+        while True:
+            with self._cond:
+                if siguiente >= len(self._offsets) and not self._terminado():
+                    self._cond.wait(INTERVALO_LATIDO)
+                disponibles = len(self._offsets)
+                terminado = self._terminado()
+            if siguiente < disponibles:
+                hasta = min(disponibles, siguiente + LINEAS_POR_LECTURA)
+                yield self._lineas(siguiente, hasta)
+                siguiente = hasta
+            elif terminado:
+                yield self._fin(disponibles)
+                return
+            else:
+                yield self._latido(disponibles)
+
+    async def leer_async(self, desde=0):
+        """
+        Igual que leer(), como generador async para el servidor ASGI (ver asgi.py):
+        mientras espera resultados no ocupa ningún thread. El archivo se lee en el
+        pool de asyncio.
+        """
+        evento = asyncio.Event()
+        espera = (asyncio.get_running_loop(), evento)
+        with self._cond:
+            self._esperas.add(espera)
+        try:
+            siguiente = max(0, desde)
+            while True:
+                with self._cond:
+                    # Se limpia bajo el lock: un aviso posterior a esta lectura no se pierde
+                    evento.clear()
+                    disponibles = len(self._offsets)
+                    terminado = self._terminado()
+                if siguiente < disponibles:
+                    hasta = min(disponibles, siguiente + LINEAS_POR_LECTURA)
+                    yield await asyncio.to_thread(self._lineas, siguiente, hasta)
+                    siguiente = hasta
+                elif terminado:
+                    yield self._fin(disponibles)
+                    return
+                else:
+                    try:
+                        await asyncio.wait_for(evento.wait(), INTERVALO_LATIDO)
+                    except asyncio.TimeoutError:
+                        yield self._latido(disponibles)
+        finally:
+            with self._cond:
+                self._esperas.discard(espera)
+
+
+class GestorLotes:
+    """
+    Lotes del proceso, con los terminados de procesos anteriores en disco.
+
+    Args:
+        directorio: Carpeta de los lotes
+        resolver: Ver Lote
+        hilos_sitio: Ver Lote
+    """
+
+    def __init__(self, directorio, resolver, hilos_sitio=None):
+        self.directorio = directorio
+        self.resolver = resolver
+        self.hilos_sitio = hilos_sitio
+        self._lotes = {}
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+    def crear(self, sitios, lote_id=None):
+        lote_id = lote_id or uuid.uuid4().hex
+        with self._lock:
+            if lote_id in self._lotes or os.path.exists(os.path.join(self.directorio, f"{lote_id}.json")):
+                raise EntradaInvalida(f"Ya existe un lote {lote_id}")
+            self._limpiar()
+            lote = Lote(lote_id, self.directorio, sitios, self.resolver, self.hilos_sitio)
+            self._lotes[lote_id] = lote
+        return lote
+
+    def obtener(self, lote_id):
+        with self._lock:
+            lote = self._lotes.get(lote_id)
+            if lote is None and lote_id.replace('-', '').isalnum():
+                lote = Lote.abrir(lote_id, self.directorio)
+            return lote
+
+    def _limpiar(self):
+        metas = sorted((os.path.getmtime(os.path.join(self.directorio, n)), n[:-len(".json")])
+                       for n in os.listdir(self.directorio) if n.endswith(".json"))
+        for _, lote_id in metas[:max(0, len(metas) - MAX_LOTES + 1)]:
+            lote = self._lotes.get(lote_id)
+            if lote is not None and not lote._terminado():
+                continue
+            self._lotes.pop(lote_id, None)
+            for extension in (".json", ".ndjson"):
+                try:
+                    os.remove(os.path.join(self.directorio, f"{lote_id}{extension}"))
+                except OSError:
+                    pass
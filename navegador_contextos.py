@@ -0,0 +1,320 @@
+"""
+Backend de navegador por contextos: un único Chromium con muchos contextos aislados.
+
+Con selenium cada hilo de búsqueda levanta un Chrome completo (cientos de MB).
+Acá se lanza un solo Chromium vía Playwright y cada hilo recibe un contexto
+propio (cookies, storage y caché separados, como un perfil incógnito), que
+cuesta decenas de MB. Una sesión de NINI y los sitios VTEX conviven en el
+mismo proceso sin compartir cookies.
+
+ContextoNavegador imita la parte de la API de WebDriver que usan los
+buscar_precio_* (get, find_element(s), page_source, execute_script, send_keys,
+click...), así que funciona con WebDriverWait y expected_conditions sin cambios.
+Playwright es opcional: sólo se importa al usar NAVEGADOR_BACKEND=contextos.
+"""
+import os
+import asyncio
+import atexit
+import logging
+import threading
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.common.exceptions import (
+    NoSuchElementException,
+    StaleElementReferenceException,
+    ElementClickInterceptedException,
+    TimeoutException,
+    WebDriverException,
+)
+
+# Margen para operaciones que no son cargas de página (click, evaluate, etc.)
+TIMEOUT_OPERACION = 60
+TIMEOUT_CLICK_MS = 5000
+
+RECURSOS_BLOQUEADOS = {"image", "stylesheet", "font", "media"}
+
+# page_load_strategy de selenium -> evento de carga que espera page.goto()
+ESPERA_SEGUN_ESTRATEGIA = {"normal": "load", "eager": "domcontentloaded", "none": "commit"}
+
+_TECLAS = {
+    Keys.ENTER: "Enter",
+    Keys.RETURN: "Enter",
+    Keys.DELETE: "Delete",
+    Keys.BACKSPACE: "Backspace",
+    Keys.TAB: "Tab",
+    Keys.ESCAPE: "Escape",
+    Keys.ARROW_DOWN: "ArrowDown",
+    Keys.ARROW_UP: "ArrowUp",
+    Keys.HOME: "Home",
+    Keys.END: "End",
+}
+_MODIFICADORES = {Keys.CONTROL: "Control", Keys.SHIFT: "Shift", Keys.ALT: "Alt"}
+
+
+def _selector(by, valor):
+    """Traduce un localizador de selenium (By.*, valor) a un selector de Playwright."""
+    if by == By.CSS_SELECTOR:
+        return f"css={valor}"
+    if by == By.ID:
+        return f'css=[id="{valor}"]'
+    if by == By.CLASS_NAME:
+        return f"css=.{valor}"
+    if by == By.TAG_NAME:
+        return f"css={valor}"
+    if by == By.NAME:
+        return f'css=[name="{valor}"]'
+    if by == By.XPATH:
+        return f"xpath={valor}"
+    raise ValueError(f"Localizador no soportado: {by}")
+
+
+def _envolver_script(script):
+    # Los scripts de selenium usan `arguments[n]` y `return`
+    return f"(args) => (function() {{ {script} }}).apply(null, args)"
+
+
+def _traducir_error(e):
+    """Convierte errores de Playwright a las excepciones de selenium que espera el código."""
+    mensaje = str(e)
+    nombre = type(e).__name__
+    if nombre == "TimeoutError":
+        return TimeoutException(mensaje)
+    if "not attached" in mensaje or "detached" in mensaje:
+        return StaleElementReferenceException(mensaje)
+    if "has been closed" in mensaje or "Target closed" in mensaje or "crashed" in mensaje:
+        # worker_site reinicia el navegador ante "session deleted"
+        return WebDriverException(f"session deleted: {mensaje}")
+    return WebDriverException(mensaje)
+
+
+async def _filtrar_recurso(route):
+    if route.request.resource_type in RECURSOS_BLOQUEADOS:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+# =====================================================
+# NAVEGADOR COMPARTIDO
+# =====================================================
+
+class NavegadorCompartido:
+    """
+    Un Chromium por proceso, manejado desde un event loop en un thread propio.
+    Los hilos de búsqueda llaman a ejecutar() con corrutinas de Playwright.
+    """
+
+    _instancia = None
+    _lock = threading.Lock()
+
+    def __init__(self, headless=True):
+        from playwright.async_api import async_playwright
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="NavegadorCompartido", daemon=True)
+        self._thread.start()
+        self._playwright = self.ejecutar(async_playwright().start())
+        self._browser = self.ejecutar(self._lanzar(headless))
+        logging.info("🌐 Chromium compartido iniciado (backend de contextos)")
+
+    @classmethod
+    def obtener(cls, headless=True):
+        """Devuelve el navegador del proceso, lanzándolo (o relanzándolo si murió)."""
+        with cls._lock:
+            if cls._instancia is None or not cls._instancia.conectado():
+                if cls._instancia is not None:
+                    logging.warning("🌐 Chromium compartido desconectado. Relanzando...")
+                    cls._instancia.cerrar()
+                cls._instancia = cls(headless=headless)
+            return cls._instancia
+
+    async def _lanzar(self, headless):
+        opciones = {
+            'headless': headless,
+            'args': [
+                "--no-sandbox",
+                "--disable-dev-shm-usage",
+                "--disable-gpu",
+                "--disable-extensions",
+                "--disable-blink-features=AutomationControlled",
+                "--blink-settings=imagesEnabled=false",
+                "--mute-audio",
+            ],
+        }
+        # En Docker se usa el Chrome del sistema en lugar del que descarga Playwright
+        chrome = os.environ.get("CHROME_BIN")
+        if chrome and os.path.exists(chrome):
+            opciones['executable_path'] = chrome
+        return await self._playwright.chromium.launch(**opciones)
+
+    def ejecutar(self, corrutina, timeout=TIMEOUT_OPERACION):
+        futuro = asyncio.run_coroutine_threadsafe(corrutina, self._loop)
+        try:
+            return futuro.result(timeout)
+        except WebDriverException:
+            raise
+        except Exception as e:
+            futuro.cancel()
+            raise _traducir_error(e) from e
+
+    def conectado(self):
+        try:
+            return self._browser.is_connected()
+        except Exception:
+            return False
+
+    async def _nuevo_contexto(self, bloquear_recursos):
+        contexto = await self._browser.new_context(viewport={'width': 1920, 'height': 1080})
+        await contexto.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        if bloquear_recursos:
+            await contexto.route("**/*", _filtrar_recurso)
+        pagina = await contexto.new_page()
+        return contexto, pagina
+
+    def nuevo_contexto(self, bloquear_recursos=True, estrategia_carga="normal"):
+        """Crea un contexto aislado con una pestaña, listo para usarse como driver."""
+        contexto, pagina = self.ejecutar(self._nuevo_contexto(bloquear_recursos))
+        return ContextoNavegador(self, contexto, pagina, estrategia_carga)
+
+    def cerrar(self):
+        async def _cerrar():
+            try:
+                await self._browser.close()
+            finally:
+                await self._playwright.stop()
+        try:
+            self.ejecutar(_cerrar(), timeout=15)
+        except Exception as e:
+            logging.debug(f"Error cerrando Chromium compartido: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+@atexit.register
+def _cerrar_al_salir():
+    if NavegadorCompartido._instancia is not None:
+        NavegadorCompartido._instancia.cerrar()
+
+
+# =====================================================
+# ADAPTADORES CON INTERFAZ DE WEBDRIVER
+# =====================================================
+
+class _Buscador:
+    """find_element / find_elements comunes a la página y a los elementos."""
+
+    def _raiz(self):
+        raise NotImplementedError
+
+    def find_elements(self, by=By.ID, value=None):
+        handles = self._navegador.ejecutar(self._raiz().query_selector_all(_selector(by, value)))
+        return [ElementoNavegador(self._navegador, h) for h in handles]
+
+    def find_element(self, by=By.ID, value=None):
+        handle = self._navegador.ejecutar(self._raiz().query_selector(_selector(by, value)))
+        if handle is None:
+            raise NoSuchElementException(f"No se encontró el elemento: {by}={value}")
+        return ElementoNavegador(self._navegador, handle)
+
+
+class ContextoNavegador(_Buscador):
+    """Contexto aislado del Chromium compartido con la interfaz de un WebDriver."""
+
+    def __init__(self, navegador, contexto, pagina, estrategia_carga="normal"):
+        self._navegador = navegador
+        self._contexto = contexto
+        self._pagina = pagina
+        self._timeout_carga = 30
+        self._esperar_hasta = ESPERA_SEGUN_ESTRATEGIA.get(estrategia_carga, "load")
+
+    def _raiz(self):
+        return self._pagina
+
+    def set_page_load_timeout(self, segundos):
+        self._timeout_carga = segundos
+
+    def get(self, url):
+        self._navegador.ejecutar(
+            self._pagina.goto(url, wait_until=self._esperar_hasta, timeout=self._timeout_carga * 1000),
+            timeout=self._timeout_carga + 5
+        )
+
+    @property
+    def current_url(self):
+        return self._pagina.url
+
+    @property
+    def title(self):
+        return self._navegador.ejecutar(self._pagina.title())
+
+    @property
+    def page_source(self):
+        return self._navegador.ejecutar(self._pagina.content())
+
+    def execute_script(self, script, *args):
+        argumentos = [a._handle if isinstance(a, ElementoNavegador) else a for a in args]
+        return self._navegador.ejecutar(self._pagina.evaluate(_envolver_script(script), argumentos))
+
+    def quit(self):
+        try:
+            self._navegador.ejecutar(self._contexto.close(), timeout=15)
+        except Exception:
+            pass
+
+
+class ElementoNavegador(_Buscador):
+    """ElementHandle de Playwright con la interfaz de un WebElement."""
+
+    def __init__(self, navegador, handle):
+        self._navegador = navegador
+        self._handle = handle
+
+    def _raiz(self):
+        return self._handle
+
+    @property
+    def text(self):
+        return self._navegador.ejecutar(self._handle.inner_text())
+
+    def get_attribute(self, nombre):
+        return self._navegador.ejecutar(self._handle.get_attribute(nombre))
+
+    def is_displayed(self):
+        return self._navegador.ejecutar(self._handle.is_visible())
+
+    def is_enabled(self):
+        return self._navegador.ejecutar(self._handle.is_enabled())
+
+    def click(self):
+        try:
+            self._navegador.ejecutar(self._handle.click(timeout=TIMEOUT_CLICK_MS))
+        except TimeoutException as e:
+            # Playwright espera a que el elemento sea clickeable; si no lo es, otro lo tapa
+            raise ElementClickInterceptedException(f"element click intercepted: {e.msg}")
+
+    def send_keys(self, *valores):
+        self._navegador.ejecutar(self._escribir("".join(str(v) for v in valores)))
+
+    async def _escribir(self, texto):
+        # Como en selenium, un modificador queda presionado hasta el final (o Keys.NULL)
+        modificadores = []
+        pendiente = []
+
+        async def volcar():
+            if pendiente:
+                await self._handle.type("".join(pendiente))
+                pendiente.clear()
+
+        for c in texto:
+            if c in _MODIFICADORES:
+                await volcar()
+                modificadores.append(_MODIFICADORES[c])
+            elif c == Keys.NULL:
+                await volcar()
+                modificadores = []
+            elif c in _TECLAS or modificadores:
+                await volcar()
+                await self._handle.press("+".join(modificadores + [_TECLAS.get(c, c)]))
+            else:
+                pendiente.append(c)
+        await volcar()
@@ -0,0 +1,337 @@
+"""
+Perfilado opcional de un escaneo: dónde se va el tiempo en producción.
+
+Con perfilar=True (checkbox en /start, --perfilar en la CLI) run_scraper activa
+un Perfilador mientras dura el escaneo:
+
+- un muestreador lee cada INTERVALO_MUESTREO las pilas de los threads del
+  escaneo (sys._current_frames) y cuenta las pilas iguales: con eso se arma el
+  flame graph (SVG autocontenido) y el formato "folded" de flamegraph.pl /
+  speedscope. No instrumenta nada: el costo es proporcional a la cantidad de
+  threads, no a lo que hagan;
+- los tramos (tramo("navegar"), tramo("EAN ...")) registran una línea de tiempo
+  por EAN en formato trace-event de Chrome (chrome://tracing, Perfetto).
+  Sin perfilador activo, tramo() es una comparación y nada más.
+
+Los archivos quedan en PERFILES_DIR/<trabajo_id>/ y se descargan por /perfil.
+"""
+import os
+import sys
+import json
+import time
+import re
+import html
+import logging
+import threading
+from collections import Counter
+
+# Segundos entre muestras de las pilas
+INTERVALO_MUESTREO = 0.01
+# Tope de tramos por escaneo: más allá se cuentan pero no se guardan
+MAX_TRAMOS = 500_000
+# Threads del escaneo, además del que llama a run_scraper (ver comparador_completo.py)
+PREFIJOS_HILOS = ("Worker-", "Driver-", "Enlaces-", "Catalogo-")
+# Número de navegador, de worker o de thread del pool al final del nombre
+_SUFIJO_HILO = re.compile(r"(#\d+)?(_\d+|-\d+)?$")
+
+ARCHIVOS = {
+    'flamegraph': ('flamegraph.svg', 'image/svg+xml'),
+    'folded': ('perfil.folded', 'text/plain'),
+    'traza': ('traza.json', 'application/json'),
+}
+
+_activo = None
+# Tramo en curso de cada thread (ver instrumentar_driver)
+_local = threading.local()
+
+
+def _del_escaneo(hilo, principal):
+    # Los threads de la consulta rápida (etiqueta "SITIO@consulta") no son del escaneo
+    return hilo.ident == principal or (hilo.name.startswith(PREFIJOS_HILOS) and "@" not in hilo.name)
+
+
+def _grupo(nombre):
+    """Worker-VEA-2 -> Worker-VEA, Driver-VEA#2_0 -> Driver-VEA: una fila por sitio en el flame graph."""
+    return _SUFIJO_HILO.sub("", nombre)
+
+
+class _Tramo:
+    __slots__ = ("perfilador", "nombre", "categoria", "args", "inicio", "anterior")
+
+    def __init__(self, perfilador, nombre, categoria, args):
+        self.perfilador = perfilador
+        self.nombre = nombre
+        self.categoria = categoria
+        self.args = args
+        self.inicio = None
+
+    def __enter__(self):
+        self.anterior = getattr(_local, 'actual', None)
+        _local.actual = self.nombre
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, tb):
+        fin = time.perf_counter()
+        _local.actual = self.anterior
+        if tipo is not None:
+            self.args = {**(self.args or {}), 'error': tipo.__name__}
+        self.perfilador._registrar(self.nombre, self.categoria, self.inicio, fin, self.args)
+        return False
+
+
+class _SinTramo:
+    __slots__ = ("args",)
+
+    def __init__(self):
+        self.args = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, tb):
+        return False
+
+
+_SIN_TRAMO = _SinTramo()
+
+
+def tramo(nombre, categoria="escaneo", **args):
+    """
+    Context manager que registra un tramo de la línea de tiempo si hay un perfilador activo.
+    Se pueden agregar datos al tramo en curso con `t.args = {...}` (sólo si t.args no es None).
+    """
+    perfilador = _activo
+    if perfilador is None or not _del_escaneo(threading.current_thread(), perfilador.principal):
+        return _SIN_TRAMO
+    return _Tramo(perfilador, nombre, categoria, args)
+
+
+def instrumentar_driver(driver):
+    """
+    Registra cada comando de Selenium del driver como un tramo "extraer".
+    Los comandos de los tramos "navegar" y "esperar" (driver.get, el sondeo del
+    WebDriverWait) quedan afuera: ya los cubre su tramo.
+    """
+    ejecutar = getattr(driver, 'execute', None)
+    if ejecutar is None or getattr(ejecutar, 'instrumentado', False):
+        return driver
+
+    def execute(comando, params=None):
+        if _activo is None or getattr(_local, 'actual', None) in ("navegar", "esperar"):
+            return ejecutar(comando, params)
+        with tramo("extraer", "selenium", comando=comando):
+            return ejecutar(comando, params)
+
+    execute.instrumentado = True
+    driver.execute = execute
+    return driver
+
+
+class Perfilador:
+    """
+    Muestreo de pilas y tramos de un escaneo.
+
+    Args:
+        directorio: Carpeta de perfiles; los archivos van a directorio/<trabajo_id>/
+        trabajo_id: Identificador del escaneo
+        intervalo: Segundos entre muestras
+    """
+
+    def __init__(self, directorio, trabajo_id, intervalo=INTERVALO_MUESTREO):
+        self.directorio = os.path.join(directorio, trabajo_id)
+        self.trabajo_id = trabajo_id
+        self.intervalo = intervalo
+        self.principal = None
+        self.pilas = Counter()
+        self.muestras = 0
+        self.tramos = []
+        self.tramos_descartados = 0
+        # Nombre de los threads con tramos (los del pool ya terminaron al escribir la traza)
+        self._hilos = {}
+        self._origen = None
+        self._detener = threading.Event()
+        self._muestreador = None
+        self._costo = 0.0
+
+    def iniciar(self):
+        """Activa el perfilado; el thread que llama cuenta como thread del escaneo."""
+        global _activo
+        if _activo is not None:
+            logging.warning("🔬 Ya hay un escaneo perfilándose: éste no se perfila")
+            return False
+        self.principal = threading.get_ident()
+        self._origen = time.perf_counter()
+        self._inicio = time.time()
+        _activo = self
+        self._muestreador = threading.Thread(target=self._muestrear, name="Perfilador", daemon=True)
+        self._muestreador.start()
+        logging.info(f"🔬 Perfilando el escaneo {self.trabajo_id} (muestras cada {self.intervalo * 1000:.0f} ms)")
+        return True
+
+    def _registrar(self, nombre, categoria, inicio, fin, args):
+        if len(self.tramos) >= MAX_TRAMOS:
+            self.tramos_descartados += 1
+            return
+        ident = threading.get_ident()
+        if ident not in self._hilos:
+            self._hilos[ident] = threading.current_thread().name
+        # list.append es atómico: no hace falta lock entre threads
+        self.tramos.append((nombre, categoria, inicio, fin, ident, args))
+
+    def _muestrear(self):
+        propio = threading.get_ident()
+        while not self._detener.wait(self.intervalo):
+            inicio = time.perf_counter()
+            # threading._active evita armar la lista de threading.enumerate() en cada muestra
+            hilos = threading._active
+            for ident, frame in sys._current_frames().items():
+                hilo = hilos.get(ident)
+                if ident == propio or hilo is None or not _del_escaneo(hilo, self.principal):
+                    continue
+                # Las pilas se cuentan como tuplas de code objects: se formatean una vez al final
+                pila = []
+                while frame is not None:
+                    pila.append(frame.f_code)
+                    frame = frame.f_back
+                self.pilas[(hilo.name, tuple(pila))] += 1
+            self.muestras += 1
+            self._costo += time.perf_counter() - inicio
+
+    def _plegar(self):
+        """{"grupo;marco;...": muestras} con la raíz primero, como las espera flamegraph_svg."""
+        plegadas = Counter()
+        etiquetas = {}
+        for (nombre, pila), n in self.pilas.items():
+            marcos = [_grupo(nombre)]
+            for codigo in reversed(pila):
+                etiqueta = etiquetas.get(codigo)
+                if etiqueta is None:
+                    etiqueta = etiquetas[codigo] = \
+                        f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})"
+                marcos.append(etiqueta)
+            plegadas[";".join(marcos)] += n
+        return plegadas
+
+    def detener(self):
+        """Desactiva el perfilado y guarda flame graph, folded y traza. Devuelve el directorio."""
+        global _activo
+        if _activo is not self:
+            return None
+        _activo = None
+        self._detener.set()
+        self._muestreador.join()
+        duracion = time.perf_counter() - self._origen
+
+        os.makedirs(self.directorio, exist_ok=True)
+        pilas = self._plegar()
+        self.pilas.clear()
+        self._escribir('folded', "\n".join(f"{pila} {n}" for pila, n in pilas.most_common()))
+        self._escribir('flamegraph', flamegraph_svg(pilas, f"Escaneo {self.trabajo_id}"))
+        self._escribir('traza', json.dumps(self._traza(), separators=(",", ":")))
+        with open(os.path.join(os.path.dirname(self.directorio), "ultimo.json"), 'w', encoding='utf-8') as f:
+            json.dump({'trabajo_id': self.trabajo_id, 'generado': time.time()}, f)
+
+        logging.info(f"🔬 Perfil guardado: {self.muestras} muestras, {len(self.tramos)} tramos "
+                     f"({self.tramos_descartados} descartados), muestreo {self._costo / max(duracion, 1e-9) * 100:.2f}% "
+                     f"del tiempo de un núcleo. Descarga: /perfil/flamegraph?trabajo={self.trabajo_id}")
+        return self.directorio
+
+    def _escribir(self, tipo, contenido):
+        ruta = os.path.join(self.directorio, ARCHIVOS[tipo][0])
+        with open(f"{ruta}.tmp", 'w', encoding='utf-8') as f:
+            f.write(contenido)
+        os.replace(f"{ruta}.tmp", ruta)
+
+    def _traza(self):
+        """Tramos en formato trace-event de Chrome (eventos completos "X", en microsegundos)."""
+        eventos = [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': f"Escaneo {self.trabajo_id}"}}]
+        for ident in {t[4] for t in self.tramos}:
+            nombre = self._hilos.get(ident, str(ident))
+            eventos.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': ident, 'args': {'name': nombre}})
+        for nombre, categoria, inicio, fin, ident, args in self.tramos:
+            evento = {'name': nombre, 'cat': categoria, 'ph': 'X', 'pid': 1, 'tid': ident,
+                      'ts': round((inicio - self._origen) * 1e6, 1), 'dur': round((fin - inicio) * 1e6, 1)}
+            if args:
+                evento['args'] = args
+            eventos.append(evento)
+        return {'traceEvents': eventos, 'displayTimeUnit': 'ms',
+                'otherData': {'trabajo_id': self.trabajo_id, 'inicio': self._inicio}}
+
+
+def flamegraph_svg(pilas, titulo, ancho=1200, alto_fila=16):
+    """
+    Flame graph SVG autocontenido a partir de {pila "a;b;c": muestras}.
+    Cada marco lleva un <title> con sus muestras y porcentaje (tooltip del navegador).
+    """
+    # Árbol de marcos: nombre -> [muestras, hijos]
+    raiz = [0, {}]
+    for pila, n in pilas.items():
+        nodo = raiz
+        nodo[0] += n
+        for marco in pila.split(";"):
+            nodo = nodo[1].setdefault(marco, [0, {}])
+            nodo[0] += n
+    total = raiz[0] or 1
+
+    rects = []
+    profundidad_maxima = 0
+
+    def dibujar(nombre, nodo, x, profundidad):
+        nonlocal profundidad_maxima
+        w = nodo[0] / total * ancho
+        if w < 0.3:
+            return
+        profundidad_maxima = max(profundidad_maxima, profundidad)
+        rects.append((nombre, nodo[0], x, profundidad, w))
+        for hijo, sub in sorted(nodo[1].items()):
+            dibujar(hijo, sub, x, profundidad + 1)
+            x += sub[0] / total * ancho
+
+    x = 0.0
+    for nombre, nodo in sorted(raiz[1].items()):
+        dibujar(nombre, nodo, x, 0)
+        x += nodo[0] / total * ancho
+
+    margen = 24
+    alto = (profundidad_maxima + 1) * alto_fila + margen + 4
+    partes = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{ancho}" height="{alto}" '
+        f'font-family="monospace" font-size="11">',
+        f'<text x="4" y="16" font-size="13">{html.escape(titulo)} — {raiz[0]} muestras</text>',
+    ]
+    for nombre, muestras, x, profundidad, w in rects:
+        y = alto - (profundidad + 1) * alto_fila
+        # Color estable por nombre: tonos cálidos como en los flame graphs clásicos
+        tono = sum(map(ord, nombre)) % 55
+        etiqueta = html.escape(nombre)
+        partes.append(
+            f'<g><title>{etiqueta} ({muestras} muestras, {muestras / total * 100:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{alto_fila - 1}" fill="hsl({tono},85%,60%)"/>'
+        )
+        letras = int(w / 7)
+        if letras >= 3:
+            texto = nombre if len(nombre) <= letras else nombre[:letras - 2] + ".."
+            partes.append(f'<text x="{x + 2:.1f}" y="{y + alto_fila - 4}">{html.escape(texto)}</text>')
+        partes.append('</g>')
+    partes.append('</svg>')
+    return "\n".join(partes)
+
+
+def ruta_perfil(directorio, tipo, trabajo_id=None):
+    """
+    Archivo de perfil de un escaneo (el último si no se indica). None si no existe.
+    """
+    if tipo not in ARCHIVOS:
+        return None
+    if trabajo_id is None:
+        try:
+            with open(os.path.join(directorio, "ultimo.json"), encoding='utf-8') as f:
+                trabajo_id = json.load(f)['trabajo_id']
+        except (OSError, ValueError, KeyError):
+            return None
+    # El id viene del request: sólo el nombre, sin rutas
+    if os.path.basename(trabajo_id) != trabajo_id or trabajo_id.startswith("."):
+        return None
+    ruta = os.path.join(directorio, trabajo_id, ARCHIVOS[tipo][0])
+    return ruta if os.path.exists(ruta) else None
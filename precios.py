@@ -0,0 +1,209 @@
+"""
+Parseo numérico de precios y comparación entre sitios.
+
+Los buscar_precio_* devuelven texto tal como aparece en la página
+("$ 1.234,56", "2x1", "2do al 70%", "No encontrado"). Acá se convierten
+columnas enteras a centavos (Int64) y se detecta el tipo de promoción, todo
+con operaciones vectorizadas de pandas para que escale a catálogos de 100k filas.
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+
+SITIOS = ["nini", "carrefour", "vea", "disco"]
+
+# Monto en formato argentino: miles con punto, decimales con coma
+_MONTO = r'(\d{1,3}(?:\.\d{3})+|\d+)(?:,(\d{1,2}))?'
+_RE_MONTO_CON_SIGNO = r'\$\s*' + _MONTO
+_RE_MONTO_SOLO = r'^\s*' + _MONTO + r'\s*$'
+
+_RE_NXM = r'(\d+)\s*[xX]\s*(\d+)'
+_RE_PORCENTAJE = r'(\d{1,3})\s*%'
+_RE_SEGUNDA = r'(?i)(?:2\s*(?:do|da|°|º)|segund[oa])'
+
+PROMO_NXM = "NxM"
+PROMO_PORCENTAJE = "porcentaje"
+PROMO_SEGUNDA_UNIDAD = "segunda_unidad"
+PROMO_PRECIO_OFERTA = "precio_oferta"
+
+
+def _sobre_valores_unicos(func):
+    """
+    Aplica func sólo a los textos distintos y expande el resultado a todas las filas.
+    En un catálogo grande la mayoría de los textos se repiten ("No encontrado", promos).
+    """
+    @functools.wraps(func)
+    def envoltura(serie):
+        codigos, unicos = pd.factorize(serie.astype('string').fillna(''))
+        resultado = func(pd.Series(unicos, dtype='string')).iloc[codigos]
+        resultado.index = serie.index
+        return resultado
+    return envoltura
+
+
+def _centavos(partes):
+    """Convierte el resultado de str.extract(_MONTO) a centavos (Int64)."""
+    enteros = pd.to_numeric(partes[0].str.replace('.', '', regex=False), errors='coerce')
+    decimales = pd.to_numeric(partes[1].fillna('0').str.ljust(2, '0'), errors='coerce')
+    return (enteros * 100 + decimales).round().astype('Int64')
+
+
+@_sobre_valores_unicos
+def texto_a_centavos(serie):
+    """
+    Primer monto de cada texto en centavos ("$ 1.234,56" -> 123456).
+
+    Sólo se aceptan montos precedidos por "$" o textos que son únicamente un
+    número, para no confundir "2x1" o "70%" con un precio. NA si no hay monto.
+    """
+    texto = serie.astype('string')
+    con_signo = texto.str.extract(_RE_MONTO_CON_SIGNO)
+    solo = texto.str.extract(_RE_MONTO_SOLO)
+    return _centavos(con_signo).fillna(_centavos(solo))
+
+
+@_sobre_valores_unicos
+def menor_monto_centavos(serie):
+    """Menor monto con "$" de cada texto (en una oferta suele ser el precio promocional)."""
+    texto = serie.astype('string')
+    todos = texto.str.extractall(_RE_MONTO_CON_SIGNO)
+    if todos.empty:
+        return pd.Series(pd.NA, index=serie.index, dtype='Int64')
+    centavos = _centavos(todos).groupby(level=0).min()
+    return centavos.reindex(serie.index).astype('Int64')
+
+
+@_sobre_valores_unicos
+def detectar_promocion(serie):
+    """
+    Tipo y valor de promoción de cada texto de oferta/dinámica.
+
+    Returns:
+        DataFrame con columnas 'tipo' (NxM, porcentaje, segunda_unidad o NA)
+        y 'valor' ("2x1", "70", ...).
+    """
+    texto = serie.astype('string').fillna('')
+    tipo = pd.Series(pd.NA, index=serie.index, dtype='string')
+    valor = pd.Series(pd.NA, index=serie.index, dtype='string')
+
+    nxm = texto.str.extract(_RE_NXM)
+    es_nxm = nxm[0].notna()
+    tipo[es_nxm] = PROMO_NXM
+    valor[es_nxm] = nxm[0][es_nxm] + "x" + nxm[1][es_nxm]
+
+    pct = texto.str.extract(_RE_PORCENTAJE)[0]
+    es_pct = pct.notna() & ~es_nxm
+    es_segunda = es_pct & texto.str.contains(_RE_SEGUNDA, regex=True)
+    tipo[es_segunda] = PROMO_SEGUNDA_UNIDAD
+    tipo[es_pct & ~es_segunda] = PROMO_PORCENTAJE
+    valor[es_pct] = pct[es_pct]
+
+    return pd.DataFrame({'tipo': tipo, 'valor': valor})
+
+
+def precio_efectivo(regular, oferta, tipo, valor):
+    """
+    Precio unitario efectivo en centavos, considerando la promoción.
+
+    - Precio de oferta explícito: se usa ese monto.
+    - NxM: regular * M / N (llevando N se pagan M).
+    - porcentaje: regular * (1 - p/100).
+    - segunda unidad al p%: promedio de las dos unidades.
+    """
+    regular = regular.astype('Float64')
+    efectivo = regular.copy()
+
+    n = pd.to_numeric(valor.str.extract(r'^(\d+)x')[0], errors='coerce')
+    m = pd.to_numeric(valor.str.extract(r'x(\d+)$')[0], errors='coerce')
+    p = pd.to_numeric(valor.where(tipo.isin([PROMO_PORCENTAJE, PROMO_SEGUNDA_UNIDAD])), errors='coerce')
+
+    es_nxm = (tipo == PROMO_NXM).fillna(False) & (n > 0)
+    efectivo[es_nxm] = regular[es_nxm] * m[es_nxm] / n[es_nxm]
+
+    es_pct = (tipo == PROMO_PORCENTAJE).fillna(False)
+    efectivo[es_pct] = regular[es_pct] * (1 - p[es_pct] / 100)
+
+    es_segunda = (tipo == PROMO_SEGUNDA_UNIDAD).fillna(False)
+    efectivo[es_segunda] = regular[es_segunda] * (2 - p[es_segunda] / 100) / 2
+
+    # Un monto de oferta explícito y menor al regular tiene prioridad
+    hay_oferta = oferta.notna() & (regular.isna() | (oferta < regular)).fillna(False)
+    efectivo[hay_oferta] = oferta[hay_oferta].astype('Float64')
+
+    return efectivo.round().astype('Int64')
+
+
+def agregar_columnas_numericas(df, sitios=SITIOS):
+    """
+    Agrega, por sitio presente en el DataFrame, las columnas:
+    Precio Num, Oferta Num, Promo Tipo, Promo Valor y Precio Efectivo (centavos).
+    """
+    for site in sitios:
+        sufijo = site.upper()
+        col_precio = f"Precio {sufijo}"
+        if col_precio not in df.columns:
+            continue
+
+        vacia = pd.Series('', index=df.index)
+        oferta_txt = df[f"Oferta {sufijo}"] if f"Oferta {sufijo}" in df.columns else vacia
+        dinamica_txt = df[f"Dinamica {sufijo}"] if f"Dinamica {sufijo}" in df.columns else vacia
+
+        regular = texto_a_centavos(df[col_precio])
+        oferta = menor_monto_centavos(oferta_txt)
+        promo = detectar_promocion(oferta_txt.astype('string').fillna('') + " " + dinamica_txt.astype('string').fillna(''))
+
+        # Sin promo por texto pero con monto de oferta menor: es un precio de oferta
+        es_precio_oferta = promo['tipo'].isna() & oferta.notna() & (regular.isna() | (oferta < regular)).fillna(False)
+        promo.loc[es_precio_oferta, 'tipo'] = PROMO_PRECIO_OFERTA
+
+        df[f"Precio Num {sufijo}"] = regular
+        df[f"Oferta Num {sufijo}"] = oferta
+        df[f"Promo Tipo {sufijo}"] = promo['tipo']
+        df[f"Promo Valor {sufijo}"] = promo['valor']
+        df[f"Precio Efectivo {sufijo}"] = precio_efectivo(regular, oferta, promo['tipo'], promo['valor'])
+    return df
+
+
+def comparar_sitios(df, sitios=SITIOS, referencia="nini"):
+    """
+    Comparación de todo el catálogo en una pasada sobre los precios efectivos.
+
+    Agrega: Sitio Mas Barato, Precio Minimo, Spread (max - min, centavos),
+    Brecha NINI (NINI - mínimo del resto, centavos) y Brecha NINI % .
+    """
+    presentes = [s for s in sitios if f"Precio Efectivo {s.upper()}" in df.columns]
+    if not presentes:
+        return df
+
+    matriz = df[[f"Precio Efectivo {s.upper()}" for s in presentes]].to_numpy(dtype='float64', na_value=np.nan)
+    con_precio = ~np.isnan(matriz).all(axis=1)
+
+    minimo = np.full(len(df), np.nan)
+    maximo = np.full(len(df), np.nan)
+    sitio_min = np.full(len(df), None, dtype=object)
+    if con_precio.any():
+        minimo[con_precio] = np.nanmin(matriz[con_precio], axis=1)
+        maximo[con_precio] = np.nanmax(matriz[con_precio], axis=1)
+        pos = np.nanargmin(matriz[con_precio], axis=1)
+        sitio_min[con_precio] = np.array([s.upper() for s in presentes], dtype=object)[pos]
+
+    df["Sitio Mas Barato"] = sitio_min
+    df["Precio Minimo"] = pd.array(minimo, dtype='Float64').round().astype('Int64')
+    df["Spread"] = pd.array(maximo - minimo, dtype='Float64').round().astype('Int64')
+
+    if referencia in presentes and len(presentes) > 1:
+        i_ref = presentes.index(referencia)
+        ref = matriz[:, i_ref]
+        resto = np.delete(matriz, i_ref, axis=1)
+        hay_resto = ~np.isnan(resto).all(axis=1)
+        mercado = np.full(len(df), np.nan)
+        if hay_resto.any():
+            mercado[hay_resto] = np.nanmin(resto[hay_resto], axis=1)
+        brecha = ref - mercado
+        with np.errstate(divide='ignore', invalid='ignore'):
+            brecha_pct = np.where(mercado > 0, brecha / mercado * 100, np.nan)
+        sufijo = referencia.upper()
+        df[f"Brecha {sufijo}"] = pd.array(brecha, dtype='Float64').round().astype('Int64')
+        df[f"Brecha {sufijo} %"] = pd.array(brecha_pct, dtype='Float64').round(1)
+    return df
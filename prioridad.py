@@ -0,0 +1,141 @@
+"""
+Priorización de re-escaneo según la volatilidad de cada (EAN, sitio).
+
+A partir del historial (ver historial.py) se estima para cada EAN una tasa de
+cambios por día y, con ella, la probabilidad de que el precio haya cambiado
+desde la última observación:
+
+    tasa      = (cambios + CAMBIOS_PRIOR) / (días observados + DIAS_PRIOR)
+    esperado  = tasa * días desde la última observación
+    vencido   = tasa * días desde el último cambio (1 = ya pasó un intervalo típico)
+    puntaje   = 1 - exp(-esperado * (0.5 + 0.5 * min(vencido, 2)))
+
+Los productos con promoción cambian al menos semanalmente (TASA_MINIMA_PROMO).
+Los EANs sin historial o cuya última observación fue un error valen 1.0.
+"""
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from historial import PRECIO_ERROR
+
+DIAS_HISTORIA = 180
+
+# Prior: un cambio por mes, con el peso de un mes de observación
+CAMBIOS_PRIOR = 1.0
+DIAS_PRIOR = 30.0
+
+# Con promoción activa se asume al menos un cambio por semana
+TASA_MINIMA_PROMO = 1 / 7
+
+
+class _Acumulador:
+    """Estadísticas por id de EAN, actualizadas partición por partición (memoria O(#EANs))."""
+
+    def __init__(self, n):
+        self.n_obs = np.zeros(n, dtype=np.int32)
+        self.n_cambios = np.zeros(n, dtype=np.int32)
+        self.n_promo = np.zeros(n, dtype=np.int32)
+        self.ts_primera = np.zeros(n, dtype=np.int64)
+        self.ts_ultima = np.zeros(n, dtype=np.int64)
+        self.ts_ultimo_cambio = np.zeros(n, dtype=np.int64)
+        self.precio = np.zeros(n, dtype=np.int32)
+        self.oferta = np.zeros(n, dtype=np.uint32)
+
+    def agregar(self, cols):
+        e = cols['ean'].astype(np.int64)
+        ts = cols['ts'].astype(np.int64)
+        precio, oferta = cols['precio'], cols['oferta']
+
+        primera = np.r_[True, e[1:] != e[:-1]]
+        ultima = np.r_[e[1:] != e[:-1], True]
+
+        # Cambios dentro de la partición
+        cambio = np.zeros(len(e), dtype=bool)
+        cambio[1:] = ~primera[1:] & ((precio[1:] != precio[:-1]) | (oferta[1:] != oferta[:-1]))
+
+        # Cambios contra la última observación de particiones anteriores
+        ep = e[primera]
+        vistas = self.n_obs[ep] > 0
+        cambio[np.flatnonzero(primera)[vistas]] = (
+            (precio[primera][vistas] != self.precio[ep[vistas]]) |
+            (oferta[primera][vistas] != self.oferta[ep[vistas]])
+        )
+
+        nuevos = ep[~vistas]
+        self.ts_primera[nuevos] = ts[primera][~vistas]
+        np.add.at(self.n_obs, e, 1)
+        np.add.at(self.n_promo, e[oferta != 0], 1)
+        np.add.at(self.n_cambios, e[cambio], 1)
+        np.maximum.at(self.ts_ultimo_cambio, e[cambio], ts[cambio])
+
+        eu = e[ultima]
+        self.ts_ultima[eu] = ts[ultima]
+        self.precio[eu] = precio[ultima]
+        self.oferta[eu] = oferta[ultima]
+
+
+class PuntajesSitio:
+    """
+    Probabilidad estimada de cambio de precio de todos los EANs del historial de un sitio.
+
+    Se calcula una vez (recorre DIAS_HISTORIA días de particiones) y se consulta
+    por bloque con para(skus).
+
+    Args:
+        historial: HistorialPrecios
+        site: Nombre del sitio
+        ahora: Momento de referencia (epoch), por defecto ahora
+    """
+
+    def __init__(self, historial, site, ahora=None, dias_historia=DIAS_HISTORIA):
+        self.historial = historial
+        ahora = ahora or time.time()
+        desde = date.fromtimestamp(ahora) - timedelta(days=dias_historia)
+
+        n = historial.cantidad_eans()
+        acumulado = _Acumulador(n)
+        for _, cols in historial.iterar_particiones(site, desde):
+            # Ignorar EANs agregados al diccionario después de empezar (escaneo en curso)
+            if cols['ean'].max() >= n:
+                validos = cols['ean'] < n
+                cols = {k: v[validos] for k, v in cols.items()}
+            acumulado.agregar(cols)
+
+        a = acumulado
+        dias_observados = (a.ts_ultima - a.ts_primera) / 86400
+        tasa = (a.n_cambios + CAMBIOS_PRIOR) / (dias_observados + DIAS_PRIOR)
+        con_promo = a.oferta != 0
+        tasa = np.where(con_promo, np.maximum(tasa, TASA_MINIMA_PROMO), tasa)
+
+        desde_obs = np.maximum(ahora - a.ts_ultima, 0) / 86400
+        ultimo_cambio = np.where(a.ts_ultimo_cambio > 0, a.ts_ultimo_cambio, a.ts_primera)
+        vencido = np.minimum(np.maximum(ahora - ultimo_cambio, 0) / 86400 * tasa, 2)
+        puntaje = 1 - np.exp(-tasa * desde_obs * (0.5 + 0.5 * vencido))
+        self.puntaje = np.where((a.n_obs == 0) | (a.precio == PRECIO_ERROR), 1.0, puntaje)
+
+    def para(self, skus):
+        """Dict {sku: puntaje entre 0 y 1}; los EANs sin historial valen 1.0."""
+        puntajes = {}
+        for sku in skus:
+            sku = str(sku).strip()
+            id_ = self.historial.id_ean(sku)
+            puntajes[sku] = float(self.puntaje[id_]) if id_ is not None and id_ < len(self.puntaje) else 1.0
+        return puntajes
+
+
+def puntuar(historial, site, skus, ahora=None, dias_historia=DIAS_HISTORIA):
+    """
+    Probabilidad estimada de cambio de precio para cada SKU en un sitio.
+
+    Args:
+        historial: HistorialPrecios
+        site: Nombre del sitio
+        skus: Iterable de EANs a puntuar
+        ahora: Momento de referencia (epoch), por defecto ahora
+
+    Returns:
+        Dict {sku: puntaje entre 0 y 1}
+    """
+    return PuntajesSitio(historial, site, ahora, dias_historia).para(skus)
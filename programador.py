@@ -0,0 +1,252 @@
+"""
+Escaneos programados con re-escaneo sólo de lo desactualizado.
+
+Los trabajos se definen en DATA_DIR/programacion.json:
+
+    [
+        {
+            "id": "nocturno",
+            "cron": "0 3 * * *",
+            "catalogo": "/app/data/catalogo.xlsx",
+            "sitios": ["carrefour", "vea", "disco"],
+            "max_edad_horas": 24,
+            "priorizar": true,
+            "presupuesto_minutos": 90
+        }
+    ]
+
+En cada ejecución sólo se buscan los EANs cuya última observación en el
+historial (ver historial.py) es más vieja que max_edad_horas, los que terminaron
+en "Error" y los que nunca se observaron (p.ej. recién agregados al catálogo).
+Con "priorizar" (por defecto) se buscan primero los de mayor probabilidad de
+cambio (ver prioridad.py) y "presupuesto_minutos" corta el escaneo de cada sitio.
+
+Las ejecuciones se registran en programacion_estado.json antes de lanzarse,
+bajo un lock de archivo, así que un reinicio dentro del mismo minuto o un
+segundo worker de gunicorn no disparan el mismo trabajo dos veces.
+"""
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+from datetime import datetime
+
+from historial import PRECIO_ERROR
+
+SITIOS = ["nini", "carrefour", "vea", "disco"]
+
+
+# =====================================================
+# EXPRESIONES CRON
+# =====================================================
+
+class ExpresionCron:
+    """
+    Expresión cron de 5 campos: minuto hora día-del-mes mes día-de-la-semana.
+    Soporta '*', listas 'a,b', rangos 'a-b' y pasos '*/n' o 'a-b/n'.
+    Día de la semana: 0-6 con 0 = domingo (7 también es domingo).
+    """
+
+    RANGOS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, texto):
+        self.texto = texto
+        campos = texto.split()
+        if len(campos) != 5:
+            raise ValueError(f"Expresión cron inválida (se esperan 5 campos): {texto!r}")
+        self.valores = [self._campo(c, lo, hi) for c, (lo, hi) in zip(campos, self.RANGOS)]
+        if 7 in self.valores[4]:
+            self.valores[4].add(0)
+        self.dia_restringido = campos[2] != '*'
+        self.semana_restringida = campos[4] != '*'
+
+    @staticmethod
+    def _campo(campo, lo, hi):
+        valores = set()
+        for parte in campo.split(','):
+            rango, _, paso = parte.partition('/')
+            paso = int(paso) if paso else 1
+            if rango == '*':
+                inicio, fin = lo, hi
+            elif '-' in rango:
+                inicio, fin = (int(x) for x in rango.split('-', 1))
+            else:
+                inicio = fin = int(rango)
+                if paso != 1:
+                    fin = hi
+            if inicio < lo or fin > hi or inicio > fin or paso < 1:
+                raise ValueError(f"Campo cron fuera de rango: {campo!r}")
+            valores.update(range(inicio, fin + 1, paso))
+        return valores
+
+    def coincide(self, momento):
+        minutos, horas, dias, meses, semana = self.valores
+        if momento.minute not in minutos or momento.hour not in horas or momento.month not in meses:
+            return False
+        dia_ok = momento.day in dias
+        semana_ok = (momento.isoweekday() % 7) in semana
+        # Como en cron: si ambos campos están restringidos alcanza con que coincida uno
+        if self.dia_restringido and self.semana_restringida:
+            return dia_ok or semana_ok
+        return dia_ok and semana_ok
+
+
+# =====================================================
+# DELTA
+# =====================================================
+
+def calcular_pendientes(skus, sitios, historial, max_edad_horas, ahora=None):
+    """
+    EANs a re-escanear por sitio.
+
+    Args:
+        skus: Iterable de EANs del catálogo
+        sitios: Sitios del trabajo
+        historial: HistorialPrecios
+        max_edad_horas: Antigüedad máxima aceptada de la última observación
+
+    Returns:
+        Dict {sitio: set(eans)}
+    """
+    ahora = ahora or time.time()
+    limite = ahora - max_edad_horas * 3600
+    skus = [str(s).strip() for s in skus]
+    pendientes = {}
+    for site in sitios:
+        ultimas = historial.ultimas_observaciones(site)
+        pendientes[site] = {
+            sku for sku in skus
+            if sku not in ultimas or ultimas[sku][0] < limite or ultimas[sku][1] == PRECIO_ERROR
+        }
+    return pendientes
+
+
+# =====================================================
+# PROGRAMADOR
+# =====================================================
+
+class Programador:
+    """
+    Thread que revisa cada minuto los trabajos de programacion.json.
+
+    Args:
+        ruta_config: Ruta de programacion.json
+        ruta_estado: Ruta del archivo de estado (ejecuciones registradas)
+        lanzar: Callback lanzar(trabajo) -> bool. Devuelve False si no se pudo
+                iniciar (p.ej. hay otro escaneo en curso); el trabajo queda
+                pendiente y se reintenta en el minuto siguiente.
+    """
+
+    def __init__(self, ruta_config, ruta_estado, lanzar):
+        self.ruta_config = ruta_config
+        self.ruta_estado = ruta_estado
+        self.lanzar = lanzar
+        self._detener = threading.Event()
+        self._thread = None
+
+    def trabajos(self):
+        if not os.path.exists(self.ruta_config):
+            return []
+        try:
+            with open(self.ruta_config, encoding='utf-8') as f:
+                trabajos = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"⏰ No se pudo leer {self.ruta_config}: {e}")
+            return []
+        validos = []
+        for trabajo in trabajos:
+            try:
+                trabajo['_cron'] = ExpresionCron(trabajo['cron'])
+                trabajo.setdefault('sitios', SITIOS)
+                trabajo.setdefault('max_edad_horas', 24)
+                validos.append(trabajo)
+            except (KeyError, ValueError) as e:
+                logging.error(f"⏰ Trabajo programado inválido {trabajo.get('id')}: {e}")
+        return validos
+
+    def estado(self):
+        try:
+            with open(self.ruta_estado, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _con_estado(self, funcion):
+        """Ejecuta funcion(estado) bajo lock de archivo y persiste el estado resultante."""
+        os.makedirs(os.path.dirname(self.ruta_estado), exist_ok=True)
+        with open(self.ruta_estado + ".lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                estado = self.estado()
+                resultado = funcion(estado)
+                tmp = self.ruta_estado + ".tmp"
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(estado, f, indent=2)
+                os.replace(tmp, self.ruta_estado)
+                return resultado
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def revisar(self, momento=None):
+        """Dispara los trabajos que correspondan al minuto actual (o quedaron pendientes)."""
+        momento = (momento or datetime.now()).replace(second=0, microsecond=0)
+        clave_minuto = momento.strftime("%Y-%m-%dT%H:%M")
+
+        for trabajo in self.trabajos():
+            trabajo_id = trabajo['id']
+
+            def reclamar(estado):
+                info = estado.setdefault(trabajo_id, {})
+                if trabajo['_cron'].coincide(momento) and info.get('ultimo_disparo') != clave_minuto:
+                    info['ultimo_disparo'] = clave_minuto
+                    info['pendiente'] = True
+                if info.get('pendiente') and not info.get('en_curso'):
+                    info['en_curso'] = True
+                    return True
+                return False
+
+            if not self._con_estado(reclamar):
+                continue
+
+            logging.info(f"⏰ Lanzando trabajo programado '{trabajo_id}' ({trabajo['cron']})")
+            try:
+                lanzado = self.lanzar(trabajo)
+            except Exception as e:
+                logging.error(f"⏰ Error lanzando '{trabajo_id}': {e}", exc_info=True)
+                lanzado = False
+
+            def registrar(estado):
+                info = estado.setdefault(trabajo_id, {})
+                info['en_curso'] = False
+                if lanzado:
+                    info['pendiente'] = False
+                    info['ultima_ejecucion'] = datetime.now().isoformat(timespec='seconds')
+            self._con_estado(registrar)
+            if not lanzado:
+                logging.info(f"⏰ '{trabajo_id}' queda pendiente: hay otro escaneo en curso")
+
+    def _loop(self):
+        while not self._detener.is_set():
+            try:
+                self.revisar()
+            except Exception as e:
+                logging.error(f"⏰ Error en el programador: {e}", exc_info=True)
+            # Dormir hasta el próximo minuto
+            self._detener.wait(60 - time.time() % 60 + 0.5)
+
+    def iniciar(self):
+        if self._thread and self._thread.is_alive():
+            return
+        # Limpiar marcas 'en_curso' que hayan quedado de un proceso anterior
+        def limpiar(estado):
+            for info in estado.values():
+                info['en_curso'] = False
+        self._con_estado(limpiar)
+        self._thread = threading.Thread(target=self._loop, name="Programador", daemon=True)
+        self._thread.start()
+        logging.info(f"⏰ Programador iniciado ({self.ruta_config})")
+
+    def detener(self):
+        self._detener.set()
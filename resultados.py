@@ -0,0 +1,174 @@
+"""
+Archivo de resultados de un escaneo procesado por bloques.
+
+run_scraper recorre la planilla de a TAMANO_BLOQUE filas (ver ingesta.py):
+cada bloque se completa con los resultados del escaneo anterior, se busca en
+todos los sitios, se escribe y se libera antes de leer el siguiente. Así la
+memoria no depende del tamaño del catálogo:
+
+- ResultadosAnteriores pasa el xlsx de salida anterior a un SQLite temporal
+  indexado por SKU, y cada bloque consulta sólo sus SKUs;
+- EscritorResultados agrega las filas de cada bloque al xlsx nuevo con el modo
+  write_only de openpyxl y lo reemplaza recién al cerrar.
+"""
+import os
+import json
+import shutil
+import sqlite3
+import logging
+import tempfile
+
+import pandas as pd
+
+COLUMNAS_RESULTADO = [
+    "Precio NINI", "Oferta NINI",
+    "Precio CARREFOUR", "Oferta CARREFOUR",
+    "Precio VEA", "Oferta VEA", "Dinamica VEA",
+    "Precio DISCO", "Oferta DISCO", "Dinamica DISCO",
+]
+
+# Filas por transacción al cargar el archivo anterior
+LOTE_INSERCION = 1000
+
+
+def _texto_celda(valor):
+    """Celda de openpyxl a texto (los SKU numéricos sin '.0')."""
+    if valor is None:
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+class ResultadosAnteriores:
+    """
+    Resultados del archivo de salida anterior, consultables por SKU sin tenerlos en memoria.
+
+    Args:
+        ruta: xlsx de resultados de un escaneo anterior
+    """
+
+    def __init__(self, ruta):
+        self._directorio = tempfile.mkdtemp(prefix="resultados-anteriores-")
+        self._db = sqlite3.connect(os.path.join(self._directorio, "anteriores.db"),
+                                   isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute("CREATE TABLE anteriores (sku TEXT PRIMARY KEY, valores TEXT NOT NULL) WITHOUT ROWID")
+        self.filas = self._cargar(ruta)
+
+    def _cargar(self, ruta):
+        from openpyxl import load_workbook
+        wb = load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            filas = wb.active.iter_rows(values_only=True)
+            encabezado = [str(c) if c is not None else "" for c in next(filas, ())]
+            if "SKU" not in encabezado:
+                logging.warning(f"El archivo de resultados anterior no tiene columna SKU: {ruta}")
+                return 0
+            pos_sku = encabezado.index("SKU")
+            posiciones = [encabezado.index(c) if c in encabezado else None for c in COLUMNAS_RESULTADO]
+
+            total = 0
+            pendientes = []
+            for fila in filas:
+                sku = _texto_celda(fila[pos_sku]) if pos_sku < len(fila) else None
+                if not sku:
+                    continue
+                valores = [fila[p] if p is not None and p < len(fila) else None for p in posiciones]
+                pendientes.append((sku.strip(), json.dumps(valores, ensure_ascii=False, default=str)))
+                if len(pendientes) >= LOTE_INSERCION:
+                    total += self._insertar(pendientes)
+                    pendientes = []
+            if pendientes:
+                total += self._insertar(pendientes)
+            return total
+        finally:
+            wb.close()
+
+    def _insertar(self, filas):
+        self._db.execute("BEGIN")
+        self._db.executemany("INSERT OR REPLACE INTO anteriores (sku, valores) VALUES (?, ?)", filas)
+        self._db.execute("COMMIT")
+        return len(filas)
+
+    def completar(self, bloque):
+        """
+        Pone en las columnas de resultados del bloque los valores anteriores de cada SKU
+        ("Pendiente" para los SKU que no estaban).
+        """
+        skus = bloque['SKU'].astype(str).str.strip().tolist()
+        unicos = list(set(skus))
+        anteriores = {}
+        # De a bloques: SQLite limita la cantidad de parámetros por consulta
+        for i in range(0, len(unicos), 500):
+            parte = unicos[i:i + 500]
+            filas = self._db.execute(
+                f"SELECT sku, valores FROM anteriores WHERE sku IN ({','.join('?' * len(parte))})", parte
+            )
+            anteriores.update((sku, json.loads(valores)) for sku, valores in filas)
+
+        for pos, col in enumerate(COLUMNAS_RESULTADO):
+            bloque[col] = [anteriores[s][pos] if s in anteriores else "Pendiente" for s in skus]
+        return bloque
+
+    def cerrar(self):
+        try:
+            self._db.close()
+        finally:
+            shutil.rmtree(self._directorio, ignore_errors=True)
+
+
+def preparar_bloque(bloque, anteriores=None):
+    """Agrega al bloque las columnas de resultados, desde el escaneo anterior o en "Pendiente"."""
+    if anteriores is not None:
+        return anteriores.completar(bloque)
+    for col in COLUMNAS_RESULTADO:
+        if col not in bloque.columns:
+            bloque[col] = "Pendiente"
+    # Asegurar que no haya NaNs en las columnas de precio si el DF venía con ellas
+    for col in COLUMNAS_RESULTADO:
+        if col != "Oferta NINI":
+            bloque[col] = bloque[col].fillna("Pendiente")
+    return bloque
+
+
+class EscritorResultados:
+    """
+    xlsx de resultados escrito bloque a bloque con memoria constante.
+
+    El archivo destino no se toca hasta cerrar(): mientras tanto las filas van a
+    un temporal al lado, que se descarta si el escaneo falla.
+
+    Args:
+        ruta: xlsx de resultados
+    """
+
+    def __init__(self, ruta):
+        from openpyxl import Workbook
+        self.ruta = ruta
+        self._tmp = f"{ruta}.{os.getpid()}.tmp"
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet()
+        self.columnas = None
+        self.filas = 0
+
+    def agregar(self, bloque):
+        # Las columnas las fija el primer bloque
+        if self.columnas is None:
+            self.columnas = list(bloque.columns)
+            self._ws.append([str(c) for c in self.columnas])
+        for fila in bloque.reindex(columns=self.columnas).itertuples(index=False, name=None):
+            self._ws.append([None if pd.isna(v) else v for v in fila])
+        self.filas += len(bloque)
+
+    def cerrar(self):
+        try:
+            self._wb.save(self._tmp)
+            os.replace(self._tmp, self.ruta)
+        finally:
+            self.descartar()
+
+    def descartar(self):
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
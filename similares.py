@@ -0,0 +1,190 @@
+"""
+Coincidencias por descripción para los EANs que un sitio no tiene.
+
+Muchas veces el sitio vende el mismo producto con otro código de barras (cambio
+de envase, EAN de otro mercado) y la búsqueda por EAN sólo dice "No encontrado".
+Para esos casos se busca la descripción de la planilla entre los nombres del
+catálogo del día (ver catalogo_vtex.py) con un índice invertido:
+
+- cada texto se normaliza (normalizar_texto de ingesta.py, sin signos, con las
+  medidas unificadas: "1,5 Lts" -> "1500ml", "1 Kg" -> "1000g") y se parte en
+  palabras y trigramas de caracteres, así "serenisima" coincide con "serenísma";
+- cada rasgo pesa su IDF: la marca o la variedad definen la coincidencia más
+  que "de" o "x";
+- la similitud es el coseno entre los rasgos de la descripción y los del
+  nombre, y se penaliza si los dos traen medida y no coinciden.
+
+Los postings son arrays de numpy: puntuar una descripción contra un catálogo
+de 100k productos toma milisegundos. Las coincidencias nunca reemplazan al
+precio del EAN: se informan aparte, con su puntaje, para revisarlas.
+"""
+import re
+import math
+import time
+import logging
+from collections import defaultdict
+
+import numpy as np
+
+from ingesta import normalizar_texto
+
+UNIDADES = {
+    "g": "g", "gr": "g", "grs": "g", "gramos": "g",
+    "kg": "kg", "kgs": "kg", "kilo": "kg", "kilos": "kg",
+    "ml": "ml", "cc": "ml", "cm3": "ml",
+    "l": "l", "lt": "l", "lts": "l", "litro": "l", "litros": "l",
+    "u": "u", "un": "u", "unid": "u", "unidades": "u",
+}
+_MEDIDA = re.compile(r"(\d+(?:[.,]\d+)?)\s*(" + "|".join(sorted(UNIDADES, key=len, reverse=True)) + r")\b")
+_SEPARADORES = re.compile(r"[^a-z0-9.]+")
+
+# Rasgos presentes en más de esta fracción del catálogo no generan candidatos
+# (sólo suman al puntaje de los que ya lo son): sus postings son largos y aportan poco
+MAX_FRACCION_POSTINGS = 0.01
+# Candidatos que se puntúan completos (los de más puntaje parcial si hay más)
+MAX_CANDIDATOS = 5000
+# Mejores candidatos por resultado pedido sobre los que se revisan las medidas
+REVISADOS_POR_RESULTADO = 10
+# Factor del puntaje cuando las dos medidas existen y no coinciden
+PENALIDAD_MEDIDA = 0.5
+
+
+def rasgos(texto):
+    """
+    Rasgos de un nombre de producto para el índice.
+
+    Returns:
+        (rasgos, medidas): set de palabras y trigramas ("3:abc"), y set de
+        medidas normalizadas ("500g", "1500ml")
+    """
+    medidas = set()
+
+    def unificar(m):
+        valor, unidad = float(m.group(1).replace(",", ".")), UNIDADES[m.group(2)]
+        if unidad in ("kg", "l"):
+            valor, unidad = valor * 1000, "g" if unidad == "kg" else "ml"
+        medida = f"{valor:g}{unidad}"
+        medidas.add(medida)
+        return f" {medida} "
+
+    texto = _MEDIDA.sub(unificar, normalizar_texto(texto))
+    resultado = set()
+    for palabra in _SEPARADORES.sub(" ", texto).split():
+        palabra = palabra.strip(".")
+        if not palabra:
+            continue
+        resultado.add(palabra)
+        if len(palabra) > 3 and palabra not in medidas:
+            marcada = f"#{palabra}#"
+            resultado.update(f"3:{marcada[i:i + 3]}" for i in range(len(marcada) - 2))
+    return resultado, medidas
+
+
+class IndiceSimilares:
+    """
+    Índice invertido de nombres de productos.
+
+    Args:
+        productos: Iterable de (clave, nombre); la clave identifica al producto (p.ej. el EAN)
+    """
+
+    def __init__(self, productos):
+        inicio = time.time()
+        self.claves = []
+        self.nombres = []
+        self.medidas = []
+        postings = defaultdict(list)
+        for clave, nombre in productos:
+            if not nombre:
+                continue
+            doc = len(self.claves)
+            rasgos_doc, medidas = rasgos(nombre)
+            for rasgo in rasgos_doc:
+                postings[rasgo].append(doc)
+            self.claves.append(clave)
+            self.nombres.append(nombre)
+            self.medidas.append(medidas)
+
+        n = len(self.claves)
+        # Los docs se agregan en orden: cada posting queda ordenado (ver _sumar_comunes)
+        self._postings = {rasgo: np.array(docs, dtype=np.int32) for rasgo, docs in postings.items()}
+        self._idf = {rasgo: math.log((n + 1) / (len(docs) + 0.5)) for rasgo, docs in postings.items()}
+        self._idf_desconocido = math.log((n + 1) / 0.5)
+        normas = np.zeros(n, dtype=np.float64)
+        for rasgo, docs in self._postings.items():
+            normas[docs] += self._idf[rasgo] ** 2
+        self._normas = np.sqrt(normas)
+        self._max_postings = max(50, int(n * MAX_FRACCION_POSTINGS))
+        logging.info(f"🔎 Índice de similares: {n} productos, {len(self._postings)} rasgos "
+                     f"en {time.time() - inicio:.1f}s")
+
+    def __len__(self):
+        return len(self.claves)
+
+    def buscar(self, texto, limite=3, umbral=0.0):
+        """
+        Productos con nombre más parecido a `texto`.
+
+        Args:
+            texto: Descripción a buscar
+            limite: Cantidad máxima de resultados
+            umbral: Similitud mínima (0 a 1)
+
+        Returns:
+            Lista de (similitud, clave, nombre), de mayor a menor similitud
+        """
+        rasgos_consulta, medidas = rasgos(texto)
+        if not rasgos_consulta or not self.claves:
+            return []
+
+        puntajes = np.zeros(len(self.claves), dtype=np.float64)
+        comunes = []
+        norma = 0.0
+        for rasgo in rasgos_consulta:
+            idf = self._idf.get(rasgo)
+            if idf is None:
+                # Un rasgo que ningún producto tiene baja la similitud con todos
+                norma += self._idf_desconocido ** 2
+                continue
+            norma += idf ** 2
+            docs = self._postings[rasgo]
+            if len(docs) > self._max_postings:
+                comunes.append((docs, idf ** 2))
+            else:
+                puntajes[docs] += idf ** 2
+
+        candidatos = np.flatnonzero(puntajes)
+        if not len(candidatos) and comunes:
+            # Sólo rasgos comunes: los candidatos salen del menos común de ellos
+            candidatos = min(comunes, key=lambda c: len(c[0]))[0]
+        if not len(candidatos):
+            return []
+        if len(candidatos) > MAX_CANDIDATOS:
+            candidatos = candidatos[np.argpartition(puntajes[candidatos], -MAX_CANDIDATOS)[-MAX_CANDIDATOS:]]
+
+        parciales = puntajes[candidatos] + self._sumar_comunes(candidatos, comunes)
+        similitudes = parciales / (math.sqrt(norma) * self._normas[candidatos])
+        revisados = limite * REVISADOS_POR_RESULTADO
+        if len(candidatos) > revisados:
+            mejores = np.argpartition(similitudes, -revisados)[-revisados:]
+            candidatos, similitudes = candidatos[mejores], similitudes[mejores]
+
+        resultados = []
+        for doc, similitud in zip(candidatos.tolist(), similitudes.tolist()):
+            if medidas and self.medidas[doc] and not medidas & self.medidas[doc]:
+                similitud *= PENALIDAD_MEDIDA
+            if similitud >= umbral:
+                resultados.append((min(similitud, 1.0), self.claves[doc], self.nombres[doc]))
+        resultados.sort(key=lambda r: -r[0])
+        return resultados[:limite]
+
+    @staticmethod
+    def _sumar_comunes(candidatos, comunes):
+        """Peso de los rasgos comunes que tiene cada candidato (búsqueda binaria en los postings)."""
+        suma = np.zeros(len(candidatos), dtype=np.float64)
+        for docs, peso in comunes:
+            pos = np.searchsorted(docs, candidatos)
+            presentes = pos < len(docs)
+            presentes[presentes] = docs[pos[presentes]] == candidatos[presentes]
+            suma += peso * presentes
+        return suma
@@ -0,0 +1,231 @@
+"""
+Supervisión de drivers: detecta sesiones muertas o colgadas y las reconstruye.
+
+Los buscar_precio_* atrapan sus propias excepciones y devuelven "Error", así
+que un navegador muerto no se nota desde afuera: cada EAN siguiente falla
+lento, un WebDriverWait a la vez. SupervisorDriver envuelve el driver de un
+hilo de búsqueda:
+
+- cada búsqueda corre con un plazo máximo; si se pasa, el driver está colgado;
+- tras un "Error", o si el driver estuvo inactivo un rato, se hace un ping
+  barato (execute_script("return 1")) con timeout corto;
+- si el driver está muerto o colgado se cierra (o se mata el proceso), se crea
+  uno nuevo con su sesión (login y pedido en NINI) y la búsqueda se reintenta.
+
+Cada supervisor lleva la cuenta de reinicios y del tiempo perdido en ellos.
+Con un TokenCancelacion (ver cancelacion.py), cancelar mata el driver al
+instante y la búsqueda en curso termina con Cancelado en lugar de esperar su plazo.
+"""
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from cancelacion import Cancelado, en_contexto, matar_grupo
+
+PLAZO_PING = 5
+PLAZO_CIERRE = 10
+# Segundos sin uso tras los cuales se verifica el driver antes de buscar
+INACTIVIDAD_PING = 60
+
+ERRORES_SESION = (
+    "tab crashed", "session deleted", "invalid session id", "no such window",
+    "disconnected", "not reachable", "connection refused", "max retries exceeded",
+)
+
+
+class SesionNoIniciada(Exception):
+    """No se pudo crear el driver o preparar su sesión (login, pedido)."""
+
+
+class DriverColgado(Exception):
+    """El driver no respondió dentro del plazo."""
+
+
+def es_error_de_sesion(e):
+    mensaje = str(e).lower()
+    return any(marca in mensaje for marca in ERRORES_SESION)
+
+
+def _es_error(resultado):
+    precio = resultado[0] if isinstance(resultado, tuple) and resultado else resultado
+    return precio == "Error"
+
+
+# Cada cuánto se revisa la cancelación mientras corre una búsqueda
+INTERVALO_CANCELACION = 0.5
+
+
+def cerrar_driver(driver, inmediato=False):
+    """
+    quit() con plazo; si el navegador no responde se mata el proceso de chromedriver.
+    Después se mata su grupo de procesos, por si quedó algún Chrome huérfano.
+
+    Args:
+        inmediato: No esperar al quit(): matar el grupo enseguida (cancelación)
+    """
+    hilo = threading.Thread(target=driver.quit, daemon=True)
+    hilo.start()
+    if not inmediato:
+        hilo.join(PLAZO_CIERRE)
+    grupo = getattr(driver, 'grupo_procesos', None)
+    if grupo is not None:
+        matar_grupo(grupo)
+    elif hilo.is_alive():
+        proceso = getattr(getattr(driver, 'service', None), 'process', None)
+        if proceso is not None:
+            try:
+                proceso.kill()
+            except Exception:
+                pass
+
+
+class SupervisorDriver:
+    """
+    Driver de un hilo de búsqueda con detección de fallas y reconstrucción.
+
+    Args:
+        etiqueta: Prefijo para los logs ('VEA', 'CARREFOUR#2', ...)
+        crear: Callable que devuelve un driver nuevo
+        preparar: Callable preparar(driver) -> bool que deja lista la sesión (opcional)
+        plazo: Segundos máximos por búsqueda
+        reintentos: Reintentos de una búsqueda tras reconstruir el driver
+        cancelacion: TokenCancelacion del escaneo (opcional)
+    """
+
+    def __init__(self, etiqueta, crear, preparar=None, plazo=90, reintentos=1, cancelacion=None):
+        self.etiqueta = etiqueta
+        self.cancelacion = cancelacion
+        self.crear = crear
+        self.preparar = preparar
+        self.plazo = plazo
+        self.reintentos = reintentos
+
+        self.driver = None
+        self.reinicios = 0
+        self.tiempo_perdido = 0.0
+        self._ultimo_uso = 0
+        self._ejecutor = None
+        self._clave_cancelacion = None
+
+    def listo(self):
+        return self.driver is not None
+
+    def iniciar(self):
+        """Crea el driver y prepara la sesión. Lanza SesionNoIniciada si no se puede."""
+        self._verificar_cancelacion()
+        try:
+            driver = self.crear()
+        except Exception as e:
+            raise SesionNoIniciada(f"no se pudo crear el driver: {e}") from e
+        if self.cancelacion is not None:
+            # Cancelar mata el navegador: lo que esté esperando en él falla enseguida
+            self._clave_cancelacion = self.cancelacion.al_cancelar(lambda: cerrar_driver(driver, inmediato=True))
+        try:
+            if self.preparar and not self.preparar(driver):
+                raise SesionNoIniciada("falla en inicialización de la sesión")
+        except Exception:
+            self._soltar_cancelacion()
+            cerrar_driver(driver, inmediato=self._cancelado())
+            raise
+        self.driver = driver
+        self._ultimo_uso = time.time()
+
+    def _cancelado(self):
+        return self.cancelacion is not None and self.cancelacion.cancelado
+
+    def _verificar_cancelacion(self):
+        if self.cancelacion is not None:
+            self.cancelacion.verificar()
+
+    def _soltar_cancelacion(self):
+        if self.cancelacion is not None:
+            self.cancelacion.quitar(self._clave_cancelacion)
+        self._clave_cancelacion = None
+
+    def _con_plazo(self, plazo, funcion, *args):
+        # Un thread propio por supervisor: si queda colgado se abandona junto con el driver
+        if self._ejecutor is None:
+            self._ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"Driver-{self.etiqueta}")
+        futuro = self._ejecutor.submit(en_contexto, self.cancelacion, funcion, *args)
+        limite = time.time() + plazo
+        # Se espera de a tramos para notar la cancelación aunque la búsqueda no la revise
+        while not wait([futuro], timeout=max(0, min(INTERVALO_CANCELACION, limite - time.time()))).done:
+            if self._cancelado() or time.time() >= limite:
+                self._ejecutor.shutdown(wait=False)
+                self._ejecutor = None
+                self._verificar_cancelacion()
+                raise DriverColgado(f"sin respuesta en {plazo:.0f}s")
+        return futuro.result()
+
+    def vivo(self):
+        """Ping barato al navegador."""
+        if self.driver is None or self._cancelado():
+            return False
+        try:
+            return self._con_plazo(PLAZO_PING, self.driver.execute_script, "return 1") == 1
+        except Exception:
+            return False
+
+    def reiniciar(self, motivo):
+        self.reinicios += 1
+        logging.warning(f"[{self.etiqueta}] 🩺 Driver {motivo}. Reiniciando...")
+        viejo, self.driver = self.driver, None
+        self._soltar_cancelacion()
+        if viejo is not None:
+            cerrar_driver(viejo)
+        self.iniciar()
+
+    def ejecutar(self, funcion, *args):
+        """
+        Ejecuta funcion(driver, *args) con plazo. Si el driver murió o se colgó, lo
+        reconstruye y reintenta. Lanza DriverColgado si falla en todos los intentos
+        y Cancelado si el escaneo se canceló (el resultado de ese momento no sirve).
+        """
+        self._verificar_cancelacion()
+        if self.driver is None:
+            self.iniciar()
+        elif time.time() - self._ultimo_uso > INACTIVIDAD_PING and not self.vivo():
+            inicio = time.time()
+            self.reiniciar("sin respuesta tras inactividad")
+            self.tiempo_perdido += time.time() - inicio
+
+        for intento in range(self.reintentos + 1):
+            inicio = time.time()
+            falla = None
+            try:
+                resultado = self._con_plazo(self.plazo, funcion, self.driver, *args)
+                # Con el driver matado por la cancelación la búsqueda termina en "Error"
+                self._verificar_cancelacion()
+                if _es_error(resultado) and not self.vivo():
+                    falla = "muerto"
+            except Cancelado:
+                raise
+            except DriverColgado as e:
+                falla = f"colgado ({e})"
+            except Exception as e:
+                self._verificar_cancelacion()
+                if not es_error_de_sesion(e) and self.vivo():
+                    raise
+                falla = f"muerto ({str(e).splitlines()[0][:80] if str(e) else type(e).__name__})"
+            self._ultimo_uso = time.time()
+            if falla is None:
+                return resultado
+
+            try:
+                self.reiniciar(falla)
+            finally:
+                self.tiempo_perdido += time.time() - inicio
+            if intento < self.reintentos:
+                logging.info(f"[{self.etiqueta}] 🩺 Reintentando con el driver nuevo")
+        raise DriverColgado(f"driver {falla} en {self.reintentos + 1} intentos")
+
+    def cerrar(self):
+        self._soltar_cancelacion()
+        if self.driver is not None:
+            cerrar_driver(self.driver, inmediato=self._cancelado())
+            self.driver = None
+            logging.info(f"[{self.etiqueta}] Navegador cerrado")
+        if self._ejecutor is not None:
+            self._ejecutor.shutdown(wait=False)
+            self._ejecutor = None
@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+import broker as modulo
+from broker import BrokerSQLite, MAX_INTENTOS, RESULTADO_AGOTADO
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def broker(request, tmp_path, monkeypatch):
+    if request.param == "sqlite":
+        return BrokerSQLite(str(tmp_path / "broker.db"))
+    fakeredis = pytest.importorskip("fakeredis")
+    redis = pytest.importorskip("redis")
+    servidor = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, "from_url",
+                        classmethod(lambda cls, url, **kw: fakeredis.FakeRedis(server=servidor, **kw)))
+    return modulo.crear_broker("redis://test")
+
+
+def test_entrega_en_orden_y_completa(broker):
+    broker.publicar("t1", "vea", [(0, "779001"), (1, "779002")])
+    assert broker.pendientes("t1", "vea") == 2
+
+    primera = broker.tomar("w1", ["vea"])
+    segunda = broker.tomar("w2", ["vea"])
+    assert (primera['idx'], primera['sku'], primera['intentos']) == (0, "779001", 1)
+    assert segunda['idx'] == 1
+    assert broker.tomar("w3", ["vea"]) is None
+
+    assert broker.completar(primera['id'], "w1", {'precio': '$ 1,00'})
+    assert not broker.completar(segunda['id'], "otro", {'precio': '$ 2,00'})
+    resultados, _ = broker.resultados("t1", "vea")
+    assert resultados == [(0, "779001", {'precio': '$ 1,00'})]
+
+
+def test_lease_vencido_se_reentrega(broker):
+    broker.publicar("t1", "disco", [(0, "7")])
+    perdida = broker.tomar("muerto", ["disco"], visibilidad=0.05)
+    time.sleep(0.1)
+
+    reentregada = broker.tomar("vivo", ["disco"])
+    assert reentregada['id'] == perdida['id']
+    assert reentregada['intentos'] == 2
+    # El worker que perdió el lease ya no puede completarla
+    assert not broker.completar(perdida['id'], "muerto", {'precio': 'viejo'})
+    assert broker.completar(reentregada['id'], "vivo", {'precio': 'nuevo'})
+    assert broker.resultados("t1", "disco")[0] == [(0, "7", {'precio': 'nuevo'})]
+
+
+def test_latido_extiende_el_lease(broker):
+    broker.publicar("t1", "vea", [(0, "7")])
+    tarea = broker.tomar("w1", ["vea"], visibilidad=0.1)
+    time.sleep(0.05)
+    assert broker.latido(tarea['id'], "w1", visibilidad=10)
+    time.sleep(0.1)
+    assert broker.tomar("w2", ["vea"]) is None
+    assert not broker.latido(tarea['id'], "w2")
+
+
+def test_agotar_intentos_marca_error(broker):
+    broker.publicar("t1", "nini", [(3, "8")])
+    for _ in range(MAX_INTENTOS):
+        assert broker.tomar("w", ["nini"], visibilidad=0.01) is not None
+        time.sleep(0.03)
+    assert broker.tomar("w", ["nini"]) is None
+    assert broker.resultados("t1", "nini")[0] == [(3, "8", RESULTADO_AGOTADO)]
+    assert broker.pendientes("t1", "nini") == 0
+
+
+def test_liberar_no_cuenta_como_intento(broker):
+    broker.publicar("t1", "vea", [(0, "7")])
+    tarea = broker.tomar("w1", ["vea"])
+    broker.liberar(tarea['id'], "w1")
+    otra = broker.tomar("w2", ["vea"])
+    assert otra['id'] == tarea['id']
+    assert otra['intentos'] == 1
+
+
+def test_pausa_retiene_las_tareas(broker):
+    broker.publicar("t1", "vea", [(0, "7")])
+    broker.pausar("t1")
+    assert broker.tomar("w", ["vea"]) is None
+    broker.pausar("t1", False)
+    assert broker.tomar("w", ["vea"])['sku'] == "7"
+
+
+def test_cursor_de_resultados(broker):
+    broker.publicar("t1", "vea", [(i, str(i)) for i in range(3)])
+    cursor = 0
+    vistos = []
+    for _ in range(3):
+        tarea = broker.tomar("w", ["vea"])
+        broker.completar(tarea['id'], "w", {'precio': tarea['sku']})
+        nuevos, cursor = broker.resultados("t1", "vea", cursor)
+        vistos.extend(idx for idx, _, _ in nuevos)
+    assert vistos == [0, 1, 2]
+    assert broker.resultados("t1", "vea", cursor) == ([], cursor)
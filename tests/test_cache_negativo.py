@@ -0,0 +1,83 @@
+import time
+from array import array
+
+import pytest
+
+import cache_negativo as modulo
+from cache_negativo import CacheNegativo, clave_ean
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    ahora = [1_760_000_000.0]
+    monkeypatch.setattr(modulo.time, "time", lambda: ahora[0])
+    return ahora
+
+
+def test_registrar_y_persistir(tmp_path, reloj):
+    cache = CacheNegativo("vea", str(tmp_path))
+    cache.registrar("7790001")
+    assert cache.contiene("7790001")
+    assert not cache.contiene("7790002")
+    cache.guardar()
+
+    releido = CacheNegativo("vea", str(tmp_path))
+    assert releido.contiene("7790001")
+    assert releido.omitidos == 1
+
+
+def test_vence_al_pasar_el_intervalo(tmp_path, reloj):
+    cache = CacheNegativo("vea", str(tmp_path), dias_reverificacion=7)
+    cache.registrar("7790001")
+    cache.guardar()
+    reloj[0] += 7 * 86400 - 1
+    assert cache.contiene("7790001")
+    reloj[0] += 1
+    assert not cache.contiene("7790001")
+    # Al guardar, las entradas vencidas se descartan
+    cache.guardar()
+    assert len(CacheNegativo("vea", str(tmp_path))) == 0
+
+
+def test_descartar_lo_encontrado(tmp_path, reloj):
+    cache = CacheNegativo("vea", str(tmp_path))
+    cache.registrar("1")
+    cache.registrar("2")
+    cache.guardar()
+    cache.descartar("1")
+    assert not cache.contiene("1")
+    cache.guardar()
+    assert not CacheNegativo("vea", str(tmp_path)).contiene("1")
+    assert CacheNegativo("vea", str(tmp_path)).contiene("2")
+
+
+def test_ceros_a_la_izquierda_no_colisionan(tmp_path, reloj):
+    assert clave_ean("0123") != clave_ean("123")
+    cache = CacheNegativo("vea", str(tmp_path))
+    cache.registrar("0123")
+    cache.guardar()
+    releido = CacheNegativo("vea", str(tmp_path))
+    assert releido.contiene("0123")
+    assert not releido.contiene("123")
+
+
+def test_ean_no_numerico_se_ignora(tmp_path, reloj):
+    cache = CacheNegativo("vea", str(tmp_path))
+    cache.registrar("ABC-1")
+    cache.registrar("1" * 30)
+    assert not cache.contiene("ABC-1")
+    assert len(cache) == 0
+
+
+def test_migra_el_formato_anterior(tmp_path, reloj):
+    with open(tmp_path / "negativos_disco.bin", "wb") as f:
+        f.write(modulo.MAGIC_V1)
+        f.write((2).to_bytes(4, 'little'))
+        array('Q', [123, 7790000000001]).tofile(f)
+        array('I', [int(reloj[0])] * 2).tofile(f)
+    cache = CacheNegativo("disco", str(tmp_path))
+    assert cache.contiene("123")
+    assert cache.contiene("7790000000001")
+    cache.guardar()
+    with open(tmp_path / "negativos_disco.bin", "rb") as f:
+        assert f.read(4) == modulo.MAGIC
@@ -0,0 +1,86 @@
+import pytest
+
+import circuito as modulo
+from circuito import Circuito, CERRADO, ABIERTO, SEMIABIERTO, AGOTADO, PASAR, ESPERAR, DESCARTAR
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1_000_000.0
+
+    def time(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(modulo.time, "time", reloj.time)
+    return reloj
+
+
+def test_abre_al_llegar_al_umbral(reloj):
+    cambios = []
+    c = Circuito("vea", umbral=3, espera=60, al_cambiar=cambios.append)
+    c.falla("error")
+    c.falla("error")
+    assert c.estado == CERRADO and c.permitir() == PASAR
+    c.falla("error")
+    assert c.estado == ABIERTO
+    assert c.permitir() == ESPERAR
+    assert c.aperturas == 1
+    assert [i['estado'] for i in cambios] == [ABIERTO]
+
+
+def test_un_exito_reinicia_las_fallas(reloj):
+    c = Circuito("vea", umbral=2)
+    c.falla("error")
+    c.exito()
+    c.falla("error")
+    assert c.estado == CERRADO
+
+
+def test_prueba_semiabierta_y_cierre(reloj):
+    c = Circuito("vea", umbral=1, espera=60)
+    c.falla("error")
+    reloj.ahora += 59
+    assert c.permitir() == ESPERAR
+    reloj.ahora += 1
+    assert c.permitir() == PASAR
+    assert c.estado == SEMIABIERTO
+    # Una sola búsqueda de prueba a la vez
+    assert c.permitir() == ESPERAR
+    c.exito()
+    assert c.estado == CERRADO and c.permitir() == PASAR
+
+
+def test_prueba_fallida_duplica_la_espera_con_tope(reloj):
+    c = Circuito("vea", umbral=1, espera=10, espera_maxima=35, max_sondeos=None)
+    c.falla("error")
+    esperas = []
+    for _ in range(3):
+        reloj.ahora = c.reintento
+        assert c.permitir() == PASAR
+        c.falla("sigue caído")
+        esperas.append(c.reintento - reloj.ahora)
+    assert esperas == [20, 35, 35]
+
+
+def test_agotado_tras_max_sondeos(reloj):
+    c = Circuito("vea", umbral=1, espera=10, max_sondeos=2)
+    c.falla("error")
+    for _ in range(2):
+        reloj.ahora = c.reintento
+        assert c.permitir() == PASAR
+        c.falla("error")
+    assert c.estado == AGOTADO
+    assert c.permitir() == DESCARTAR
+
+
+def test_disponible_no_consume_la_prueba(reloj):
+    c = Circuito("vea", umbral=1, espera=10)
+    c.falla("error")
+    assert not c.disponible()
+    reloj.ahora += 10
+    assert c.disponible()
+    assert c.estado == ABIERTO
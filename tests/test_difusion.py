@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+from difusion import Difusor, MAX_PENDIENTES, serializar_producto, STOP_SIGNAL, RESYNC_PRODUCTOS
+
+
+def _difusor(max_historial=5000):
+    return Difusor(serializar_producto, max_historial=max_historial, resincronizar=RESYNC_PRODUCTOS)
+
+
+def _todos(suscripcion):
+    eventos = []
+    while True:
+        evento = suscripcion.siguiente(0)
+        if evento is None:
+            return eventos
+        eventos.append(evento)
+
+
+def test_reenvio_mayor_que_el_cupo_no_desconecta():
+    difusor = _difusor()
+    for i in range(MAX_PENDIENTES + 500):
+        difusor.publicar({'i': i})
+    suscripcion = difusor.suscribir(0)
+    assert not suscripcion.desconectado
+    eventos = _todos(suscripcion)
+    assert len(eventos) == MAX_PENDIENTES + 500
+    assert eventos[0][0] == 1
+
+
+def test_reenvio_desde_el_ultimo_id():
+    difusor = _difusor()
+    for i in range(10):
+        difusor.publicar({'i': i})
+    eventos = _todos(difusor.suscribir(7))
+    assert [id_evento for id_evento, _, _ in eventos] == [8, 9, 10]
+
+
+def test_resincroniza_si_faltan_eventos_del_historial():
+    difusor = _difusor(max_historial=5)
+    for i in range(8):
+        difusor.publicar({'i': i})
+    eventos = _todos(difusor.suscribir(1))
+    assert eventos[0] == (None, RESYNC_PRODUCTOS, False)
+    assert [id_evento for id_evento, _, _ in eventos[1:]] == [4, 5, 6, 7, 8]
+    # Si no falta nada, no hay resincronización
+    assert _todos(difusor.suscribir(5))[0][0] == 6
+
+
+def test_resincroniza_tras_un_escaneo_nuevo():
+    difusor = _difusor()
+    difusor.publicar({'i': 0})
+    difusor.reiniciar()
+    difusor.publicar({'i': 1})
+    eventos = _todos(difusor.suscribir(1))
+    assert eventos[0][1] == RESYNC_PRODUCTOS
+    assert json.loads(eventos[1][1]) == {'i': 1}
+
+
+def test_suscriptor_lento_se_desconecta():
+    difusor = _difusor()
+    suscripcion = difusor.suscribir(0)
+    for i in range(MAX_PENDIENTES + 1):
+        difusor.publicar({'i': i})
+    assert suscripcion.desconectado
+
+
+def test_transmitir_hasta_el_fin():
+    difusor = _difusor()
+    difusor.publicar({'type': 'init'})
+    difusor.publicar(STOP_SIGNAL)
+    textos = list(difusor.transmitir(0))
+    assert textos[0] == 'id: 1\ndata: {"type": "init"}\n\n'
+    assert textos[-1] == 'id: 2\ndata: {"type": "stop"}\n\n'
+    assert difusor.conectados == 0
+
+
+def test_suscriptor_async():
+    difusor = _difusor()
+    for i in range(MAX_PENDIENTES + 10):
+        difusor.publicar({'i': i})
+
+    async def recibir():
+        suscripcion = difusor.suscribir(0, asyncio.get_running_loop())
+        assert not suscripcion.desconectado
+        difusor.publicar(STOP_SIGNAL)
+        recibidos = 0
+        while True:
+            _, _, final = await asyncio.wait_for(suscripcion.cola.get(), 1)
+            recibidos += 1
+            if final:
+                difusor.desuscribir(suscripcion)
+                return recibidos
+
+    assert asyncio.run(recibir()) == MAX_PENDIENTES + 11
@@ -0,0 +1,85 @@
+from datetime import date, datetime
+
+import numpy as np
+
+from historial import (
+    HistorialPrecios, EscrituraHistorial, PRECIO_NO_ENCONTRADO, codificar_precio, _Diccionario
+)
+
+TS = int(datetime(2026, 10, 19, 12, 0).timestamp())
+
+
+def test_ida_y_vuelta(tmp_path):
+    historial = HistorialPrecios(str(tmp_path))
+    historial.agregar("vea", [("779001", 12345, "2x1"), ("779002", PRECIO_NO_ENCONTRADO, "")], ts=TS)
+    historial.agregar("vea", [("779001", 9900, "")], ts=TS + 60)
+
+    filas = historial.historial_ean("779001")
+    assert [(f['ts'], f['precio_centavos'], f['oferta']) for f in filas] == [(TS, 12345, "2x1"), (TS + 60, 9900, "")]
+    assert historial.historial_ean("779002")[0]['estado'] == "No encontrado"
+    assert historial.historial_ean("no-existe") == []
+
+    otra_instancia = HistorialPrecios(str(tmp_path))
+    assert otra_instancia.ultimas_observaciones("vea") == {
+        "779001": (TS + 60, 9900, ""),
+        "779002": (TS, PRECIO_NO_ENCONTRADO, ""),
+    }
+
+
+def test_cambios_desde(tmp_path):
+    historial = HistorialPrecios(str(tmp_path))
+    ayer = TS - 86400
+    historial.agregar("disco", [("1", 100, ""), ("2", 200, "")], ts=ayer)
+    historial.agregar("disco", [("1", 150, ""), ("2", 200, "")], ts=TS)
+
+    cambios = historial.cambios_desde(date.fromtimestamp(TS))
+    assert [(c['ean'], c['precio_centavos'], c['anterior']['precio_centavos']) for c in cambios] == [("1", 150, 100)]
+
+
+def test_escaneo_que_cruza_la_medianoche(tmp_path):
+    historial = HistorialPrecios(str(tmp_path))
+    medianoche = int(datetime(2026, 10, 20).timestamp())
+    escritura = EscrituraHistorial(historial)
+    escritura.agregar("vea", [("1", 100, "")], ts=medianoche - 10)
+    escritura.agregar("vea", [("2", 200, "")], ts=medianoche + 10)
+    # Nada se escribe hasta cerrar
+    assert historial.ultimas_observaciones("vea") == {}
+    escritura.cerrar()
+
+    fechas = [fecha for fecha, _ in historial.iterar_particiones("vea")]
+    assert fechas == ["2026-10-19", "2026-10-20"]
+    assert set(historial.ultimas_observaciones("vea")) == {"1", "2"}
+
+
+def test_particiones_ordenadas_por_ean_y_momento(tmp_path):
+    historial = HistorialPrecios(str(tmp_path))
+    historial.agregar("vea", [("b", 2, ""), ("a", 1, "")], ts=TS + 5)
+    historial.agregar("vea", [("a", 3, "")], ts=TS)
+    _, cols = next(historial.iterar_particiones("vea"))
+    claves = list(zip(cols['ean'].tolist(), cols['ts'].tolist()))
+    assert claves == sorted(claves)
+
+
+def test_diccionario_compartido_entre_instancias(tmp_path):
+    ruta = str(tmp_path / "ofertas.txt")
+    a = _Diccionario(ruta, con_vacio=True)
+    b = _Diccionario(ruta, con_vacio=True)
+    ids_a = a.obtener_ids(["2x1", "linea\nrota"])
+    ids_b = b.obtener_ids(["3x2", "2x1"])
+    assert ids_b[1] == ids_a[0]
+    a.refrescar()
+    assert a.valores == b.valores
+
+
+def test_diccionario_con_separadores_unicode(tmp_path):
+    ruta = str(tmp_path / "ofertas.txt")
+    textos = ["a\x0bb", "c\x1cd", "e f", "g\x85h", "siguiente"]
+    ids = _Diccionario(ruta).obtener_ids(textos)
+    releido = _Diccionario(ruta)
+    assert [releido.ids[t] for t in textos] == ids
+
+
+def test_codificar_precio():
+    assert codificar_precio(1234.0, "$ 12,34") == 1234
+    assert codificar_precio(np.nan, "No encontrado") == PRECIO_NO_ENCONTRADO
+    assert codificar_precio(None, "Pendiente") is None
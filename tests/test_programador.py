@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import pytest
+
+from historial import HistorialPrecios, PRECIO_ERROR
+from programador import ExpresionCron, calcular_pendientes
+
+
+def test_campos_de_la_expresion():
+    cron = ExpresionCron("*/15 3,4 1-10/3 * 1-5")
+    minutos, horas, dias, meses, semana = cron.valores
+    assert minutos == {0, 15, 30, 45}
+    assert horas == {3, 4}
+    assert dias == {1, 4, 7, 10}
+    assert meses == set(range(1, 13))
+    assert semana == {1, 2, 3, 4, 5}
+
+
+def test_paso_desde_un_valor_llega_al_maximo():
+    assert ExpresionCron("50/5 * * * *").valores[0] == {50, 55}
+
+
+def test_coincide():
+    cron = ExpresionCron("0 3 * * *")
+    assert cron.coincide(datetime(2026, 10, 19, 3, 0))
+    assert not cron.coincide(datetime(2026, 10, 19, 3, 1))
+    assert not cron.coincide(datetime(2026, 10, 19, 4, 0))
+
+
+def test_siete_es_domingo():
+    cron = ExpresionCron("0 0 * * 7")
+    assert cron.coincide(datetime(2026, 10, 18))  # domingo
+    assert not cron.coincide(datetime(2026, 10, 19))
+
+
+def test_dia_del_mes_o_de_la_semana():
+    # Como en cron: con ambos campos restringidos alcanza con uno
+    cron = ExpresionCron("0 0 1 * 1")
+    assert cron.coincide(datetime(2026, 10, 1))   # jueves 1
+    assert cron.coincide(datetime(2026, 10, 19))  # lunes
+    assert not cron.coincide(datetime(2026, 10, 20))
+
+
+@pytest.mark.parametrize("texto", ["* * * *", "60 * * * *", "* 24 * * *", "5-1 * * * *", "*/0 * * * *", "a * * * *"])
+def test_expresiones_invalidas(texto):
+    with pytest.raises(ValueError):
+        ExpresionCron(texto)
+
+
+def test_calcular_pendientes(tmp_path):
+    historial = HistorialPrecios(str(tmp_path))
+    ahora = 1_760_000_000
+    historial.agregar("vea", [("1", 100, ""), ("2", PRECIO_ERROR, "")], ts=ahora - 3600)
+    historial.agregar("vea", [("3", 100, "")], ts=ahora - 3 * 86400)
+
+    pendientes = calcular_pendientes(["1", "2", "3", "4"], ["vea", "disco"], historial, 24, ahora=ahora)
+    # 1 es reciente; 2 terminó en Error, 3 es viejo y 4 nunca se observó
+    assert pendientes["vea"] == {"2", "3", "4"}
+    assert pendientes["disco"] == {"1", "2", "3", "4"}
@@ -0,0 +1,154 @@
+"""
+Worker de scraping distribuido: toma tareas (sitio, EAN) del broker y escribe los resultados.
+
+    BROKER_URL=sqlite:////app/data/broker.db python trabajador.py
+    BROKER_URL=redis://redis:6379/0 python trabajador.py --sitios carrefour,vea,disco --hilos 2
+
+Cada hilo mantiene un navegador supervisado por sitio (con la sesión de NINI
+ya abierta, ver supervisor.py) y lo reutiliza entre tareas. Se pueden correr tantos procesos o contenedores como
+haga falta; el coordinador (run_scraper en la app) no necesita saber cuántos hay.
+"""
+import os
+import signal
+import socket
+import logging
+import argparse
+import threading
+
+from broker import crear_broker, Latido, VISIBILIDAD
+from circuito import Circuito, detectar_bloqueo, PASAR
+from supervisor import SupervisorDriver, SesionNoIniciada
+from instantaneas import ArchivoInstantaneas, archivar
+from enlaces import IndiceEnlaces, capturar_enlace
+from configuracion import configurar_logging
+from comparador_completo import (
+    BUSCADORES, BROKER_URL, CIRCUITO_FALLAS, CIRCUITO_ESPERA, PLAZO_BUSQUEDA,
+    ARCHIVAR_INSTANTANEAS, INSTANTANEAS_DIR, FRAGMENTO_SITIO, USAR_ENLACES, ENLACES_DB, TIENDAS_VTEX,
+    iniciar_navegador, preparar_sesion, normalizar_resultado
+)
+
+# Espera entre consultas al broker cuando no hay tareas
+ESPERA_SIN_TAREAS = 2
+# Espera tras no poder abrir un navegador, antes de volver a tomar tareas
+ESPERA_TRAS_FALLA = 30
+
+
+def trabajar(broker, nombre, sitios, detener, visibilidad=VISIBILIDAD, circuitos=None, instantaneas=None,
+             enlaces=None):
+    """
+    Loop de un hilo: tomar tarea, buscar con el navegador del sitio, completar.
+
+    Con un sitio con el circuito abierto (ver circuito.py) se toman sólo tareas
+    de los demás; sus tareas quedan en la cola para otros workers o para después.
+    Con instantaneas (ArchivoInstantaneas) cada búsqueda se archiva bajo el
+    escaneo de la tarea; el directorio tiene que ser compartido con la app.
+    Con enlaces (IndiceEnlaces) se aprende el enlace de cada producto encontrado.
+    """
+    supervisores = {}
+    if circuitos is None:
+        circuitos = {s: Circuito(s, CIRCUITO_FALLAS, CIRCUITO_ESPERA, max_sondeos=None) for s in sitios}
+    try:
+        while not detener.is_set():
+            broker.latido_trabajador(nombre)
+            activos = [s for s in sitios if circuitos[s].disponible()]
+            tarea = broker.tomar(nombre, activos, visibilidad) if activos else None
+            if tarea is None:
+                detener.wait(ESPERA_SIN_TAREAS)
+                continue
+
+            site = tarea['site']
+            circuito = circuitos[site]
+            if circuito.permitir() != PASAR:
+                broker.liberar(tarea['id'], nombre)
+                continue
+
+            etiqueta = f"{site.upper()}@{nombre}"
+            if site not in supervisores:
+                supervisores[site] = SupervisorDriver(
+                    etiqueta,
+                    crear=lambda etiqueta=etiqueta: iniciar_navegador(etiqueta),
+                    preparar=lambda driver, site=site: preparar_sesion(driver, site),
+                    plazo=PLAZO_BUSQUEDA
+                )
+            supervisor = supervisores[site]
+            if not supervisor.listo():
+                try:
+                    supervisor.iniciar()
+                except SesionNoIniciada as e:
+                    logging.error(f"[{etiqueta}] ❌ No se pudo preparar el navegador: {e}")
+                    broker.liberar(tarea['id'], nombre)
+                    circuito.falla("sesión no iniciada")
+                    detener.wait(ESPERA_TRAS_FALLA)
+                    continue
+
+            try:
+                with Latido(broker, tarea['id'], nombre, visibilidad):
+                    precio, oferta, dinamica = normalizar_resultado(supervisor.ejecutar(BUSCADORES[site], tarea['sku']))
+                bloqueo = detectar_bloqueo(supervisor.driver) if precio in ("No encontrado", "Error") else None
+                if bloqueo:
+                    logging.warning(f"[{etiqueta}] 🚫 {tarea['sku']}: {bloqueo}")
+                    precio, oferta, dinamica = 'Error', '', ''
+                else:
+                    if enlaces is not None and site in TIENDAS_VTEX and precio not in ('No encontrado', 'Error'):
+                        enlaces.aprender(site, tarea['sku'], capturar_enlace(supervisor.driver))
+                    if instantaneas is not None and site in FRAGMENTO_SITIO:
+                        archivar(instantaneas, supervisor.driver, tarea['trabajo'], site, tarea['sku'], tarea['idx'],
+                                 FRAGMENTO_SITIO[site], (precio, oferta, dinamica))
+                if precio == 'Error':
+                    circuito.falla(bloqueo or "error en la búsqueda")
+                else:
+                    circuito.exito()
+            except Exception as e:
+                logging.error(f"[{etiqueta}] Error procesando {tarea['sku']}: {e}")
+                precio, oferta, dinamica = 'Error', '', ''
+                circuito.falla(type(e).__name__)
+
+            if not broker.completar(tarea['id'], nombre, {'precio': precio, 'oferta': oferta, 'dinamica': dinamica}):
+                logging.warning(f"[{etiqueta}] Resultado de {tarea['sku']} descartado: el lease había vencido")
+    finally:
+        for site, supervisor in supervisores.items():
+            if supervisor.reinicios:
+                logging.info(f"[{site.upper()}@{nombre}] 🩺 {supervisor.reinicios} reinicios de driver "
+                             f"({supervisor.tiempo_perdido:.0f}s perdidos)")
+            supervisor.cerrar()
+
+
+def main():
+    configurar_logging()
+    parser = argparse.ArgumentParser(description="Worker de scraping distribuido")
+    parser.add_argument("--broker", default=BROKER_URL, help="URL del broker (por defecto BROKER_URL)")
+    parser.add_argument("--sitios", default="", help="Sitios a atender, separados por coma (por defecto todos)")
+    parser.add_argument("--hilos", type=int, default=1, help="Búsquedas simultáneas en este proceso")
+    parser.add_argument("--nombre", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--visibilidad", type=int, default=VISIBILIDAD, help="Segundos de reserva de cada tarea")
+    args = parser.parse_args()
+
+    if not args.broker:
+        parser.error("Falta la URL del broker (--broker o BROKER_URL)")
+
+    broker = crear_broker(args.broker)
+    sitios = [s.strip() for s in args.sitios.split(",") if s.strip()] or list(BUSCADORES)
+    detener = threading.Event()
+    # Un circuito por sitio compartido por todos los hilos del proceso
+    circuitos = {s: Circuito(s, CIRCUITO_FALLAS, CIRCUITO_ESPERA, max_sondeos=None) for s in sitios}
+    instantaneas = ArchivoInstantaneas(INSTANTANEAS_DIR) if ARCHIVAR_INSTANTANEAS else None
+    enlaces = IndiceEnlaces(ENLACES_DB) if USAR_ENLACES else None
+    signal.signal(signal.SIGTERM, lambda *_: detener.set())
+    signal.signal(signal.SIGINT, lambda *_: detener.set())
+
+    logging.info(f"📮 Worker {args.nombre} atendiendo {sitios} con {args.hilos} hilo(s)")
+    hilos = [
+        threading.Thread(target=trabajar, name=f"Trabajador-{n + 1}",
+                         args=(broker, f"{args.nombre}/{n + 1}", sitios, detener, args.visibilidad, circuitos, instantaneas, enlaces))
+        for n in range(max(1, args.hilos))
+    ]
+    for hilo in hilos:
+        hilo.start()
+    while any(h.is_alive() for h in hilos):
+        for hilo in hilos:
+            hilo.join(timeout=1)
+    logging.info(f"📮 Worker {args.nombre} detenido")
+
+
+if __name__ == "__main__":
+    main()